@@ -0,0 +1,230 @@
+"""Benchmarks of message codec, scope matching, send scheduling & end-to-end discovery.
+
+Results are written as JSON lines, one record per measurement, for comparing
+releases. Run with the package installed (``pip install -e .``)::
+
+    $ python benchmarks/bench.py --output bench_output.txt
+    $ python benchmarks/bench.py --suite matching --max-services 10000
+"""
+
+import argparse
+import json
+import platform
+import socket
+import sys
+import time
+import timeit
+import uuid
+
+from wsdiscovery.actions import *
+from wsdiscovery.message import createSOAPMessage, parseSOAPMessage
+from wsdiscovery.metrics import DaemonMetrics
+from wsdiscovery.tracing import Tracer
+from wsdiscovery.qname import QName
+from wsdiscovery.registry import ServiceRegistry
+from wsdiscovery.scope import Scope, MATCH_BY_URI
+from wsdiscovery.service import Service
+from wsdiscovery.threaded import NetworkingThreadIPv4
+from wsdiscovery.util import filterServices, matchScope
+
+SUITES = ("codec", "matching", "scheduler", "e2e")
+
+TYPES = [QName("http://example.com/devices", name) for name in ("Camera", "Printer", "Sensor", "Gateway")]
+
+
+def measure(func, repeat=5):
+    "best seconds per call of func over several timed runs"
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def makeServices(count):
+    "services with one of a few types, scoped by site & floor"
+    return [Service([TYPES[i % len(TYPES)]],
+                    [Scope("onvif://www.onvif.org/location/site%i/floor%i" % (i // 100, i % 10)),
+                     Scope("onvif://www.onvif.org/name/device%i" % i)],
+                    ["http://192.0.2.%i:%i/" % (i % 250 + 1, 8000 + i % 1000)],
+                    uuid.UUID(int=i).urn, 0)
+            for i in range(count)]
+
+
+def serviceCounts(maxServices):
+    count = 100
+    while count <= maxServices:
+        yield count
+        count *= 10
+
+
+def benchCodec(args):
+    service = makeServices(1)[0]
+    envelopes = {
+        "Probe": constructProbe([TYPES[0]], [Scope("onvif://www.onvif.org/location/site1")]),
+        "ProbeMatch": constructProbeMatch(makeServices(5), uuid.uuid4().urn),
+        "Resolve": constructResolve(service.getEPR()),
+        "ResolveMatch": constructResolveMatch(service, uuid.uuid4().urn),
+        "Hello": constructHello(service),
+        "Bye": constructBye(service),
+    }
+    for action, env in envelopes.items():
+        text = createSOAPMessage(env)
+        data = text.encode("UTF-8")
+        yield {"benchmark": "createSOAPMessage", "action": action,
+               "seconds": measure(lambda: createSOAPMessage(env)), "bytes": len(data)}
+        yield {"benchmark": "parseSOAPMessage", "action": action,
+               "seconds": measure(lambda: parseSOAPMessage(data, "192.0.2.7")), "bytes": len(data)}
+        # the body is decoded on first access
+        yield {"benchmark": "parseSOAPMessage.body", "action": action,
+               "seconds": measure(lambda: parseSOAPMessage(data, "192.0.2.7").getProbeResolveMatches()),
+               "bytes": len(data)}
+
+
+def benchMatching(args):
+    types = [TYPES[0]]
+    scopes = [Scope("onvif://www.onvif.org/location/site0")]
+    yield {"benchmark": "matchScope",
+           "seconds": measure(lambda: matchScope("onvif://www.onvif.org/location/site1",
+                                                 "onvif://www.onvif.org/location/site1/floor2",
+                                                 MATCH_BY_URI))}
+
+    for count in serviceCounts(args.max_services):
+        services = makeServices(count)
+        registry = ServiceRegistry()
+        for service in services:
+            registry.add(service)
+        matched = len(filterServices(services, types, scopes))
+        yield {"benchmark": "filterServices", "services": count, "matched": matched,
+               "seconds": measure(lambda: filterServices(services, types, scopes), repeat=3)}
+        yield {"benchmark": "ServiceRegistry.filter", "services": count, "matched": matched,
+               "seconds": measure(lambda: registry.filter(types, scopes))}
+
+
+class _CountingNetworkingThread(NetworkingThreadIPv4):
+    "networking thread that counts messages due for sending instead of sending them"
+
+    def __init__(self, observer):
+        super().__init__(observer)
+        self.sent = 0
+
+    def _sendMsg(self, msg):
+        self.sent += 1
+
+
+class _Observer:
+    "the daemon attributes a networking thread uses"
+    _capture = None
+    _relates_to = False
+    _dedup_capacity = 100000
+    _dedup_window = 600
+    _parsePool = None
+    ttl = 1
+
+    def __init__(self):
+        self._metrics = DaemonMetrics()
+        self._tracer = Tracer()
+
+
+def benchScheduler(args):
+    env = constructProbe(None, None)
+    batch = 1000
+    for queued in (1000, 10000, 100000):
+        thread = _CountingNetworkingThread(_Observer())
+        try:
+            for i in range(queued):
+                # pending retransmissions, due long after the measurement
+                thread.addMulticastMessage(env, "239.255.255.250", 3702, initialDelay=60000)
+
+            start = time.perf_counter()
+            for i in range(batch):
+                thread.addUnicastMessage(env, "192.0.2.7", 3702, unicast_num=1)
+            enqueued = time.perf_counter()
+
+            time.sleep(0.002)  # let the batch fall due
+            drainStart = time.perf_counter()
+            thread._sendPendingMessages()
+            drained = time.perf_counter()
+            timeout = measure(thread._getSelectTimeout)
+        finally:
+            thread._selector.close()
+            thread._wakeupReader.close()
+            thread._wakeupWriter.close()
+
+        assert thread.sent == batch
+        yield {"benchmark": "scheduler.enqueue", "queued": queued,
+               "seconds": (enqueued - start) / batch}
+        yield {"benchmark": "scheduler.send_due", "queued": queued,
+               "seconds": (drained - drainStart) / batch}
+        yield {"benchmark": "scheduler.select_timeout", "queued": queued, "seconds": timeout}
+
+
+def benchEndToEnd(args):
+    from wsdiscovery.discovery import ThreadedWSDiscovery
+    from wsdiscovery.publishing import ThreadedWSPublishing
+
+    ttype = QName("http://example.com/bench", "Device%s" % uuid.uuid4().hex)
+    for count in (1, 100):
+        wsp = ThreadedWSPublishing()
+        wsp.start()
+        wsp.publishServices([([ttype], [], ["http://127.0.0.1:%i/" % (8000 + i)], uuid.uuid4().urn)
+                             for i in range(count)])
+        wsd = ThreadedWSDiscovery()
+        wsd.start()
+        try:
+            for run in range(args.e2e_runs):
+                wsd.clearRemoteServices()
+                first = None
+                found = 0
+                start = time.perf_counter()
+                for service in wsd.iterServices(types=[ttype], timeout=10, max_results=count):
+                    found += 1
+                    if first is None:
+                        first = time.perf_counter() - start
+                yield {"benchmark": "e2e.loopback", "services": count, "run": run, "found": found,
+                       "first_result_seconds": first,
+                       "all_results_seconds": time.perf_counter() - start}
+        finally:
+            wsd.stop()
+            wsp.stop()
+
+
+BENCHMARKS = {
+    "codec": benchCodec,
+    "matching": benchMatching,
+    "scheduler": benchScheduler,
+    "e2e": benchEndToEnd,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", "-o", default="bench_output.txt",
+                        help="file to write JSON lines to, - for stdout (default: %(default)s)")
+    parser.add_argument("--suite", "-s", action="append", choices=SUITES,
+                        help="benchmark suite to run, may be repeated (default: all)")
+    parser.add_argument("--max-services", type=int, default=100000,
+                        help="largest number of services to match (default: %(default)s)")
+    parser.add_argument("--e2e-runs", type=int, default=3,
+                        help="number of end-to-end discovery runs (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        out.write(json.dumps({"benchmark": "environment", "time": time.time(),
+                              "python": platform.python_version(),
+                              "implementation": platform.python_implementation(),
+                              "platform": platform.platform(),
+                              "hostname": socket.gethostname()}) + "\n")
+        for suite in args.suite or SUITES:
+            for result in BENCHMARKS[suite](args):
+                result["suite"] = suite
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+                if out is not sys.stdout:
+                    print(json.dumps(result))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
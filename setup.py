@@ -48,7 +48,9 @@ setup(name='WSDiscovery',
       entry_points = {
          'console_scripts': [
             'wsdiscover=wsdiscovery.cmdline:discover',
-            'wspublish=wsdiscovery.cmdline:publish'
+            'wspublish=wsdiscovery.cmdline:publish',
+            'wscapture=wsdiscovery.cmdline:showcapture',
+            'wsreplay=wsdiscovery.cmdline:replay'
         ],
       }
      )
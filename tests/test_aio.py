@@ -0,0 +1,51 @@
+import asyncio
+import socket
+import time
+from .fixtures import probe_response
+from wsdiscovery.discovery import AsyncWSDiscovery
+from wsdiscovery.networking import MULTICAST_PORT
+
+
+def test_async_probing(probe_response):
+    "deliver a canned Probe response to the asyncio multicast endpoint"
+
+    async def search():
+        wsd = AsyncWSDiscovery()
+        await wsd.start()
+
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.sendto(probe_response[0], ("127.0.0.1", MULTICAST_PORT))
+
+        found = await wsd.searchServices(timeout=0.5)
+        await wsd.stop()
+        return found
+
+    found = asyncio.run(search())
+
+    assert len(found) == 1
+    assert probe_response[1] in found[0].getXAddrs()[0]
+    assert len(found[0].getScopes()) == 4
+
+
+def test_async_iter_services(probe_response):
+    "services are yielded as they respond, without waiting for the timeout"
+
+    async def search():
+        wsd = AsyncWSDiscovery()
+        await wsd.start()
+        try:
+            started = time.monotonic()
+            asyncio.get_running_loop().call_later(0.2, respond)
+            found = [service async for service in wsd.iterServices(timeout=10, max_results=1)]
+            return found, time.monotonic() - started
+        finally:
+            await wsd.stop()
+
+    def respond():
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.sendto(probe_response[0], ("127.0.0.1", MULTICAST_PORT))
+
+    found, elapsed = asyncio.run(search())
+
+    assert len(found) == 1
+    assert elapsed < 2  # on the first result, far from the timeout
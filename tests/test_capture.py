@@ -0,0 +1,161 @@
+import io
+import socket
+import struct
+import threading
+
+import pytest
+
+from .fixtures import probe_response
+from wsdiscovery.discovery import ReplayWSDiscovery
+from wsdiscovery.capture import CaptureWriter, JsonlCaptureSink, PcapngCaptureSink, readCapture, \
+                                formatCapture, CaptureRecord, CAPTURE_RECV, CAPTURE_SEND, CAPTURE_BAD
+
+
+def test_jsonl_round_trip(probe_response):
+    out = io.StringIO()
+    writer = CaptureWriter(JsonlCaptureSink(out))
+    writer.capture(CAPTURE_RECV, (probe_response[1], 3702), None, probe_response[0])
+    writer.capture(CAPTURE_SEND, ("239.255.255.250", 3702), ("192.0.2.2", 40000), b"\xff not XML")
+    writer.close()
+
+    records = list(readCapture(io.StringIO(out.getvalue())))
+    assert [(r.event, r.peer, r.local, r.data) for r in records] == [
+        (CAPTURE_RECV, (probe_response[1], 3702), None, probe_response[0]),
+        (CAPTURE_SEND, ("239.255.255.250", 3702), ("192.0.2.2", 40000), b"\xff not XML")]
+    assert records[0].timestamp <= records[1].timestamp
+
+    text = io.StringIO()
+    formatCapture(records, text)
+    assert text.getvalue().startswith("1 RECV %s:3702 TS=0.0\n" % probe_response[1])
+    assert "\n  <SOAP-ENV:Header>" in text.getvalue()
+    assert "2 SEND 239.255.255.250:3702 local=192.0.2.2:40000" in text.getvalue()
+
+
+def test_drops_when_sink_is_slow():
+    release = threading.Event()
+
+    class SlowSink:
+        def __init__(self):
+            self.records = []
+
+        def writeRecord(self, record):
+            release.wait()
+            self.records.append(record)
+
+        def flush(self):
+            pass
+
+    sink = SlowSink()
+    writer = CaptureWriter(sink, queue_size=2)
+    for i in range(10):
+        writer.capture(CAPTURE_RECV, ("192.0.2.1", 3702), None, b"%i" % i)
+    release.set()
+    writer.flush()
+
+    stats = writer.getStats()
+    assert stats["captured"] + stats["dropped"] == 10
+    assert stats["dropped"] >= 7
+    assert stats["written"] == len(sink.records) == stats["captured"]
+
+
+def _readPcapngBlocks(data):
+    offset = 0
+    while offset < len(data):
+        blockType, length = struct.unpack_from("<II", data, offset)
+        assert struct.unpack_from("<I", data, offset + length - 4)[0] == length
+        yield blockType, data[offset + 8:offset + length - 4]
+        offset += length
+
+
+def test_pcapng(probe_response):
+    out = io.BytesIO()
+    sink = PcapngCaptureSink(out)
+    ts = 1700000000123456789
+    sink.writeRecord(CaptureRecord(ts, CAPTURE_RECV, (probe_response[1], 3702), ("0.0.0.0", 3702),
+                                   probe_response[0]))
+    sink.writeRecord(CaptureRecord(ts + 1, CAPTURE_SEND, ("fe80::1%eth0", 3702), ("::", 50000), b"x"))
+
+    blocks = list(_readPcapngBlocks(out.getvalue()))
+    assert [blockType for blockType, _ in blocks] == [0x0A0D0D0A, 0x1, 0x6, 0x6]
+    assert struct.unpack_from("<I", blocks[0][1])[0] == 0x1A2B3C4D
+    assert struct.unpack_from("<H", blocks[1][1])[0] == 101  # raw IP
+    assert b"\x09\x00\x01\x00\x09" in blocks[1][1]  # nanosecond timestamps
+
+    interface, tsHigh, tsLow, captured, length = struct.unpack_from("<IIIII", blocks[2][1])
+    assert interface == 0 and captured == length
+    assert ((tsHigh << 32) | tsLow) == ts
+    packet = blocks[2][1][20:20 + captured]
+    assert packet[0] == 0x45 and packet[9] == socket.IPPROTO_UDP
+    assert packet[12:16] == socket.inet_aton(probe_response[1])
+    assert packet[16:20] == socket.inet_aton("239.255.255.250")  # received on the multicast socket
+    assert struct.unpack("!HHH", packet[20:26]) == (3702, 3702, 8 + len(probe_response[0]))
+    assert packet[28:] == probe_response[0]
+    assert b"RECV" in blocks[2][1][20 + captured:]
+
+    packet = blocks[3][1][20:20 + 49]
+    assert packet[0] >> 4 == 6 and packet[6] == socket.IPPROTO_UDP
+    assert packet[24:40] == socket.inet_pton(socket.AF_INET6, "fe80::1")
+    assert struct.unpack("!HH", packet[40:44]) == (50000, 3702)
+    assert packet[48:] == b"x"
+
+
+def test_pcapng_round_trip(probe_response):
+    "pcapng captures are read back, with the local endpoints of their packets"
+    out = io.BytesIO()
+    writer = CaptureWriter(PcapngCaptureSink(out))
+    writer.capture(CAPTURE_RECV, (probe_response[1], 3702), None, probe_response[0])
+    writer.capture(CAPTURE_SEND, ("fe80::1%eth0", 3702), ("::", 50000), b"x")
+    writer.capture(CAPTURE_BAD, ("192.0.2.7", 3702), ("192.0.2.2", 3702), b"<not XML")
+    writer.flush()
+
+    records = list(readCapture(io.BytesIO(out.getvalue())))
+    assert [(r.event, r.peer, r.local, r.data) for r in records] == [
+        (CAPTURE_RECV, (probe_response[1], 3702), ("239.255.255.250", 3702), probe_response[0]),
+        (CAPTURE_SEND, ("fe80::1", 3702), ("::", 50000), b"x"),
+        (CAPTURE_BAD, ("192.0.2.7", 3702), ("192.0.2.2", 3702), b"<not XML")]
+    assert records[0].timestamp <= records[1].timestamp <= records[2].timestamp
+
+    with pytest.raises(ValueError, match="truncated"):
+        list(readCapture(io.BytesIO(out.getvalue()[:-6])))
+
+
+def test_daemon_closes_own_capture(tmp_path, probe_response):
+    "the capture writer & file a daemon opened are closed when it stops"
+    path = tmp_path / "replay.jsonl"
+    wsd = ReplayWSDiscovery(capture=str(path))
+    wsd.start()
+    wsd._capture.capture(CAPTURE_RECV, (probe_response[1], 3702), None, probe_response[0])
+    thread = wsd._capture._thread
+    wsd.stop()
+
+    assert not thread.is_alive()
+    assert wsd._capture._sink._file.closed
+    assert wsd.getCaptureStats()["written"] == 1
+    with open(path) as f:
+        assert [r.data for r in readCapture(f)] == [probe_response[0]]
+
+    writer = CaptureWriter(JsonlCaptureSink(io.StringIO()))
+    wsd = ReplayWSDiscovery(capture=writer)
+    wsd.start()
+    wsd.stop()
+    assert writer._thread.is_alive()
+    writer.close()
+
+
+@pytest.mark.parametrize("name", ["replay.jsonl", "replay.pcapng"])
+def test_capture_across_restarts(tmp_path, probe_response, name):
+    "a daemon stopped & started again appends to the capture file it opened"
+    data, host = probe_response
+    path = tmp_path / name
+    wsd = ReplayWSDiscovery(capture=str(path))
+    for i in range(2):
+        wsd.start()
+        assert wsd.replayDatagram(data.replace(b"2419d68a", b"%08i" % i), (host, 3702))
+        wsd.stop()
+    wsd._capture.capture(CAPTURE_RECV, (host, 3702), None, data)  # once closed, neither kept nor blocking
+    wsd._capture.flush()
+
+    with open(path, "rb") as f:
+        records = list(readCapture(f))
+    assert len(records) == 2
+    assert all(b"%08i" % i in record.data for i, record in enumerate(records))
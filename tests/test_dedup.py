@@ -0,0 +1,84 @@
+import time
+from .fixtures import probe_response
+from wsdiscovery.dedup import DedupCache, peekMessageIds
+from wsdiscovery.discovery import ReplayWSDiscovery
+
+
+def test_capacity_eviction():
+    cache = DedupCache(capacity=3, window=60)
+    for mid in ["a", "b", "c", "d"]:
+        cache.add(mid)
+
+    assert len(cache) == 3
+    assert "a" not in cache
+    assert "d" in cache
+    stats = cache.getStats()
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_time_window(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+
+    cache = DedupCache(capacity=10, window=5)
+    cache["key"] = "1"
+    now[0] += 4
+    assert cache.get("key") == "1"
+    now[0] += 2
+    assert cache.get("key") is None
+    assert cache.getStats()["expirations"] == 1
+
+
+def test_peek_message_ids(probe_response):
+    data, host = probe_response
+    ids = ("uuid:2419d68a-2dd2-21b2-a205-78A5DD0F9593", "urn:uuid:2de9f5ad-abd2-4c0e-9ba8-178098d67f01")
+    assert peekMessageIds(data) == ids
+    assert peekMessageIds(memoryview(bytearray(data))[:len(data)]) == ids
+    assert peekMessageIds(data.replace(b"<wsa:RelatesTo>", b"<wsa:RelatesTo >")) == ids
+
+    without = data.replace(b"<wsa:RelatesTo>urn:uuid:2de9f5ad-abd2-4c0e-9ba8-178098d67f01</wsa:RelatesTo>", b"")
+    assert peekMessageIds(without) == (ids[0], None)
+
+
+def test_peek_message_ids_ambiguous(probe_response):
+    "datagrams a byte-level look could get wrong are left to the parser"
+    data, host = probe_response
+    tag = b"<wsa:MessageID>uuid:2419d68a-2dd2-21b2-a205-78A5DD0F9593</wsa:MessageID>"
+    assert peekMessageIds(data.replace(tag, b"")) is None
+    assert peekMessageIds(data.replace(tag, b"<!-- <wsa:MessageID>x</wsa:MessageID> -->" + tag)) is None
+    assert peekMessageIds(data.replace(tag, tag.replace(b"2419", b"2419&#45;"))) is None
+    assert peekMessageIds(data.replace(b"http://schemas.xmlsoap.org/ws/2004/08/addressing",
+                                       b"http://example.com/addressing")) is None
+
+
+def test_duplicates_not_parsed(probe_response):
+    data, host = probe_response
+    wsd = ReplayWSDiscovery()
+    wsd.start()
+    for i in range(3):
+        assert wsd.replayDatagram(data, (host, 3702))
+    wsd.stop()
+
+    metrics = wsd.getMetrics()
+    assert metrics.duplicatesDropped.get(("IPv4", "message_id")) == 2
+    assert metrics.parseSeconds.getStats()[0]["value"]["count"] == 1
+    assert metrics.messagesReceived.get(("ProbeMatches",)) == 1
+
+
+def test_bad_copy_does_not_hide_good_one(probe_response):
+    "a corrupt copy of a message, received first, does not get valid copies dropped as duplicates"
+    data, host = probe_response
+    wsd = ReplayWSDiscovery()
+    wsd.start()
+    assert not wsd.replayDatagram(data[:-40], (host, 3702))
+    assert wsd.replayDatagram(data, (host, 3702))
+    assert wsd.replayDatagram(data, (host, 3702))
+    wsd.stop()
+
+    metrics = wsd.getMetrics()
+    assert metrics.parseFailures.get(("IPv4",)) == 1
+    assert metrics.duplicatesDropped.get(("IPv4", "message_id")) == 1
+    assert metrics.messagesReceived.get(("ProbeMatches",)) == 1
+    assert len(wsd.getRemoteServices()) == 1
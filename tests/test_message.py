@@ -0,0 +1,218 @@
+from .fixtures import probe_response
+from wsdiscovery import QName, Scope
+from wsdiscovery.service import Service
+import logging
+import pytest
+from wsdiscovery.actions import *
+from wsdiscovery.discovery import ReplayWSDiscovery
+from wsdiscovery.envelope import BodyDecodeError, SoapEnvelope
+from wsdiscovery.namespaces import NS_ADDRESSING, NS_ADDRESSING_1_1, NS_DISCOVERY_1_1, NS_SOAPENV
+from wsdiscovery.message import createSOAPMessage, parseSOAPMessage
+
+
+ONVIF_NS = "http://www.onvif.org/ver10/network/wsdl"
+
+
+def make_service():
+    types = [QName(ONVIF_NS, "NetworkVideoTransmitter", "dn"), QName("http://example.com/ns", "Device")]
+    scopes = [Scope("onvif://www.onvif.org/Model/some model"), Scope("onvif://www.onvif.org/name/x")]
+    xAddrs = ["http://10.0.0.1:80/onvif/device_service"]
+    return Service(types, scopes, xAddrs, "urn:uuid:42", 1234)
+
+
+def roundtrip(env):
+    return parseSOAPMessage(createSOAPMessage(env), "127.0.0.1")
+
+
+def test_probe_roundtrip():
+    service = make_service()
+    env = roundtrip(constructProbe(service.getTypes(), service.getScopes()))
+
+    assert env.getAction() == NS_ACTION_PROBE
+    assert [t.getFullname() for t in env.getTypes()] == [t.getFullname() for t in service.getTypes()]
+    assert [s.getValue() for s in env.getScopes()] == [s.getValue() for s in service.getScopes()]
+
+
+def test_hello_bye_roundtrip():
+    service = make_service()
+    hello = roundtrip(constructHello(service))
+    bye = roundtrip(constructBye(service))
+
+    assert hello.getAction() == NS_ACTION_HELLO
+    assert hello.getEPR() == bye.getEPR() == "urn:uuid:42"
+    assert hello.getXAddrs() == service.getXAddrs()
+    assert hello.getInstanceId() == bye.getInstanceId() == "1234"
+    assert bye.getAction() == NS_ACTION_BYE
+
+
+def test_match_roundtrip():
+    service = make_service()
+    probeMatch = roundtrip(constructProbeMatch([service, service], "urn:uuid:1"))
+    resolveMatch = roundtrip(constructResolveMatch(service, "urn:uuid:2"))
+
+    assert probeMatch.getRelatesTo() == "urn:uuid:1"
+    assert len(probeMatch.getProbeResolveMatches()) == 2
+    assert resolveMatch.getRelatesTo() == "urn:uuid:2"
+    match = resolveMatch.getProbeResolveMatches()[0]
+    assert match.getEPR() == "urn:uuid:42"
+    assert match.getTypes()[0].getNamespace() == ONVIF_NS
+    assert match.getScopes()[0].getValue() == "onvif://www.onvif.org/Model/some model"
+
+
+def test_resolve_roundtrip():
+    env = roundtrip(constructResolve("urn:uuid:42"))
+    assert env.getAction() == NS_ACTION_RESOLVE
+    assert env.getEPR() == "urn:uuid:42"
+
+
+def test_type_prefix_resolution():
+    "type prefixes are resolved against the declarations in scope"
+    data = b"""<s:Envelope xmlns:s="http://www.w3.org/2003/05/soap-envelope"
+        xmlns:a="http://schemas.xmlsoap.org/ws/2004/08/addressing"
+        xmlns:d="http://schemas.xmlsoap.org/ws/2005/04/discovery">
+      <s:Header>
+        <a:Action>http://schemas.xmlsoap.org/ws/2005/04/discovery/Probe</a:Action>
+        <a:MessageID>urn:uuid:1</a:MessageID>
+        <a:To>urn:schemas-xmlsoap-org:ws:2005:04:discovery</a:To>
+      </s:Header>
+      <s:Body>
+        <d:Probe xmlns="http://example.com/default">
+          <d:Types xmlns:dn="http://www.onvif.org/ver10/network/wsdl">dn:NetworkVideoTransmitter Plain</d:Types>
+        </d:Probe>
+      </s:Body>
+    </s:Envelope>"""
+    types = parseSOAPMessage(data, "127.0.0.1").getTypes()
+
+    assert types[0].getFullname() == ONVIF_NS + ":NetworkVideoTransmitter"
+    assert types[0].getNamespacePrefix() == "dn"
+    assert types[1].getNamespace() == "http://example.com/default"
+
+
+def test_canned_probe_response(probe_response):
+    env = parseSOAPMessage(*probe_response)
+    assert env.getAction() == NS_ACTION_PROBE_MATCH
+    assert env.getRelatesTo() == "urn:uuid:2de9f5ad-abd2-4c0e-9ba8-178098d67f01"
+    assert len(env.getProbeResolveMatches()[0].getScopes()) == 4
+
+
+def test_lazy_body(probe_response):
+    "only the header is decoded when parsing, the body on first access"
+    env = parseSOAPMessage(*probe_response)
+    assert env.getMessageId() == "uuid:2419d68a-2dd2-21b2-a205-78A5DD0F9593"
+    assert not env.isBodyDecoded()
+
+    matches = env.getProbeResolveMatches()
+    assert env.isBodyDecoded()
+    assert env.getProbeResolveMatches() is matches
+
+    env = roundtrip(constructHello(make_service()))
+    env.setScopes([])
+    assert env.getScopes() == []
+    assert env.getEPR() == "urn:uuid:42"
+
+
+def test_invalid_body(probe_response):
+    "body errors are raised by the accessors and counted as parse failures when handling"
+    data, host = probe_response
+    data = data.replace(b"wsa:EndpointReference", b"wsa:Reference")
+    env = parseSOAPMessage(data, host)
+    assert env.getMessageId()
+    with pytest.raises(BodyDecodeError):
+        env.getProbeResolveMatches()
+    # not only the first time
+    with pytest.raises(BodyDecodeError):
+        env.getProbeResolveMatches()
+    with pytest.raises(BodyDecodeError):
+        env.getFields()
+
+
+def test_invalid_body_handling(probe_response, caplog):
+    "invalid bodies are parse failures, whether or not debug logging decodes them"
+    data, host = probe_response
+    data = data.replace(b"wsa:EndpointReference", b"wsa:Reference")
+    caplog.set_level(logging.DEBUG)
+
+    wsd = ReplayWSDiscovery()
+    wsd.start()
+    assert not wsd.replayDatagram(data, (host, 3702))
+    wsd.stop()
+    assert wsd.getMetrics().parseFailures.get(("IPv4",)) == 1
+    assert wsd.getRemoteServices() == []
+
+
+def test_registered_action(probe_response):
+    "actions added to the registry are parsed & dispatched to their handler"
+    action = NS_DISCOVERY_1_1 + "/Hello"
+    data, host = probe_response
+    data = data.replace(NS_ACTION_PROBE_MATCH.encode(), action.encode()) \
+               .replace(NS_ADDRESSING.encode(), NS_ADDRESSING_1_1.encode())
+
+    def decode(dom):
+        env = SoapEnvelope()
+        env.setAction(action)
+        env.setMessageId(dom.find(NS_SOAPENV, "Header").findText(NS_ADDRESSING_1_1, "MessageID"))
+        return env
+
+    handled = []
+
+    class Discovery(ReplayWSDiscovery):
+        def _handle_hello11(self, env, addr):
+            handled.append(env.getMessageId())
+
+    assert parseSOAPMessage(data, host) is None
+    registerAction(action, decoder=decode, handler="_handle_hello11")
+    try:
+        env = parseSOAPMessage(data, host)
+        assert createSOAPMessage(env) is None
+
+        wsd = Discovery()
+        wsd.start()
+        wsd.replayDatagram(data, (host, 3702))
+        wsd.stop()
+    finally:
+        unregisterAction(action)
+
+    assert handled == [env.getMessageId()]
+    assert wsd.getMetrics().messagesReceived.get(("Hello",)) == 1
+
+
+def test_unparseable():
+    assert parseSOAPMessage(b"<unterminated", "127.0.0.1") is None
+    assert parseSOAPMessage(b"<!DOCTYPE x [<!ENTITY a 'b'>]><x>&a;</x>", "127.0.0.1") is None
+
+
+def test_compact_deterministic_output():
+    service = make_service()
+    env = constructProbeMatch([service], "urn:uuid:1")
+    data = createSOAPMessage(env)
+
+    assert data == createSOAPMessage(env)
+    assert "\n" not in data
+    assert 'xmlns:dn="%s"' % ONVIF_NS in data
+    assert "ns0:Device" in data
+
+
+def test_escaping():
+    env = constructResolve("urn:x?a=1&b=<2>")
+    data = createSOAPMessage(env)
+
+    assert "&amp;b=&lt;2&gt;" in data
+    assert roundtrip(env).getEPR() == "urn:x?a=1&b=<2>"
+
+
+def test_deprecated_minidom_helpers():
+    "the former minidom helpers still build messages, with a deprecation warning"
+    from wsdiscovery import util
+
+    with pytest.deprecated_call():
+        doc = util.createSkelSoapMessage(NS_ACTION_HELLO)
+    with pytest.deprecated_call():
+        util.addEPR(doc, util.getBodyEl.__wrapped__(doc), "urn:uuid:1")
+    with pytest.deprecated_call():
+        util.addTypes(doc, util.getBodyEl.__wrapped__(doc), [QName("http://example.com/ns", "Device")])
+    with pytest.deprecated_call():
+        data = util.getDocAsString(doc)
+
+    assert NS_ACTION_HELLO in data
+    assert "<a:Address>urn:uuid:1</a:Address>" in data
+    assert ":Device</d:Types>" in data
@@ -0,0 +1,49 @@
+from .fixtures import probe_response
+from wsdiscovery.discovery import ReplayWSDiscovery
+from wsdiscovery.metrics import MetricsRegistry
+
+
+def test_prometheus_text():
+    registry = MetricsRegistry()
+    counter = registry.counter("test_total", "Things counted", ("kind",))
+    counter.inc(("a",))
+    counter.inc(('say "hi"',), 2)
+    histogram = registry.histogram("test_seconds", "Time taken", buckets=(0.1, 1))
+    histogram.observe((), 0.5)
+    histogram.observe((), 5)
+
+    assert registry.renderPrometheus() == "\n".join([
+        "# HELP test_total Things counted",
+        "# TYPE test_total counter",
+        'test_total{kind="a"} 1',
+        'test_total{kind="say \\"hi\\""} 2',
+        "# HELP test_seconds Time taken",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{le="0.1"} 0',
+        'test_seconds_bucket{le="1"} 1',
+        'test_seconds_bucket{le="+Inf"} 2',
+        "test_seconds_sum 5.5",
+        "test_seconds_count 2",
+    ]) + "\n"
+
+
+def test_daemon_metrics(probe_response):
+    data, host = probe_response
+    wsd = ReplayWSDiscovery()
+    wsd.start()
+    for payload in (data, data, b"<not XML"):
+        wsd.replayDatagram(payload, (host, 3702))
+    wsd.stop()
+
+    metrics = wsd.getMetrics()
+    assert metrics.datagramsReceived.get(("IPv4", "any")) == 3
+    assert metrics.parseFailures.get(("IPv4",)) == 1
+    assert metrics.duplicatesDropped.get(("IPv4", "message_id")) == 1
+    assert metrics.messagesReceived.get(("ProbeMatches",)) == 1
+    assert metrics.services.get(("remote",)) == 1
+
+    stats = wsd.getStats()
+    assert stats["wsdiscovery_handler_seconds"][0]["labels"] == {"action": "ProbeMatches"}
+    assert stats["wsdiscovery_handler_seconds"][0]["value"]["count"] == 1
+    # the duplicate is dropped without parsing
+    assert stats["wsdiscovery_parse_seconds"][0]["value"]["count"] == 2
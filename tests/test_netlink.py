@@ -0,0 +1,26 @@
+import socket
+import struct
+
+from wsdiscovery.netlink import parseAddressChanges, RTM_NEWADDR, RTM_DELADDR
+
+
+def _message(msgType, family, payload=b"\x08\x00\x01\x00\xc0\x00\x02\x4d"):
+    ifaddrmsg = struct.pack("=BBBBI", family, 24, 0, 0, 2) + payload
+    return struct.pack("=IHHII", 16 + len(ifaddrmsg), msgType, 0, 0, 0) + ifaddrmsg
+
+
+def test_address_changes_by_family():
+    newV4 = _message(RTM_NEWADDR, socket.AF_INET)
+    delV6 = _message(RTM_DELADDR, socket.AF_INET6)
+    newLink = _message(16, socket.AF_INET)  # RTM_NEWLINK
+
+    assert parseAddressChanges(newV4, socket.AF_INET)
+    assert not parseAddressChanges(newV4, socket.AF_INET6)
+    assert parseAddressChanges(newLink + delV6, socket.AF_INET6)
+    assert not parseAddressChanges(newLink, socket.AF_INET)
+
+
+def test_truncated_messages():
+    assert not parseAddressChanges(b"", socket.AF_INET)
+    assert not parseAddressChanges(_message(RTM_NEWADDR, socket.AF_INET)[:18], socket.AF_INET)
+    assert not parseAddressChanges(struct.pack("=IHHII", 0, RTM_NEWADDR, 0, 0, 0), socket.AF_INET)
@@ -0,0 +1,73 @@
+import socket
+
+from wsdiscovery.actions import constructProbe
+from wsdiscovery.discovery import ThreadedWSDiscovery
+from wsdiscovery.networking import ReceiveBuffer, BUFFER_SIZE, MULTICAST_IPV4_ADDRESS, MULTICAST_PORT
+
+
+def test_receive_buffer_batch():
+    "datagrams are received back to back into one buffer until it may not hold another"
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.setblocking(0)
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        payloads = [b"datagram %i " % i * 100 for i in range(20)]
+        for payload in payloads:
+            sender.sendto(payload, receiver.getsockname())
+
+        buffer = ReceiveBuffer(BUFFER_SIZE + 5000)
+        received = []
+        while not buffer.isFull():
+            data, addr = buffer.recvFrom(receiver)
+            received.append(bytes(data))
+        assert received == payloads[:len(received)]
+        assert sum(map(len, received)) > 5000 - len(payloads[0])
+
+        while True:
+            if buffer.isFull():
+                buffer.reset()
+            try:
+                data, addr = buffer.recvFrom(receiver)
+            except BlockingIOError:
+                break
+            received.append(bytes(data))
+        assert received == payloads
+        assert addr[1] == sender.getsockname()[1]
+    finally:
+        sender.close()
+        receiver.close()
+
+
+def test_stopping_waits_for_deadlines():
+    "a stopping networking thread blocks in select() until its last messages are due"
+    wsd = ThreadedWSDiscovery()
+    wsd.start()
+    thread = wsd._networkingThread_v4
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    selects = []
+    select = thread._selector.select
+    scheduleStop = thread.schedule_stop
+
+    def countingSelect(timeout=None):
+        selects.append(timeout)
+        return select(timeout)
+
+    def scheduleStopWithTraffic():
+        scheduleStop()
+        # datagrams received while stopping are not handled, yet must not keep select() from blocking
+        sender.sendto(b"not handled", ("127.0.0.1", MULTICAST_PORT))
+
+    thread._selector.select = countingSelect
+    thread.schedule_stop = scheduleStopWithTraffic
+    try:
+        thread.addMulticastMessage(constructProbe(None, None), MULTICAST_IPV4_ADDRESS, MULTICAST_PORT,
+                                   initialDelay=100, multicast_num=3)
+        del selects[:]
+        wsd.stop()
+    finally:
+        sender.close()
+
+    # a few passes per (re)transmission & wakeup, rather than spinning until the last one
+    assert len(selects) < 30
+    assert wsd.getMetrics().parseFailures.get(("IPv4",)) == 0
@@ -0,0 +1,111 @@
+import pickle
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+from .fixtures import probe_response
+from wsdiscovery.actions import registerAction, unregisterAction
+from wsdiscovery.namespaces import NS_ACTION_HELLO, NS_ACTION_PROBE_MATCH, NS_ADDRESSING, NS_ADDRESSING_1_1, \
+                                   NS_DISCOVERY_1_1, NS_SOAPENV
+from wsdiscovery.networking import MULTICAST_PORT
+from wsdiscovery.discovery import ThreadedWSDiscovery
+from wsdiscovery.envelope import SoapEnvelope
+from wsdiscovery.parsepool import parseBatch
+from wsdiscovery.publishing import ThreadedWSPublishing
+from wsdiscovery.qname import QName
+
+
+def test_parse_batch(probe_response):
+    "workers return picklable envelope fields with decoded bodies"
+    data, host = probe_response
+    results = pickle.loads(pickle.dumps(parseBatch([(data, host), (b"<not XML", host)])))
+
+    fields, seconds, actionURI = results[0]
+    assert seconds > 0
+    env = SoapEnvelope.fromFields(fields)
+    assert env.getRelatesTo() == "urn:uuid:2de9f5ad-abd2-4c0e-9ba8-178098d67f01"
+    match = env.getProbeResolveMatches()[0]
+    assert len(match.getScopes()) == 4
+    # unpickled scopes are the shared instances
+    again = SoapEnvelope.fromFields(pickle.loads(pickle.dumps(fields)))
+    assert again.getProbeResolveMatches()[0].getScopes()[0] is match.getScopes()[0]
+
+    assert results[1][0] is None
+
+
+def test_discovery_with_parse_workers():
+    ttype = QName("http://example.com/parsepool", "Device%s" % uuid.uuid4().hex)
+    wsp = ThreadedWSPublishing()
+    wsp.start()
+    wsp.publishService([ttype], [], ["http://127.0.0.1:8080/"])
+
+    wsd = ThreadedWSDiscovery(parse_workers=2)
+    wsd.start()
+    try:
+        found = list(wsd.iterServices(types=[ttype], timeout=10, max_results=1))
+    finally:
+        wsd.stop()
+        wsp.stop()
+
+    assert len(found) == 1
+    assert found[0].getXAddrs() == ["http://127.0.0.1:8080/"]
+    assert wsd.getMetrics().parseSeconds.getStats()
+
+
+def test_pending_batches_handled_at_stop(probe_response):
+    "datagrams still being parsed when the daemon stops are handled, not dropped"
+    data, host = probe_response
+    wsd = ThreadedWSDiscovery(parse_workers=1)
+    wsd.start()
+    thread = wsd._networkingThread_v4
+    future = Future()
+    future.add_done_callback(lambda future: thread._wakeup())
+    thread._parsing.append((future, [(data, (host, 3702), None)]))
+    timer = threading.Timer(0.2, lambda: future.set_result(parseBatch([(data, host)])))
+    timer.start()
+    wsd.stop()
+    timer.join()
+
+    assert len(wsd.getRemoteServices()) == 1
+    assert wsd.getMetrics().messagesReceived.get(("ProbeMatches",)) == 1
+
+
+def test_registered_action_with_parse_workers(probe_response):
+    "messages of actions registered at runtime are handled as without workers, which do not know them"
+    action = NS_DISCOVERY_1_1 + "/Hello"
+    data, host = probe_response
+    data = data.replace(NS_ACTION_PROBE_MATCH.encode(), action.encode()) \
+               .replace(NS_ADDRESSING.encode(), NS_ADDRESSING_1_1.encode())
+
+    def decode(dom):
+        env = SoapEnvelope()
+        env.setAction(action)
+        env.setMessageId(dom.find(NS_SOAPENV, "Header").findText(NS_ADDRESSING_1_1, "MessageID"))
+        return env
+
+    handled = []
+
+    class Discovery(ThreadedWSDiscovery):
+        def _handle_hello11(self, env, addr):
+            handled.append(env.getMessageId())
+
+    registerAction(action, decoder=decode, handler="_handle_hello11")
+    wsd = Discovery(parse_workers=1)
+    wsd.start()
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        assert wsd._parsePool.decodes(NS_ACTION_HELLO)
+        assert not wsd._parsePool.decodes(action)
+        sender.sendto(data, ("127.0.0.1", MULTICAST_PORT))
+        deadline = time.monotonic() + 5
+        while not handled and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        sender.close()
+        wsd.stop()
+        unregisterAction(action)
+
+    assert handled == ["uuid:2419d68a-2dd2-21b2-a205-78A5DD0F9593"]
+    assert wsd.getMetrics().parseFailures.get(("IPv4",)) == 0
@@ -0,0 +1,71 @@
+from wsdiscovery.message import createSOAPMessage
+from wsdiscovery.probecache import ProbeMatchCache
+from wsdiscovery.qname import QName
+from wsdiscovery.scope import Scope
+from wsdiscovery.service import Service
+
+
+TYPES = [QName("http://example.com/ns", "Camera", "ex"), QName("http://example.com/ns", "Sensor")]
+SERVICES = [Service(TYPES, [Scope("onvif://www.onvif.org/location/city/paris")],
+                    ["http://10.0.0.1:8080/"], "urn:uuid:1", 0)]
+
+
+def test_rendering_matches_full_serialization():
+    cache = ProbeMatchCache()
+    cached = cache.get(TYPES, [], lambda types, scopes: SERVICES)
+    env = cached.constructEnvelope("urn:uuid:probe")
+
+    assert env.getRelatesTo() == "urn:uuid:probe"
+    assert cached.render(env) == createSOAPMessage(env)
+
+
+def test_equivalent_filters_share_entry():
+    calls = []
+
+    def findServices(types, scopes):
+        calls.append((types, scopes))
+        return SERVICES
+
+    cache = ProbeMatchCache()
+    first = cache.get(TYPES, [Scope("onvif://www.onvif.org/location/")], findServices)
+    second = cache.get(list(reversed(TYPES)), [Scope("ONVIF://www.onvif.org/location")], findServices)
+    assert first is second
+    assert len(calls) == 1
+
+    cache.get(TYPES, [Scope("onvif://www.onvif.org/location/city")], findServices)
+    assert len(calls) == 2
+    assert cache.getStats()["hits"] == 1
+
+
+def test_clear_drops_entries_and_stale_results():
+    cache = ProbeMatchCache(capacity=1)
+
+    def findServices(types, scopes):
+        cache.clear()  # services changed while matching
+        return SERVICES
+
+    cache.get(TYPES, [], findServices)
+    assert len(cache) == 0
+
+    cache.get(TYPES, [], lambda types, scopes: SERVICES)
+    cache.get([], [], lambda types, scopes: [])
+    assert len(cache) == 1
+
+
+def test_packing_within_budget():
+    services = [Service(TYPES, [Scope("onvif://www.onvif.org/name/device%i" % i)],
+                        ["http://10.0.0.%i:8080/onvif/device_service" % i], "urn:uuid:%i" % i, 0)
+                for i in range(40)]
+    cached = ProbeMatchCache().get(TYPES, [], lambda types, scopes: services)
+
+    messages = cached.constructMessages("urn:uuid:probe", 1400)
+    assert len(messages) > 1
+    assert all(len(data) <= 1400 for env, data in messages)
+    assert [data for env, data in messages] == [createSOAPMessage(env).encode("UTF-8") for env, _ in messages]
+
+    eprs = [prm.getEPR() for env, data in messages for prm in env.getProbeResolveMatches()]
+    assert eprs == [service.getEPR() for service in services]
+    assert len({env.getInstanceId() for env, data in messages}) == 1
+    assert [env.getMessageNumber() for env, data in messages] == [str(i) for i in range(1, len(messages) + 1)]
+
+    assert len(cached.constructMessages("urn:uuid:probe")) == 1
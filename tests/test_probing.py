@@ -1,6 +1,8 @@
 import logging
 import selectors
 import socket
+import threading
+import time
 from .fixtures import probe_response
 from wsdiscovery.threaded import NetworkingThread, MULTICAST_PORT
 from wsdiscovery import WSDiscovery
@@ -24,20 +26,33 @@ def test_probing(monkeypatch, probe_response):
     def mock_select(*args):
         "set a mock Probe response event in motion for the same socket"
         global sck
-        if sck and sck.getsockname()[1] == MULTICAST_PORT:
-            key = selectors.SelectorKey(sck, sck.fileno(), [], "")
-            # to mock just one response we just nullify the sock
-            sck = None
+        # the IPv4 & IPv6 threads both select, take the socket only once
+        selected, sck = sck, None
+        if selected and selected.getsockname()[1] == MULTICAST_PORT:
+            key = selectors.SelectorKey(selected, selected.fileno(), [], "")
             return [(key, selectors.EVENT_READ)]
         else:
             return []
 
-    def mock_recvfrom(*args):
-        return probe_response
+    responses = []
+
+    def mock_recvfrom_into(sock, buffer, nbytes=0):
+        "receive the Probe response once for each selected socket event"
+        if not responses:
+            raise BlockingIOError()
+        data = responses.pop()
+        buffer[:len(data)] = data
+        return len(data), (probe_response[1], MULTICAST_PORT)
+
+    def mock_select_once(*args):
+        events = mock_select(*args)
+        if events:
+            responses.append(probe_response[0])
+        return events
 
     monkeypatch.setattr(selectors.DefaultSelector, "register", mock_register)
-    monkeypatch.setattr(selectors.DefaultSelector, "select", mock_select)
-    monkeypatch.setattr(socket.socket, "recvfrom", mock_recvfrom)
+    monkeypatch.setattr(selectors.DefaultSelector, "select", mock_select_once)
+    monkeypatch.setattr(socket.socket, "recvfrom_into", mock_recvfrom_into)
 
     # we cannot use a fixture that'd start discovery for us, since the socket
     # selector registration happens at startup time
@@ -48,3 +63,25 @@ def test_probing(monkeypatch, probe_response):
     assert len(found) == 1
     assert probe_response[1] in found[0].getXAddrs()[0]
     assert len(found[0].getScopes()) == 4
+
+
+def test_iter_services(probe_response):
+    "services are yielded as they respond, without waiting for the timeout"
+
+    def respond():
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.sendto(probe_response[0], ("127.0.0.1", MULTICAST_PORT))
+
+    wsd = WSDiscovery()
+    wsd.start()
+    try:
+        started = time.monotonic()
+        threading.Timer(0.2, respond).start()
+        found = list(wsd.iterServices(timeout=10, max_results=1))
+        elapsed = time.monotonic() - started
+    finally:
+        wsd.stop()
+
+    assert len(found) == 1
+    assert elapsed < 2  # on the first result, far from the timeout
+    assert probe_response[1] in found[0].getXAddrs()[0]
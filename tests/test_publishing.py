@@ -0,0 +1,75 @@
+import io
+
+from wsdiscovery import WSDiscovery
+from wsdiscovery.actions import constructProbe
+from wsdiscovery.capture import CaptureWriter, JsonlCaptureSink, readCapture, CAPTURE_SEND
+from wsdiscovery.dedup import peekMessageIds
+from wsdiscovery.message import createSOAPMessage
+from wsdiscovery.namespaces import NS_ACTION_PROBE_MATCH
+from wsdiscovery.publishing import ThreadedWSPublishing, ReplayWSPublishing
+from wsdiscovery.qname import QName
+from wsdiscovery.scope import Scope
+
+
+def test_publish_many_services():
+    "services published by one daemon are each discovered under their own EPR, in MTU-sized Probe Matches"
+
+    ttype = QName("http://example.com/gateway", "LegacyDevice")
+    out = io.StringIO()
+    writer = CaptureWriter(JsonlCaptureSink(out))
+    wsp = ThreadedWSPublishing(probe_match_max_size=1400, capture=writer)
+    wsp.start()
+    published = wsp.publishServices([
+        ([ttype], [Scope("onvif://www.onvif.org/name/device%i" % i)],
+         ["http://127.0.0.1:%i/" % (8000 + i)], "urn:uuid:00000000-0000-0000-0000-%012i" % i)
+        for i in range(30)])
+
+    wsd = WSDiscovery()
+    wsd.start()
+    try:
+        found = wsd.searchServices(types=[ttype], timeout=2)
+    finally:
+        wsd.stop()
+        wsp.stop()
+        writer.close()
+
+    assert sorted(service.getEPR() for service in found) == sorted(s.getEPR() for s in published)
+    assert len({service.getInstanceId() for service in published}) == 30
+
+    # the Probe Matches answering each probe, per address family it was received over,
+    # once: retransmissions repeat the same bytes
+    responses = {}
+    for record in readCapture(io.StringIO(out.getvalue())):
+        if record.event == CAPTURE_SEND and NS_ACTION_PROBE_MATCH.encode() in record.data:
+            key = (peekMessageIds(record.data)[1], ":" in record.peer[0])
+            responses.setdefault(key, set()).add(record.data)
+    assert responses
+    for datagrams in responses.values():
+        assert len(datagrams) >= 30 * 300 // 1400
+        assert all(len(data) <= 1400 for data in datagrams)
+        assert sum(data.count(b"urn:uuid:00000000-0000-0000-0000-") for data in datagrams) == 30
+
+
+def test_probe_matches_follow_service_changes():
+    "Probe Matches list a published service as changed after publishing, not as cached"
+
+    ttype = QName("http://example.com/gateway", "LegacyDevice")
+    wsp = ReplayWSPublishing()
+    sent = []
+    wsp.sendUnicastMessage = lambda env, host, port, *args, payload, **kwargs: sent.append(payload.getData())
+    wsp.start()
+    service = wsp.publishService([ttype], [], ["http://192.0.2.2:8080/"])
+
+    def probe():
+        wsp.replayDatagram(createSOAPMessage(constructProbe([ttype], [])).encode("UTF-8"), ("192.0.2.7", 3702))
+
+    for xAddr in ["http://192.0.2.3:8080/", "http://192.0.2.4:8080/"]:
+        probe()
+        service.setXAddrs([xAddr])
+    service.setMetadataVersion(2)
+    probe()
+
+    assert len(sent) == 3
+    assert b"http://192.0.2.2:8080/" in sent[0]
+    assert b"http://192.0.2.3:8080/" in sent[1] and b"192.0.2.2" not in sent[1]
+    assert b"http://192.0.2.4:8080/" in sent[2] and b"MetadataVersion>2<" in sent[2]
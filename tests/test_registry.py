@@ -0,0 +1,91 @@
+import random
+
+from wsdiscovery.qname import QName
+from wsdiscovery.scope import Scope
+from wsdiscovery.service import Service
+from wsdiscovery.registry import ServiceRegistry
+from wsdiscovery.scope import MATCH_BY_STRCMP
+from wsdiscovery.util import filterServices
+
+
+TYPES = [QName("http://example.com/ns%i" % i, "Type%i" % i) for i in range(4)]
+SCOPES = ["onvif://www.onvif.org/Profile/Streaming",
+          "onvif://www.onvif.org/location/country/china",
+          "onvif://www.onvif.org/location/city/beijing",
+          "http://Example.com/a/b/",
+          "http://example.com/a/bc",
+          "ldap:///ou=engineering,o=examplecom,c=us"]
+
+
+def test_filter_matches_linear_scan():
+    rnd = random.Random(1)
+    registry = ServiceRegistry()
+    for i in range(200):
+        service = Service(rnd.sample(TYPES, rnd.randint(0, 2)),
+                          [Scope(value) for value in rnd.sample(SCOPES, rnd.randint(0, 3))],
+                          [], "urn:uuid:%i" % i, 0)
+        registry.add(service)
+
+    probes = [
+        ([], []),
+        (TYPES[:1], []),
+        (TYPES[:2], []),
+        ([], [Scope("onvif://www.onvif.org/location")]),
+        ([], [Scope("onvif://www.onvif.org/location/")]),
+        ([], [Scope("onvif://www.onvif.org/loc")]),
+        ([], [Scope("http://example.com/a/b")]),
+        ([], [Scope("HTTP://EXAMPLE.COM/a")]),
+        ([], [Scope(SCOPES[0], MATCH_BY_STRCMP)]),
+        ([], [Scope("onvif://www.onvif.org/Profile", MATCH_BY_STRCMP)]),
+        ([], [Scope("onvif://www.onvif.org/Profile", "urn:unknown")]),
+        (TYPES[1:2], [Scope("onvif://www.onvif.org"), Scope("http://example.com/a/bc")]),
+    ]
+    for types, scopes in probes:
+        expected = filterServices(registry.values(), types, scopes)
+        assert registry.filter(types, scopes) == expected
+        for service in registry.values():
+            assert registry.matches(service.getEPR(), types, scopes) == (service in expected)
+
+
+def test_replace_and_remove():
+    registry = ServiceRegistry()
+    registry.add(Service(TYPES[:1], [Scope(SCOPES[0])], [], "urn:uuid:1", 0))
+    registry.add(Service(TYPES[1:2], [], [], "urn:uuid:1", 0))
+
+    assert len(registry) == 1
+    assert registry.filter(TYPES[:1], []) == []
+    assert registry.filter([], [Scope(SCOPES[0])]) == []
+    assert [s.getEPR() for s in registry.filter(TYPES[1:2], [])] == ["urn:uuid:1"]
+
+    registry.remove("urn:uuid:1")
+    registry.remove("urn:uuid:1")
+    assert "urn:uuid:1" not in registry
+    assert registry.filter(TYPES[1:2], []) == []
+    assert not registry._typeIndex
+
+
+def test_mutated_services_are_reindexed():
+    "registered services changing their types, scopes or EPR are found by their new values"
+    registry = ServiceRegistry()
+    first = Service(TYPES[:1], [Scope(SCOPES[0])], [], "urn:uuid:1", 0)
+    second = Service(TYPES[:1], [], [], "urn:uuid:2", 0)
+    registry.add(first)
+    registry.add(second)
+
+    first.setTypes(TYPES[1:2])
+    first.setScopes([Scope(SCOPES[1])])
+    assert registry.filter(TYPES[:1], []) == [second]
+    assert registry.filter(TYPES[1:2], []) == [first]
+    assert registry.filter([], [Scope(SCOPES[0])]) == []
+    assert registry.filter([], [Scope(SCOPES[1])]) == [first]
+    assert registry.matches("urn:uuid:1", TYPES[1:2], [Scope(SCOPES[1])])
+
+    first.setEPR("urn:uuid:3")
+    assert "urn:uuid:1" not in registry and registry["urn:uuid:3"] is first
+    assert registry.filter(TYPES[1:2], []) == [first]
+    assert registry.filter() == [first, second]
+
+    registry.remove("urn:uuid:3")
+    first.setTypes(TYPES[:1])
+    assert registry.filter(TYPES[:1], []) == [second]
+    assert set(registry._typeIndex) == {TYPES[0].getFullname()}
@@ -0,0 +1,40 @@
+from .fixtures import probe_response
+from wsdiscovery.actions import constructProbe
+from wsdiscovery.capture import CaptureRecord, CAPTURE_RECV, CAPTURE_SEND, CAPTURE_BAD
+from wsdiscovery.discovery import ReplayWSDiscovery
+from wsdiscovery.message import createSOAPMessage
+from wsdiscovery.publishing import ReplayWSPublishing
+from wsdiscovery.qname import QName
+from wsdiscovery.replay import replayCapture
+
+
+def test_replay_discovery(probe_response):
+    data, host = probe_response
+    records = [
+        CaptureRecord(0, CAPTURE_RECV, (host, 3702), None, data),
+        CaptureRecord(1, CAPTURE_RECV, (host, 3702), None, data),  # retransmission
+        CaptureRecord(2, CAPTURE_SEND, ("239.255.255.250", 3702), None, b"not replayed"),
+        CaptureRecord(3, CAPTURE_BAD, ("192.0.2.7", 3702), None, b"<not XML"),
+    ]
+
+    wsd = ReplayWSDiscovery()
+    wsd.start()
+    stats = replayCapture(wsd, records)
+    wsd.stop()
+
+    assert stats["datagrams"] == 3
+    assert stats["parse_failures"] == 1
+    assert len(wsd.getRemoteServices()) == 1
+    assert wsd.getDedupStats()["IPv4"]["message_ids"]["hits"] == 1
+
+
+def test_replay_publishing():
+    ttype = QName("http://example.com/gateway", "LegacyDevice")
+    probe = createSOAPMessage(constructProbe([ttype], [])).encode("UTF-8")
+
+    wsp = ReplayWSPublishing()
+    wsp.start()
+    wsp.publishService([ttype], [], ["http://192.0.2.2:8080/"])
+    replayCapture(wsp, [CaptureRecord(0, CAPTURE_RECV, ("192.0.2.7", 3702), None, probe)], speed=1.0)
+
+    assert wsp.getSentStats() == {"unicast": 1, "multicast": 1}  # Probe Match & Hello
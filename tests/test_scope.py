@@ -0,0 +1,100 @@
+from wsdiscovery.actions import constructHello
+from wsdiscovery.message import createSOAPMessage, parseSOAPMessage
+from wsdiscovery.qname import QName
+from wsdiscovery.scope import Scope, MATCH_BY_LDAP, MATCH_BY_URI, MATCH_BY_UUID, MATCH_BY_STRCMP
+from wsdiscovery.scopematch import ScopeMatcher, ScopeIndex
+from wsdiscovery.service import Service
+from wsdiscovery.util import matchScope
+
+
+def test_rfc2396():
+    target = "onvif://www.onvif.org/location/country/china?x=1"
+    for matchBy in (None, "", MATCH_BY_URI):
+        assert matchScope("onvif://www.onvif.org", target, matchBy)
+        assert matchScope("onvif://www.onvif.org/location", target, matchBy)
+        assert matchScope("ONVIF://WWW.ONVIF.ORG/location/", target, matchBy)
+        assert matchScope("onvif://www.onvif.org/location/country/china", target, matchBy)
+        assert matchScope("onvif://www.onvif.org/location/%63ountry", target, matchBy)
+        assert not matchScope("onvif://www.onvif.org/loc", target, matchBy)
+        assert not matchScope("onvif://www.onvif.org/Location", target, matchBy)
+        assert not matchScope("onvif://onvif.org/location", target, matchBy)
+        assert not matchScope("http://www.onvif.org/location", target, matchBy)
+        assert not matchScope("onvif://www.onvif.org/location/../location", target, matchBy)
+
+
+def test_uuid():
+    target = "uuid:1f7a0c32-4ab6-11ea-b77f-2e728ce88125"
+    assert matchScope("urn:uuid:1F7A0C32-4AB6-11EA-B77F-2E728CE88125", target, MATCH_BY_UUID)
+    assert matchScope("uuid:1f7a0c324ab611eab77f2e728ce88125", target, MATCH_BY_UUID)
+    assert not matchScope("uuid:1f7a0c32-4ab6-11ea-b77f-2e728ce88126", target, MATCH_BY_UUID)
+    assert not matchScope("uuid:1f7a0c32", target, MATCH_BY_UUID)
+
+
+def test_ldap():
+    target = "ldap://ldap.example.com/ou=engineering,o=examplecom,c=us"
+    assert matchScope("ldap://LDAP.example.com/o=examplecom, c=us", target, MATCH_BY_LDAP)
+    assert matchScope(target, target, MATCH_BY_LDAP)
+    assert not matchScope("ldap://ldap.example.com/ou=engineering", target, MATCH_BY_LDAP)
+    assert not matchScope("ldap://other.example.com/c=us", target, MATCH_BY_LDAP)
+    assert not matchScope("http://ldap.example.com/c=us", target, MATCH_BY_LDAP)
+
+
+def test_strcmp0_and_unknown_rule():
+    assert matchScope("http://example.com/a", "http://example.com/a", MATCH_BY_STRCMP)
+    assert not matchScope("http://example.com/a", "http://Example.com/a", MATCH_BY_STRCMP)
+    assert not matchScope("http://example.com/a", "http://example.com/a/b", MATCH_BY_STRCMP)
+    assert not ScopeMatcher(Scope("http://example.com/a", "urn:unknown")).matches(Scope("http://example.com/a"))
+
+
+def test_index_agrees_with_matcher():
+    values = ["onvif://www.onvif.org/location/country/china",
+              "onvif://www.onvif.org/location/city/beijing",
+              "onvif://www.onvif.org/location/",
+              "uuid:1f7a0c32-4ab6-11ea-b77f-2e728ce88125",
+              "ldap:///ou=engineering,o=examplecom,c=us"]
+    index = ScopeIndex()
+    for i, value in enumerate(values):
+        index.add(Scope(value), i)
+    index.add(Scope(values[0]), 0)
+
+    probes = [Scope("onvif://www.onvif.org/location"),
+              Scope("onvif://www.onvif.org/location/city"),
+              Scope("onvif://www.onvif.org/location/city/beijing/x"),
+              Scope("urn:uuid:1f7a0c32-4ab6-11ea-b77f-2e728ce88125", MATCH_BY_UUID),
+              Scope("ldap:///c=us", MATCH_BY_LDAP),
+              Scope(values[2], MATCH_BY_STRCMP)]
+    for probe in probes:
+        matcher = ScopeMatcher(probe)
+        expected = {i for i, value in enumerate(values) if matcher.matches(Scope(value))}
+        assert set(index.find(probe)) == expected
+
+    index.remove(Scope(values[0]), 0)
+    assert 0 in index.find(probes[0])
+    index.remove(Scope(values[0]), 0)
+    assert set(index.find(probes[0])) == {1, 2}
+    for i, value in enumerate(values[1:], 1):
+        index.remove(Scope(value), i)
+    assert not index._indexes[MATCH_BY_URI]._root.children
+
+
+def test_value_objects():
+    "scopes & qualified names are hashable values"
+    assert Scope("onvif://www.onvif.org/name/x") == Scope("onvif://www.onvif.org/name/x", "")
+    assert Scope("onvif://www.onvif.org/name/x") != Scope("onvif://www.onvif.org/name/x", MATCH_BY_STRCMP)
+    assert len({Scope("onvif://a/b"), Scope("onvif://a/b"), Scope("onvif://a/c")}) == 2
+
+    assert QName("http://example.com/ns", "Device", "a") == QName("http://example.com/ns", "Device", "b")
+    assert QName("http://example.com/ns", "Device") != QName("http://example.com/other", "Device")
+    assert len({QName("http://example.com/ns", "Device"), QName("http://example.com/ns", "Device")}) == 1
+
+
+def test_shared_parsed_values():
+    "the types & scopes of received messages share instances and strings"
+    service = Service([QName("http://example.com/ns", "Device", "dn")],
+                      [Scope("onvif://www.onvif.org/type/video_encoder")], [], "urn:uuid:1", 1)
+    first, second = (parseSOAPMessage(createSOAPMessage(constructHello(service)), "127.0.0.1")
+                     for i in range(2))
+
+    assert first.getTypes()[0] is second.getTypes()[0]
+    assert first.getScopes()[0] is second.getScopes()[0]
+    assert first.getTypes()[0].getNamespace() is QName("http://example.com/ns", "x").getNamespace()
@@ -0,0 +1,81 @@
+import ipaddress
+import socket
+
+import wsdiscovery.service
+import wsdiscovery.util
+from wsdiscovery.service import Service
+from wsdiscovery.util import LocalAddresses
+
+V4 = [ipaddress.ip_address("192.0.2.10")]
+V6 = [ipaddress.ip_address("2001:db8::10%2")]
+
+
+def _patchAddrs(monkeypatch):
+    calls = []
+
+    def getNetworkAddrs(family):
+        calls.append(family)
+        return list(V4 if family == socket.AF_INET else V6)
+
+    addrs = LocalAddresses()
+    monkeypatch.setattr(wsdiscovery.util, "_getNetworkAddrs", getNetworkAddrs)
+    monkeypatch.setattr(wsdiscovery.service, "localAddresses", addrs)
+    return addrs, calls
+
+
+def test_ip_expansion(monkeypatch):
+    _patchAddrs(monkeypatch)
+    service = Service([], [], ["http://{ip}:8080/onvif", "http://example.com/"], "urn:uuid:1", 0)
+
+    assert service.getXAddrs() == ["http://192.0.2.10:8080/onvif",
+                                   "http://[2001:db8::10]:8080/onvif",
+                                   "http://example.com/"]
+
+
+def test_expansion_cached_while_monitored(monkeypatch):
+    addrs, calls = _patchAddrs(monkeypatch)
+    service = Service([], [], ["http://{ip}/"], "urn:uuid:1", 0)
+
+    addrs.startMonitoring(socket.AF_INET, V4)
+    addrs.startMonitoring(socket.AF_INET6, V6)
+    del calls[:]
+    first = service.getXAddrs()
+    assert service.getXAddrs() == first
+    assert calls == []
+
+    addrs.update(socket.AF_INET, V4 + [ipaddress.ip_address("198.51.100.1")])
+    assert "http://198.51.100.1/" in service.getXAddrs()
+
+    service.setXAddrs(["http://{ip}:80/"])
+    assert service.getXAddrs()[0] == "http://192.0.2.10:80/"
+    assert calls == []
+
+    addrs.stopMonitoring(socket.AF_INET)
+    service.getXAddrs()
+    assert calls == [socket.AF_INET]
+
+
+def test_expansion_cached_while_unmonitored(monkeypatch):
+    "addresses of families without a monitor are enumerated again only once their snapshot is old"
+    addrs, calls = _patchAddrs(monkeypatch)
+    now = [1000.0]
+    monkeypatch.setattr(wsdiscovery.util.time, "monotonic", lambda: now[0])
+    addrs.startMonitoring(socket.AF_INET, V4)  # e.g. on a host without IPv6
+    service = Service([], [], ["http://{ip}/"], "urn:uuid:1", 0)
+
+    first = service.getXAddrs()
+    assert service.getXAddrs() == first
+    assert calls == [socket.AF_INET6]
+
+    now[0] += wsdiscovery.util.UNMONITORED_ADDRESSES_MAX_AGE
+    generation = addrs.getGeneration()
+    assert service.getXAddrs() == first
+    assert calls == [socket.AF_INET6] * 2
+
+    V6.append(ipaddress.ip_address("2001:db8::11"))
+    try:
+        now[0] += wsdiscovery.util.UNMONITORED_ADDRESSES_MAX_AGE
+        assert "http://[2001:db8::11]/" in service.getXAddrs()
+        assert addrs.getGeneration() != generation
+    finally:
+        V6.pop()
@@ -0,0 +1,50 @@
+from .fixtures import probe_response
+from wsdiscovery.discovery import ReplayWSDiscovery, ThreadedWSDiscovery
+from wsdiscovery.publishing import ThreadedWSPublishing
+from wsdiscovery.qname import QName
+from wsdiscovery.tracing import TRACE_RECEIVED, TRACE_PARSED, TRACE_DUPLICATE, TRACE_DISPATCHED, \
+                                TRACE_HANDLED, TRACE_ENQUEUED, TRACE_SENT, TRACE_FINISHED
+
+
+def test_receive_path(probe_response):
+    data, host = probe_response
+    events = []
+    wsd = ReplayWSDiscovery()
+    wsd.addTraceHook(events.append)
+    wsd.start()
+    wsd.replayDatagram(data, (host, 3702))
+    wsd.replayDatagram(data, (host, 3702))
+    wsd.stop()
+
+    assert [event.event for event in events] == [
+        TRACE_RECEIVED, TRACE_PARSED, TRACE_DISPATCHED, TRACE_HANDLED,
+        TRACE_RECEIVED, TRACE_DUPLICATE]
+    assert events[0].messageId is None and events[0].detail == len(data)
+    assert len({event.messageId for event in events if event.event != TRACE_RECEIVED}) == 1
+    assert events[3].detail == "_handle_probematches"
+    timestamps = [event.timestamp for event in events]
+    assert timestamps == sorted(timestamps)
+
+
+def test_probe_to_match():
+    "a Probe is correlated with its Probe Match by RelatesTo"
+    ttype = QName("http://example.com/tracing", "Device")
+    wsp = ThreadedWSPublishing()
+    wsp.start()
+    wsp.publishService([ttype], [], ["http://127.0.0.1:8080/"])
+
+    events = []
+    wsd = ThreadedWSDiscovery()
+    wsd.addTraceHook(events.append)
+    wsd.start()
+    found = list(wsd.iterServices(types=[ttype], timeout=5, max_results=1))
+    wsd.stop()
+    wsp.stop()
+
+    assert len(found) == 1
+    probe = next(e for e in events if e.event == TRACE_ENQUEUED and e.action.endswith("/Probe"))
+    match = next(e for e in events if e.event == TRACE_HANDLED and e.relatesTo == probe.messageId)
+    assert match.timestamp > probe.timestamp
+    assert any(e.event == TRACE_SENT and e.messageId == probe.messageId for e in events)
+    finished = [e for e in events if e.event == TRACE_FINISHED and e.messageId == probe.messageId]
+    assert all(e.detail >= 1 for e in finished)
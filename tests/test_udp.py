@@ -0,0 +1,48 @@
+import time
+
+import wsdiscovery.udp
+from wsdiscovery.actions import constructProbe, constructResolve
+from wsdiscovery.udp import UDPMessage
+
+
+def test_payload_serialized_once(monkeypatch):
+    "repeats & messages sharing a payload serialize the envelope only once"
+
+    calls = []
+    createSOAPMessage = wsdiscovery.udp.createSOAPMessage
+
+    def counting_create(env):
+        calls.append(env)
+        return createSOAPMessage(env)
+
+    monkeypatch.setattr(wsdiscovery.udp, "createSOAPMessage", counting_create)
+
+    env = constructProbe(None, None)
+    msg_v4 = UDPMessage(env, "239.255.255.250", 3702, UDPMessage.MULTICAST)
+    msg_v6 = UDPMessage(env, "FF02::C", 3702, UDPMessage.MULTICAST,
+                        payload=msg_v4.getPayload())
+
+    data = msg_v4.getData()
+    for _ in range(3):
+        assert msg_v4.getData() is data
+        assert msg_v6.getData() is data
+    assert len(calls) == 1
+
+    msg_v6.setEnv(constructResolve("urn:uuid:1"))
+    assert msg_v4.getData() != data
+    assert len(calls) == 2
+
+
+def test_deadlines_ignore_wall_clock_steps(monkeypatch):
+    "a step of the system clock neither sends a retransmission early nor stalls it"
+    msg = UDPMessage(constructProbe(None, None), "239.255.255.250", 3702, UDPMessage.MULTICAST,
+                     initialDelay=500)
+    wallClock = time.time()
+
+    monkeypatch.setattr(time, "time", lambda: wallClock + 3600)
+    assert not msg.canSend()
+
+    monkeypatch.setattr(time, "time", lambda: wallClock - 3600)
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 1)
+    assert msg.canSend()
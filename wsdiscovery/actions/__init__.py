@@ -6,7 +6,16 @@ from .bye import NS_ACTION_BYE, constructBye, createByeMessage, parseByeMessage
 from .hello import NS_ACTION_HELLO, constructHello, createHelloMessage, parseHelloMessage
 from .probe import NS_ACTION_PROBE, constructProbe, createProbeMessage, parseProbeMessage
 from .probematch import NS_ACTION_PROBE_MATCH, constructProbeMatch, createProbeMatchMessage, parseProbeMatchMessage
-from .probematch import ProbeResolveMatch
+from .probematch import ProbeResolveMatch, renderProbeMatchFragments, renderProbeMatchesBody
 from .resolve import NS_ACTION_RESOLVE, constructResolve, createResolveMessage, parseResolveMessage
 from .resolvematch import NS_ACTION_RESOLVE_MATCH, constructResolveMatch, createResolveMatchMessage, parseResolveMatchMessage
+from .registry import Action, registerAction, unregisterAction, getAction, getActions
+
+registerAction(NS_ACTION_PROBE, createProbeMessage, parseProbeMessage, "_handle_probe")
+registerAction(NS_ACTION_PROBE_MATCH, createProbeMatchMessage, parseProbeMatchMessage, "_handle_probematches")
+registerAction(NS_ACTION_RESOLVE, createResolveMessage, parseResolveMessage, "_handle_resolve")
+registerAction(NS_ACTION_RESOLVE_MATCH, createResolveMatchMessage, parseResolveMatchMessage,
+               "_handle_resolvematches")
+registerAction(NS_ACTION_HELLO, createHelloMessage, parseHelloMessage, "_handle_hello")
+registerAction(NS_ACTION_BYE, createByeMessage, parseByeMessage, "_handle_bye")
 
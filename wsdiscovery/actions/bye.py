@@ -2,10 +2,9 @@
 
 import uuid
 from ..namespaces import NS_ADDRESSING, NS_DISCOVERY, NS_ACTION_BYE, NS_ADDRESS_ALL
-from ..envelope import SoapEnvelope
-from ..util import createSkelSoapMessage, getBodyEl, getHeaderEl, addElementWithText, \
-                   addTypes, addScopes, getDocAsString, getScopes, addEPR, \
-                   _parseAppSequence
+from ..envelope import SoapEnvelope, LazySoapEnvelope
+from ..util import _parseAppSequence, _parseEPR, _getHeaderAndBody, _getBodyChild
+from ..serializer import renderEnvelope, renderElement, renderAppSequence, renderEPR
 
 
 def constructBye(service):
@@ -23,39 +22,29 @@ def constructBye(service):
 
 def createByeMessage(env):
     "serialize a SOAP envelope object into a string"
-    doc = createSkelSoapMessage(NS_ACTION_BYE)
-
-    bodyEl = getBodyEl(doc)
-    headerEl = getHeaderEl(doc)
-
-    addElementWithText(doc, headerEl, "a:MessageID", NS_ADDRESSING, env.getMessageId())
-    addElementWithText(doc, headerEl, "a:To", NS_ADDRESSING, env.getTo())
-
-    appSeqEl = doc.createElementNS(NS_DISCOVERY, "d:AppSequence")
-    appSeqEl.setAttribute("InstanceId", env.getInstanceId())
-    appSeqEl.setAttribute("MessageNumber", env.getMessageNumber())
-    headerEl.appendChild(appSeqEl)
-
-    byeEl = doc.createElementNS(NS_DISCOVERY, "d:Bye")
-    addEPR(doc, byeEl, env.getEPR())
-    bodyEl.appendChild(byeEl)
-
-    return getDocAsString(doc)
+    header = "".join((renderElement("a:MessageID", env.getMessageId()),
+                      renderElement("a:To", env.getTo()),
+                      renderAppSequence(env)))
+    body = "<d:Bye>%s</d:Bye>" % renderEPR(env.getEPR())
+    return renderEnvelope(NS_ACTION_BYE, header, body)
 
 
 def parseByeMessage(dom):
-    "parse a XML message into a SOAP envelope object"
-    env = SoapEnvelope()
+    "parse a XML message into a SOAP envelope object, whose body is decoded on demand"
+    headerEl, bodyEl = _getHeaderAndBody(dom)
+    env = LazySoapEnvelope(_decodeByeBody, _getBodyChild(bodyEl, "Bye"))
     env.setAction(NS_ACTION_BYE)
 
-    env.setMessageId(dom.getElementsByTagNameNS(NS_ADDRESSING, "MessageID")[0].firstChild.data.strip())
-    env.setTo(dom.getElementsByTagNameNS(NS_ADDRESSING, "To")[0].firstChild.data.strip())
-
-    _parseAppSequence(dom, env)
+    env.setMessageId(headerEl.findText(NS_ADDRESSING, "MessageID"))
+    env.setTo(headerEl.findText(NS_ADDRESSING, "To"))
 
-    env.setEPR(dom.getElementsByTagNameNS(NS_ADDRESSING, "Address")[0].firstChild.data.strip())
+    _parseAppSequence(headerEl, env)
 
     return env
 
 
+def _decodeByeBody(byeEl, env):
+    env.setEPR(_parseEPR(byeEl))
+
+
 
@@ -2,10 +2,11 @@
 
 import uuid
 from ..namespaces import NS_ADDRESSING, NS_DISCOVERY, NS_ACTION_HELLO, NS_ADDRESS_ALL
-from ..envelope import SoapEnvelope
-from ..util import createSkelSoapMessage, getBodyEl, getHeaderEl, addElementWithText, \
-                   addTypes, addScopes, getDocAsString, getScopes, getQNameFromValue, \
-                   addEPR, addXAddrs, _parseAppSequence, getTypes, getXAddrs
+from ..envelope import SoapEnvelope, LazySoapEnvelope
+from ..util import getScopes, getQNameFromValue, _parseAppSequence, getTypes, getXAddrs, \
+                   _parseEPR, _getHeaderAndBody, _getBodyChild
+from ..serializer import NamespacePrefixes, renderEnvelope, renderElement, renderRelatesTo, \
+                         renderAppSequence, renderServiceInfo
 
 
 def constructHello(service):
@@ -28,67 +29,53 @@ def constructHello(service):
 
 def createHelloMessage(env):
     "serialize a SOAP envelope object into a string"
-    doc = createSkelSoapMessage(NS_ACTION_HELLO)
-
-    bodyEl = getBodyEl(doc)
-    headerEl = getHeaderEl(doc)
-
-    addElementWithText(doc, headerEl, "a:MessageID", NS_ADDRESSING, env.getMessageId())
-
+    headerParts = [renderElement("a:MessageID", env.getMessageId())]
     if len(env.getRelatesTo()) > 0:
-        addElementWithText(doc, headerEl, "a:RelatesTo", NS_ADDRESSING, env.getRelatesTo())
-        relatesToEl = headerEl.getElementsByTagNameNS(NS_ADDRESSING, "RelatesTo")[0]
-        relatesToEl.setAttribute("RelationshipType", "d:Suppression")
-
-    addElementWithText(doc, headerEl, "a:To", NS_ADDRESSING, env.getTo())
-
-    appSeqEl = doc.createElementNS(NS_DISCOVERY, "d:AppSequence")
-    appSeqEl.setAttribute("InstanceId", env.getInstanceId())
-    appSeqEl.setAttribute("MessageNumber", env.getMessageNumber())
-    headerEl.appendChild(appSeqEl)
+        headerParts.append(renderRelatesTo(env.getRelatesTo(), "d:Suppression"))
+    headerParts.append(renderElement("a:To", env.getTo()))
+    headerParts.append(renderAppSequence(env))
 
-    helloEl = doc.createElementNS(NS_DISCOVERY, "d:Hello")
-    addEPR(doc, helloEl, env.getEPR())
-    addTypes(doc, helloEl, env.getTypes())
-    addScopes(doc, helloEl, env.getScopes())
-    addXAddrs(doc, helloEl, env.getXAddrs())
-    addElementWithText(doc, helloEl, "d:MetadataVersion", NS_DISCOVERY, env.getMetadataVersion())
+    prefixes = NamespacePrefixes()
+    body = "<d:Hello>%s</d:Hello>" % renderServiceInfo(
+        env.getEPR(), env.getTypes(), env.getScopes(), env.getXAddrs(),
+        env.getMetadataVersion(), prefixes)
 
-    bodyEl.appendChild(helloEl)
-
-    return getDocAsString(doc)
+    return renderEnvelope(NS_ACTION_HELLO, "".join(headerParts), body, prefixes)
 
 
 def parseHelloMessage(dom):
-    "parse a XML message into a SOAP envelope object"
-    env = SoapEnvelope()
+    "parse a XML message into a SOAP envelope object, whose body is decoded on demand"
+    headerEl, bodyEl = _getHeaderAndBody(dom)
+    env = LazySoapEnvelope(_decodeHelloBody, _getBodyChild(bodyEl, "Hello"))
     env.setAction(NS_ACTION_HELLO)
 
-    env.setMessageId(dom.getElementsByTagNameNS(NS_ADDRESSING, "MessageID")[0].firstChild.data.strip())
-    env.setTo(dom.getElementsByTagNameNS(NS_ADDRESSING, "To")[0].firstChild.data.strip())
+    env.setMessageId(headerEl.findText(NS_ADDRESSING, "MessageID"))
+    env.setTo(headerEl.findText(NS_ADDRESSING, "To"))
 
-    _parseAppSequence(dom, env)
+    _parseAppSequence(headerEl, env)
 
-    relatesToNodes = dom.getElementsByTagNameNS(NS_ADDRESSING, "RelatesTo")
-    if len(relatesToNodes) > 0:
-        env.setRelatesTo(relatesToNodes[0].firstChild.data.strip())
+    relatesToEl = headerEl.find(NS_ADDRESSING, "RelatesTo")
+    if relatesToEl is not None:
+        env.setRelatesTo(relatesToEl.getText())
         env.setRelationshipType(getQNameFromValue( \
-            relatesToNodes[0].getAttribute("RelationshipType"), relatesToNodes[0]))
+            relatesToEl.getAttribute("RelationshipType"), relatesToEl))
 
-    env.setEPR(dom.getElementsByTagNameNS(NS_ADDRESSING, "Address")[0].firstChild.data.strip())
+    return env
 
-    typeNodes = dom.getElementsByTagNameNS(NS_DISCOVERY, "Types")
-    if len(typeNodes) > 0:
-        env.setTypes(getTypes(typeNodes[0]))
 
-    scopeNodes = dom.getElementsByTagNameNS(NS_DISCOVERY, "Scopes")
-    if len(scopeNodes) > 0:
-        env.setScopes(getScopes(scopeNodes[0]))
+def _decodeHelloBody(helloEl, env):
+    env.setEPR(_parseEPR(helloEl))
 
-    xNodes = dom.getElementsByTagNameNS(NS_DISCOVERY, "XAddrs")
-    if len(xNodes) > 0:
-        env.setXAddrs(getXAddrs(xNodes[0]))
+    typeEl = helloEl.find(NS_DISCOVERY, "Types")
+    if typeEl is not None:
+        env.setTypes(getTypes(typeEl))
 
-    env.setMetadataVersion(dom.getElementsByTagNameNS(NS_DISCOVERY, "MetadataVersion")[0].firstChild.data.strip())
+    scopeEl = helloEl.find(NS_DISCOVERY, "Scopes")
+    if scopeEl is not None:
+        env.setScopes(getScopes(scopeEl))
 
-    return env
+    xAddrsEl = helloEl.find(NS_DISCOVERY, "XAddrs")
+    if xAddrsEl is not None:
+        env.setXAddrs(getXAddrs(xAddrsEl))
+
+    env.setMetadataVersion(helloEl.findText(NS_DISCOVERY, "MetadataVersion"))
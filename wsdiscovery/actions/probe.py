@@ -1,12 +1,12 @@
 "Serialize & parse WS-Discovery Probe SOAP messages"
 
 import uuid
-from xml.dom import minidom
 
 from ..namespaces import NS_ADDRESSING, NS_DISCOVERY, NS_ACTION_PROBE, NS_ADDRESS_ALL
-from ..envelope import SoapEnvelope
-from ..util import createSkelSoapMessage, getBodyEl, getHeaderEl, addElementWithText, \
-                   addTypes, getTypes, addScopes, getDocAsString, getScopes
+from ..envelope import SoapEnvelope, LazySoapEnvelope
+from ..util import getTypes, getScopes, _getHeaderAndBody, _getBodyChild
+from ..serializer import NamespacePrefixes, renderEnvelope, renderElement, renderTypes, \
+                         renderScopes
 
 
 def constructProbe(types, scopes):
@@ -24,50 +24,45 @@ def constructProbe(types, scopes):
 def createProbeMessage(env):
     "serialize a SOAP envelope object into a string"
 
-    doc = createSkelSoapMessage(NS_ACTION_PROBE)
-
-    bodyEl = getBodyEl(doc)
-    headerEl = getHeaderEl(doc)
-
-    addElementWithText(doc, headerEl, "a:MessageID", NS_ADDRESSING, env.getMessageId())
-    addElementWithText(doc, headerEl, "a:To", NS_ADDRESSING, env.getTo())
-
+    headerParts = [renderElement("a:MessageID", env.getMessageId()),
+                   renderElement("a:To", env.getTo())]
     if len(env.getReplyTo()) > 0:
-        addElementWithText(doc, headerEl, "a:ReplyTo", NS_ADDRESSING, env.getReplyTo())
+        headerParts.append(renderElement("a:ReplyTo", env.getReplyTo()))
 
-    probeEl = doc.createElementNS(NS_DISCOVERY, "d:Probe")
-    bodyEl.appendChild(probeEl)
+    prefixes = NamespacePrefixes()
+    body = "<d:Probe>%s%s</d:Probe>" % (renderTypes(env.getTypes(), prefixes),
+                                         renderScopes(env.getScopes()))
 
-    addTypes(doc, probeEl, env.getTypes())
-    addScopes(doc, probeEl, env.getScopes())
-
-    return getDocAsString(doc)
+    return renderEnvelope(NS_ACTION_PROBE, "".join(headerParts), body, prefixes)
 
 
 def parseProbeMessage(dom):
-    "parse a XML message into a SOAP envelope object"
+    "parse a XML message into a SOAP envelope object, whose body is decoded on demand"
 
-    env = SoapEnvelope()
+    headerEl, bodyEl = _getHeaderAndBody(dom)
+    env = LazySoapEnvelope(_decodeProbeBody, _getBodyChild(bodyEl, "Probe"))
     env.setAction(NS_ACTION_PROBE)
-    env.setMessageId(dom.getElementsByTagNameNS(NS_ADDRESSING, "MessageID")[0].firstChild.data.strip())
 
-    replyToNodes = dom.getElementsByTagNameNS(NS_ADDRESSING, "ReplyTo")
-    if len(replyToNodes) > 0 and \
-       isinstance(replyToNodes[0].firstChild, minidom.Text):
-        env.setReplyTo(replyToNodes[0].firstChild.data.strip())
+    env.setMessageId(headerEl.findText(NS_ADDRESSING, "MessageID"))
 
-    env.setTo(dom.getElementsByTagNameNS(NS_ADDRESSING, "To")[0].firstChild.data.strip())
+    replyToEl = headerEl.find(NS_ADDRESSING, "ReplyTo")
+    if replyToEl is not None:
+        env.setReplyTo(replyToEl.getText())
 
-    typeNodes = dom.getElementsByTagNameNS(NS_DISCOVERY, "Types")
-    if len(typeNodes) > 0:
-        env.getTypes().extend(getTypes(typeNodes[0]))
-
-    scopeNodes = dom.getElementsByTagNameNS(NS_DISCOVERY, "Scopes")
-    if len(scopeNodes) > 0:
-        env.getScopes().extend(getScopes(scopeNodes[0]))
+    env.setTo(headerEl.findText(NS_ADDRESSING, "To"))
 
     return env
 
 
+def _decodeProbeBody(probeEl, env):
+    typeEl = probeEl.find(NS_DISCOVERY, "Types")
+    if typeEl is not None:
+        env.setTypes(getTypes(typeEl))
+
+    scopeEl = probeEl.find(NS_DISCOVERY, "Scopes")
+    if scopeEl is not None:
+        env.setScopes(getScopes(scopeEl))
+
+
 
 
@@ -5,14 +5,18 @@ import random
 import time
 
 from ..namespaces import NS_ADDRESSING, NS_DISCOVERY, NS_ACTION_PROBE_MATCH, NS_ADDRESS_UNKNOWN
-from ..envelope import SoapEnvelope
-from ..util import createSkelSoapMessage, getBodyEl, getHeaderEl, addElementWithText, \
-                   addTypes, addScopes, getDocAsString, getScopes, _parseAppSequence, \
-                   addEPR, getXAddrs, addXAddrs, getTypes, _generateInstanceId
+from ..envelope import SoapEnvelope, LazySoapEnvelope
+from ..util import getScopes, _parseAppSequence, getXAddrs, getTypes, _generateInstanceId, \
+                   _parseEPR, _getHeaderAndBody, _getBodyChild
+from ..serializer import NamespacePrefixes, renderEnvelope, renderElement, renderRelatesTo, \
+                         renderAppSequence, renderServiceInfo
 
 
-def constructProbeMatch(services, relatesTo):
-    "construct an envelope that represents a ``Probe Match`` message"
+def constructProbeMatch(services, relatesTo, probeMatches=None):
+    """construct an envelope that represents a ``Probe Match`` message
+
+    probeMatches may be given if already built from the services; the
+    envelope then shares the list instead of building a new one"""
 
     env = SoapEnvelope()
     env.setAction(NS_ACTION_PROBE_MATCH)
@@ -23,6 +27,10 @@ def constructProbeMatch(services, relatesTo):
     env.setMessageNumber("1")
     env.setRelatesTo(relatesTo)
 
+    if probeMatches is not None:
+        env.setProbeResolveMatches(probeMatches)
+        return env
+
     prbs =  env.getProbeResolveMatches()
     for srv in services:
         prb = ProbeResolveMatch(srv.getEPR(), srv.getTypes(), srv.getScopes(), \
@@ -31,82 +39,98 @@ def constructProbeMatch(services, relatesTo):
     return env
 
 
-def createProbeMatchMessage(env):
-    "serialize a SOAP envelope object into a string"
+def renderProbeMatchFragments(probeMatches, prefixes):
+    "render the ``ProbeMatch`` elements of probe matches, declaring type namespaces in prefixes"
+    return ["<d:ProbeMatch>%s</d:ProbeMatch>" % renderServiceInfo(
+                probeMatch.getEPR(), probeMatch.getTypes(), probeMatch.getScopes(),
+                probeMatch.getXAddrs(), probeMatch.getMetadataVersion(), prefixes)
+            for probeMatch in probeMatches]
+
+
+def renderProbeMatchesBody(probeMatches, fragments=None, prefixes=None):
+    """render the body of a ``Probe Match`` message; return it with the
+    namespace prefixes it uses, for createProbeMatchMessage()
 
-    doc = createSkelSoapMessage(NS_ACTION_PROBE_MATCH)
+    fragments may be given as rendered by renderProbeMatchFragments() with prefixes"""
 
-    bodyEl = getBodyEl(doc)
-    headerEl = getHeaderEl(doc)
+    if fragments is None:
+        prefixes = NamespacePrefixes()
+        fragments = renderProbeMatchFragments(probeMatches, prefixes)
+    return "<d:ProbeMatches>%s</d:ProbeMatches>" % "".join(fragments), prefixes
 
-    addElementWithText(doc, headerEl, "a:MessageID", NS_ADDRESSING, env.getMessageId())
-    addElementWithText(doc, headerEl, "a:RelatesTo", NS_ADDRESSING, env.getRelatesTo())
-    addElementWithText(doc, headerEl, "a:To", NS_ADDRESSING, env.getTo())
 
-    appSeqEl = doc.createElementNS(NS_DISCOVERY, "d:AppSequence")
-    appSeqEl.setAttribute("InstanceId", env.getInstanceId())
-    appSeqEl.setAttribute("MessageNumber", env.getMessageNumber())
-    headerEl.appendChild(appSeqEl)
+def createProbeMatchMessage(env, renderedBody=None):
+    """serialize a SOAP envelope object into a string
 
-    probeMatchesEl = doc.createElementNS(NS_DISCOVERY, "d:ProbeMatches")
-    probeMatches = env.getProbeResolveMatches()
-    for probeMatch in probeMatches:
-        probeMatchEl = doc.createElementNS(NS_DISCOVERY, "d:ProbeMatch")
-        addEPR(doc, probeMatchEl, probeMatch.getEPR())
-        addTypes(doc, probeMatchEl, probeMatch.getTypes())
-        addScopes(doc, probeMatchEl, probeMatch.getScopes())
-        addXAddrs(doc, probeMatchEl, probeMatch.getXAddrs())
-        addElementWithText(doc, probeMatchEl, "d:MetadataVersion", NS_DISCOVERY, probeMatch.getMetadataVersion())
-        probeMatchesEl.appendChild(probeMatchEl)
+    renderedBody may be given as returned by renderProbeMatchesBody() for
+    the probe matches of the envelope, so that only the header is rendered"""
 
+    header = "".join((renderElement("a:MessageID", env.getMessageId()),
+                      renderRelatesTo(env.getRelatesTo()),
+                      renderElement("a:To", env.getTo()),
+                      renderAppSequence(env)))
 
-    bodyEl.appendChild(probeMatchesEl)
+    if renderedBody is None:
+        renderedBody = renderProbeMatchesBody(env.getProbeResolveMatches())
+    body, prefixes = renderedBody
 
-    return getDocAsString(doc)
+    return renderEnvelope(NS_ACTION_PROBE_MATCH, header, body, prefixes)
 
 
 def parseProbeMatchMessage(dom):
-    "parse a XML message into a SOAP envelope object"
+    "parse a XML message into a SOAP envelope object, whose body is decoded on demand"
 
-    env = SoapEnvelope()
+    headerEl, bodyEl = _getHeaderAndBody(dom)
+    env = LazySoapEnvelope(_decodeProbeMatchBody, _getBodyChild(bodyEl, "ProbeMatches"))
     env.setAction(NS_ACTION_PROBE_MATCH)
 
-    env.setMessageId(dom.getElementsByTagNameNS(NS_ADDRESSING, "MessageID")[0].firstChild.data.strip())
-    env.setRelatesTo(dom.getElementsByTagNameNS(NS_ADDRESSING, "RelatesTo")[0].firstChild.data.strip())
+    env.setMessageId(headerEl.findText(NS_ADDRESSING, "MessageID"))
+    env.setRelatesTo(headerEl.findText(NS_ADDRESSING, "RelatesTo"))
     # Even though To is required in WS-Discovery, some devices omit it
-    elem = dom.getElementsByTagNameNS(NS_ADDRESSING, "To").item(0)
-    if elem:
-        env.setTo(elem.firstChild.data.strip())
+    toEl = headerEl.find(NS_ADDRESSING, "To")
+    if toEl is not None:
+        env.setTo(toEl.getText())
 
-    _parseAppSequence(dom, env)
+    _parseAppSequence(headerEl, env)
 
-    pmNodes = dom.getElementsByTagNameNS(NS_DISCOVERY, "ProbeMatch")
-    for node in pmNodes:
-        epr = node.getElementsByTagNameNS(NS_ADDRESSING, "Address")[0].firstChild.data.strip()
+    return env
 
-        types = []
-        typeNodes = node.getElementsByTagNameNS(NS_DISCOVERY, "Types")
-        if len(typeNodes) > 0:
-            types = getTypes(typeNodes[0])
 
-        scopes = []
-        scopeNodes = node.getElementsByTagNameNS(NS_DISCOVERY, "Scopes")
-        if len(scopeNodes) > 0:
-            scopes = getScopes(scopeNodes[0])
+def _decodeProbeMatchBody(probeMatchesEl, env):
+    env.setProbeResolveMatches([_parseProbeResolveMatch(node, False)
+                                for node in probeMatchesEl.findAll(NS_DISCOVERY, "ProbeMatch")])
 
-        xAddrs = []
-        xAddrNodes = node.getElementsByTagNameNS(NS_DISCOVERY, "XAddrs")
-        if len(xAddrNodes) > 0:
-            xAddrs = getXAddrs(xAddrNodes[0])
 
-        mdv = node.getElementsByTagNameNS(NS_DISCOVERY, "MetadataVersion")[0].firstChild.data.strip()
-        env.getProbeResolveMatches().append(ProbeResolveMatch(epr, types, scopes, xAddrs, mdv))
+def _parseProbeResolveMatch(node, requireXAddrs):
+    "parse a ProbeMatch or ResolveMatch element"
+    epr = _parseEPR(node)
 
-    return env
+    types = []
+    typeEl = node.find(NS_DISCOVERY, "Types")
+    if typeEl is not None:
+        types = getTypes(typeEl)
+
+    scopes = []
+    scopeEl = node.find(NS_DISCOVERY, "Scopes")
+    if scopeEl is not None:
+        scopes = getScopes(scopeEl)
+
+    xAddrs = []
+    xAddrsEl = node.find(NS_DISCOVERY, "XAddrs")
+    if xAddrsEl is not None:
+        xAddrs = getXAddrs(xAddrsEl)
+    elif requireXAddrs:
+        raise ValueError("missing XAddrs element in %s" % node.localname)
+
+    mdv = node.findText(NS_DISCOVERY, "MetadataVersion")
+    return ProbeResolveMatch(epr, types, scopes, xAddrs, mdv)
 
 
 
 class ProbeResolveMatch:
+    "a service in a Probe Match or Resolve Match; immutable, equal if all fields are"
+
+    __slots__ = ("_epr", "_types", "_scopes", "_xAddrs", "_metadataVersion")
 
     def __init__(self, epr, types, scopes, xAddrs, metadataVersion):
         self._epr = epr
@@ -130,6 +154,18 @@ class ProbeResolveMatch:
     def getMetadataVersion(self):
         return self._metadataVersion
 
+    def _key(self):
+        return (self._epr, tuple(self._types), tuple(self._scopes), tuple(self._xAddrs),
+                self._metadataVersion)
+
+    def __eq__(self, other):
+        if not isinstance(other, ProbeResolveMatch):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
     def __repr__(self):
         return "EPR: %s\nTypes: %s\nScopes: %s\nXAddrs: %s\nMetadata Version: %s" % \
             (self.getEPR(), self.getTypes(), self.getScopes(),
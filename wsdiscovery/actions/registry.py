@@ -0,0 +1,42 @@
+"""Registry of the message actions the package serializes, parses & handles.
+
+Each action URI maps to its encoder, decoder and the name of the daemon
+method handling it, so that messages are dispatched with a single lookup.
+The WS-Discovery 2005/04 actions are registered by the actions package;
+other actions, such as those of the WS-Discovery 1.1 namespace, are added
+with registerAction().
+"""
+
+from collections import namedtuple
+
+
+class Action(namedtuple("Action", "uri encoder decoder handler")):
+    """codec & handler of a message action
+
+    encoder(env) serializes an envelope of the action into a string;
+    decoder(dom) turns the parsed SOAP envelope Element into an envelope;
+    handler is the name of the daemon method called with (env, addr) for
+    received messages. Any of them may be None.
+    """
+
+
+_actions = {}
+
+
+def registerAction(uri, encoder=None, decoder=None, handler=None):
+    "register, or replace, the codec & handler of an action"
+    _actions[uri] = Action(uri, encoder, decoder, handler)
+
+
+def unregisterAction(uri):
+    del _actions[uri]
+
+
+def getAction(uri):
+    "the Action registered for the URI, None if unknown"
+    return _actions.get(uri)
+
+
+def getActions():
+    "the registered Actions"
+    return list(_actions.values())
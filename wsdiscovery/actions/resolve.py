@@ -3,9 +3,9 @@
 import uuid
 
 from ..namespaces import NS_ADDRESSING, NS_DISCOVERY, NS_ACTION_RESOLVE, NS_ADDRESS_ALL
-from ..envelope import SoapEnvelope
-from ..util import createSkelSoapMessage, getBodyEl, getHeaderEl, addElementWithText, \
-                   addEPR, addTypes, addScopes, getDocAsString, getScopes
+from ..envelope import SoapEnvelope, LazySoapEnvelope
+from ..util import _parseEPR, _getHeaderAndBody, _getBodyChild
+from ..serializer import renderEnvelope, renderElement, renderEPR
 
 
 def constructResolve(epr):
@@ -22,39 +22,35 @@ def constructResolve(epr):
 def createResolveMessage(env):
     "serialize a SOAP envelope object into a string"
 
-    doc = createSkelSoapMessage(NS_ACTION_RESOLVE)
-
-    bodyEl = getBodyEl(doc)
-    headerEl = getHeaderEl(doc)
-
-    addElementWithText(doc, headerEl, "a:MessageID", NS_ADDRESSING, env.getMessageId())
-    addElementWithText(doc, headerEl, "a:To", NS_ADDRESSING, env.getTo())
-
+    headerParts = [renderElement("a:MessageID", env.getMessageId()),
+                   renderElement("a:To", env.getTo())]
     if len(env.getReplyTo()) > 0:
-        addElementWithText(doc, headerEl, "a:ReplyTo", NS_ADDRESSING, env.getReplyTo())
+        headerParts.append(renderElement("a:ReplyTo", env.getReplyTo()))
 
-    resolveEl = doc.createElementNS(NS_DISCOVERY, "d:Resolve")
-    addEPR(doc, resolveEl, env.getEPR())
-    bodyEl.appendChild(resolveEl)
+    body = "<d:Resolve>%s</d:Resolve>" % renderEPR(env.getEPR())
 
-    return getDocAsString(doc)
+    return renderEnvelope(NS_ACTION_RESOLVE, "".join(headerParts), body)
 
 
 def parseResolveMessage(dom):
-    "parse a XML message into a SOAP envelope object"
+    "parse a XML message into a SOAP envelope object, whose body is decoded on demand"
 
-    env = SoapEnvelope()
+    headerEl, bodyEl = _getHeaderAndBody(dom)
+    env = LazySoapEnvelope(_decodeResolveBody, _getBodyChild(bodyEl, "Resolve"))
     env.setAction(NS_ACTION_RESOLVE)
 
-    env.setMessageId(dom.getElementsByTagNameNS(NS_ADDRESSING, "MessageID")[0].firstChild.data.strip())
+    env.setMessageId(headerEl.findText(NS_ADDRESSING, "MessageID"))
 
-    replyToNodes = dom.getElementsByTagNameNS(NS_ADDRESSING, "ReplyTo")
-    if len(replyToNodes) > 0:
-        env.setReplyTo(replyToNodes[0].firstChild.data.strip())
+    replyToEl = headerEl.find(NS_ADDRESSING, "ReplyTo")
+    if replyToEl is not None:
+        env.setReplyTo(replyToEl.getText())
 
-    env.setTo(dom.getElementsByTagNameNS(NS_ADDRESSING, "To")[0].firstChild.data.strip())
-    env.setEPR(dom.getElementsByTagNameNS(NS_ADDRESSING, "Address")[0].firstChild.data.strip())
+    env.setTo(headerEl.findText(NS_ADDRESSING, "To"))
 
     return env
 
 
+def _decodeResolveBody(resolveEl, env):
+    env.setEPR(_parseEPR(resolveEl))
+
+
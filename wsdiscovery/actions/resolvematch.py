@@ -3,12 +3,12 @@
 import uuid
 
 from ..namespaces import NS_ADDRESSING, NS_DISCOVERY, NS_ACTION_RESOLVE_MATCH, NS_ADDRESS_UNKNOWN
-from ..envelope import SoapEnvelope
-from ..util import createSkelSoapMessage, getBodyEl, getHeaderEl, addElementWithText, \
-                   addTypes, getTypes, addScopes, getDocAsString, getScopes, addEPR, \
-                   addXAddrs, getXAddrs, _parseAppSequence
-                   
-from .probematch import ProbeResolveMatch
+from ..envelope import SoapEnvelope, LazySoapEnvelope
+from ..util import _parseAppSequence, _getHeaderAndBody, _getBodyChild
+from ..serializer import NamespacePrefixes, renderEnvelope, renderElement, renderRelatesTo, \
+                         renderAppSequence, renderServiceInfo
+
+from .probematch import ProbeResolveMatch, _parseProbeResolveMatch
 
 
 def constructResolveMatch(service, relatesTo):
@@ -33,69 +33,43 @@ def constructResolveMatch(service, relatesTo):
 def createResolveMatchMessage(env):
     "serialize a SOAP envelope object into a string"
 
-    doc = createSkelSoapMessage(NS_ACTION_RESOLVE_MATCH)
-
-    bodyEl = getBodyEl(doc)
-    headerEl = getHeaderEl(doc)
-
-    addElementWithText(doc, headerEl, "a:MessageID", NS_ADDRESSING, env.getMessageId())
-    addElementWithText(doc, headerEl, "a:RelatesTo", NS_ADDRESSING, env.getRelatesTo())
-    addElementWithText(doc, headerEl, "a:To", NS_ADDRESSING, env.getTo())
+    header = "".join((renderElement("a:MessageID", env.getMessageId()),
+                      renderRelatesTo(env.getRelatesTo()),
+                      renderElement("a:To", env.getTo()),
+                      renderAppSequence(env)))
 
-    appSeqEl = doc.createElementNS(NS_DISCOVERY, "d:AppSequence")
-    appSeqEl.setAttribute("InstanceId", env.getInstanceId())
-    appSeqEl.setAttribute("MessageNumber", env.getMessageNumber())
-    headerEl.appendChild(appSeqEl)
-
-    resolveMatchesEl = doc.createElementNS(NS_DISCOVERY, "d:ResolveMatches")
+    prefixes = NamespacePrefixes()
+    match = ""
     if len(env.getProbeResolveMatches()) > 0:
         resolveMatch = env.getProbeResolveMatches()[0]
-        resolveMatchEl = doc.createElementNS(NS_DISCOVERY, "d:ResolveMatch")
-        addEPR(doc, resolveMatchEl, resolveMatch.getEPR())
-        addTypes(doc, resolveMatchEl, resolveMatch.getTypes())
-        addScopes(doc, resolveMatchEl, resolveMatch.getScopes())
-        addXAddrs(doc, resolveMatchEl, resolveMatch.getXAddrs())
-        addElementWithText(doc, resolveMatchEl, "d:MetadataVersion", NS_DISCOVERY, resolveMatch.getMetadataVersion())
-
-        resolveMatchesEl.appendChild(resolveMatchEl)
-
-    bodyEl.appendChild(resolveMatchesEl)
+        match = "<d:ResolveMatch>%s</d:ResolveMatch>" % renderServiceInfo(
+            resolveMatch.getEPR(), resolveMatch.getTypes(), resolveMatch.getScopes(),
+            resolveMatch.getXAddrs(), resolveMatch.getMetadataVersion(), prefixes)
+    body = "<d:ResolveMatches>%s</d:ResolveMatches>" % match
 
-    return getDocAsString(doc)
+    return renderEnvelope(NS_ACTION_RESOLVE_MATCH, header, body, prefixes)
 
 
 def parseResolveMatchMessage(dom):
-    "parse a XML message into a SOAP envelope object"
+    "parse a XML message into a SOAP envelope object, whose body is decoded on demand"
 
-    env = SoapEnvelope()
+    headerEl, bodyEl = _getHeaderAndBody(dom)
+    env = LazySoapEnvelope(_decodeResolveMatchBody, _getBodyChild(bodyEl, "ResolveMatches"))
     env.setAction(NS_ACTION_RESOLVE_MATCH)
 
-    env.setMessageId(dom.getElementsByTagNameNS(NS_ADDRESSING, "MessageID")[0].firstChild.data.strip())
-    env.setRelatesTo(dom.getElementsByTagNameNS(NS_ADDRESSING, "RelatesTo")[0].firstChild.data.strip())
-    env.setTo(dom.getElementsByTagNameNS(NS_ADDRESSING, "To")[0].firstChild.data.strip())
-
-    _parseAppSequence(dom, env)
-
-    nodes = dom.getElementsByTagNameNS(NS_DISCOVERY, "ResolveMatch")
-    if len(nodes) > 0:
-        node = nodes[0]
-        epr = node.getElementsByTagNameNS(NS_ADDRESSING, "Address")[0].firstChild.data.strip()
+    env.setMessageId(headerEl.findText(NS_ADDRESSING, "MessageID"))
+    env.setRelatesTo(headerEl.findText(NS_ADDRESSING, "RelatesTo"))
+    env.setTo(headerEl.findText(NS_ADDRESSING, "To"))
 
-        typeNodes = node.getElementsByTagNameNS(NS_DISCOVERY, "Types")
-        types = []
-        if len(typeNodes) > 0:
-            types = getTypes(typeNodes[0])
+    _parseAppSequence(headerEl, env)
 
-        scopeNodes = node.getElementsByTagNameNS(NS_DISCOVERY, "Scopes")
-        scopes = []
-        if len(scopeNodes) > 0:
-            scopes = getScopes(scopeNodes[0])
+    return env
 
-        xAddrs = getXAddrs(node.getElementsByTagNameNS(NS_DISCOVERY, "XAddrs")[0])
-        mdv = node.getElementsByTagNameNS(NS_DISCOVERY, "MetadataVersion")[0].firstChild.data.strip()
-        env.getProbeResolveMatches().append(ProbeResolveMatch(epr, types, scopes, xAddrs, mdv))
 
-    return env
+def _decodeResolveMatchBody(resolveMatchesEl, env):
+    node = resolveMatchesEl.find(NS_DISCOVERY, "ResolveMatch")
+    if node is not None:
+        env.setProbeResolveMatches([_parseProbeResolveMatch(node, True)])
 
 
 
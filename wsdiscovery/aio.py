@@ -0,0 +1,384 @@
+"""Asyncio networking facilities for implementing WS-Discovery daemons that run
+inside an asyncio event loop, without any extra threads."""
+
+import asyncio
+import ipaddress
+import logging
+import socket
+import time
+
+from .udp import UDPMessage
+from .util import _getNetworkAddrs, localAddresses
+from .netlink import openAddressChangeSocket
+from .udp import UNICAST_UDP_REPEAT, MULTICAST_UDP_REPEAT
+from .dedup import DEFAULT_DEDUP_CAPACITY, DEFAULT_DEDUP_WINDOW
+from .networking import IPv4Sockets, IPv6Sockets, DatagramHandler
+from .networking import NETWORK_ADDRESSES_CHECK_TIMEOUT, MULTICAST_PORT, \
+                        MULTICAST_IPV4_ADDRESS, MULTICAST_IPV6_ADDRESS
+
+logger = logging.getLogger("aio")
+
+
+def _getSockName(transport):
+    # the sockname extra info is not updated when sending binds the socket
+    return transport.get_extra_info("socket").getsockname()
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    "pass datagrams received by an endpoint on to a datagram handler"
+
+    def __init__(self, handler, source=None):
+        self._handler = handler
+        self._source = source
+        self._transport = None
+
+    def connection_made(self, transport):
+        self._transport = transport
+
+    def datagram_received(self, data, addr):
+        local = None
+        if self._handler._capture:
+            local = self._handler._getLocalEndpoint(_getSockName(self._transport), self._source)
+        self._handler._handleDatagram(data, addr, local, self._source)
+
+    def error_received(self, exc):
+        logger.debug("datagram endpoint error: %s", exc)
+
+
+class AsyncioNetworkingFamily(DatagramHandler):
+    """datagram endpoints & message (re)transmission scheduling
+    for a single address family"""
+
+    def __init__(self, observer, loop):
+        DatagramHandler.__init__(self, observer)
+
+        self._loop = loop
+        self._multiInSocket = None
+        self._multiInTransport = None
+        self._uniOutTransport = None
+        self._multiOutUniInTransports = {}
+        self._endpointTasks = {}
+        self._pending = {}
+        self._drained = asyncio.Event()
+        self._drained.set()
+
+    def _getOwnAddrs(self):
+        return self._observer._addrs[socket.AF_INET]
+
+    def _createProtocol(self, source=None):
+        return _DatagramProtocol(self, source)
+
+    async def _createEndpoint(self, sock, source=None):
+        transport, _ = await self._loop.create_datagram_endpoint(
+            lambda: self._createProtocol(source), sock=sock)
+        return transport
+
+    async def _openSourceEndpoint(self, addr, sock):
+        try:
+            self._multiOutUniInTransports[addr] = await self._createEndpoint(sock, addr)
+        except asyncio.CancelledError:
+            sock.close()
+            raise
+
+    async def start(self):
+        self._multiInSocket = self._createMulticastInSocket()
+        self._multiInTransport = await self._createEndpoint(self._multiInSocket)
+
+        sock = socket.socket(self._get_inet(), socket.SOCK_DGRAM)
+        sock.setblocking(0)
+        self._uniOutTransport = await self._createEndpoint(sock)
+
+    async def ready(self):
+        "wait until the endpoints of all added source addresses are open"
+        await asyncio.gather(*self._endpointTasks.values(), return_exceptions=True)
+
+    async def stop(self):
+        "wait for pending messages to be sent, then close all endpoints"
+        await self._drained.wait()
+
+        for task in self._endpointTasks.values():
+            task.cancel()
+        await self.ready()
+
+        for transport in self._multiOutUniInTransports.values():
+            transport.close()
+        self._multiOutUniInTransports.clear()
+        self._endpointTasks.clear()
+
+        self._uniOutTransport.close()
+        self._multiInTransport.close()
+
+    def addSourceAddr(self, addr):
+        try:
+            self._multiInSocket.setsockopt(self._get_ip_proto(), self._get_ip_join(), self._makeMreq(addr))
+        except OSError as e:
+            logger.debug(f"Interface has more than 1 address: {e}")
+
+        sock = self._createMulticastOutSocket(addr, self._observer.ttl)
+        self._endpointTasks[addr] = self._loop.create_task(self._openSourceEndpoint(addr, sock))
+
+    def removeSourceAddr(self, addr):
+        try:
+            self._multiInSocket.setsockopt(self._get_ip_proto(), self._get_ip_leave(), self._makeMreq(addr))
+        except OSError as e:
+            logger.debug(f"Interface has more than 1 address: {e}")
+
+        self._endpointTasks.pop(addr).cancel()
+        transport = self._multiOutUniInTransports.pop(addr, None)
+        if transport is not None:
+            transport.close()
+
+    def addUnicastMessage(self, env, addr, port, initialDelay=0,
+                          unicast_num=UNICAST_UDP_REPEAT, payload=None):
+        msg = UDPMessage(env, addr, port, UDPMessage.UNICAST, initialDelay,
+                         unicast_num=unicast_num, payload=payload)
+        self._enqueue(msg)
+        return msg
+
+    def addMulticastMessage(self, env, addr, port, initialDelay=0,
+                            multicast_num=MULTICAST_UDP_REPEAT, payload=None):
+        msg = UDPMessage(env, addr, port, UDPMessage.MULTICAST, initialDelay,
+                         multicast_num=multicast_num, payload=payload)
+        self._enqueue(msg)
+        return msg
+
+    def _enqueue(self, msg):
+        self._rememberMessageId(msg.getEnv().getMessageId())
+        self._drained.clear()
+        if self._tracer:
+            self._traceEnqueued(msg)
+        self._schedule(msg)
+
+    def _schedule(self, msg):
+        delay = max(0, msg.getNextTime() / 1000 - time.monotonic())
+        self._pending[msg] = self._loop.call_later(delay, self._sendScheduled, msg)
+        self._metrics.sendQueueDepth.set(self._familyLabel, len(self._pending))
+
+    def _sendScheduled(self, msg):
+        del self._pending[msg]
+        self._metrics.sendQueueDepth.set(self._familyLabel, len(self._pending))
+        self._sendMsg(msg)
+        msg.refresh()
+        if self._tracer:
+            self._traceSent(msg)
+        if not msg.isFinished():
+            self._schedule(msg)
+        elif not self._pending:
+            self._drained.set()
+
+    def _sendMsg(self, msg):
+        data = msg.getData()
+
+        if msg.msgType() == UDPMessage.UNICAST:
+            self._uniOutTransport.sendto(data, (msg.getAddr(), msg.getPort()))
+            self._metrics.datagramsSent.inc(self._interfaceLabel(None))
+            if self._capture:
+                self._captureSent(data, msg.getAddr(), msg.getPort(), self._getLocalEndpoint(
+                    _getSockName(self._uniOutTransport)))
+        else:
+            for addr, transport in self._multiOutUniInTransports.items():
+                # failures are reported to _DatagramProtocol.error_received()
+                transport.sendto(data, (msg.getAddr(), msg.getPort()))
+                self._metrics.datagramsSent.inc(self._interfaceLabel(addr))
+                if self._capture:
+                    self._captureSent(data, msg.getAddr(), msg.getPort(), self._getLocalEndpoint(
+                        _getSockName(transport), addr))
+
+
+class AsyncioNetworkingIPv4(IPv4Sockets, AsyncioNetworkingFamily):
+    pass
+
+
+class AsyncioNetworkingIPv6(IPv6Sockets, AsyncioNetworkingFamily):
+    pass
+
+
+class AsyncioNetworking:
+    """handle asyncio networking start & stop, address add/remove & message sending
+
+    start() and stop() are coroutines and must be awaited in the event loop
+    the daemon is to run in; all other methods must be called from that loop.
+    """
+
+    def __init__(self,
+                 unicast_num=UNICAST_UDP_REPEAT,
+                 multicast_num=MULTICAST_UDP_REPEAT,
+                 relates_to=False,
+                 dedup_capacity=DEFAULT_DEDUP_CAPACITY,
+                 dedup_window=DEFAULT_DEDUP_WINDOW, **kwargs):
+        self._networking_v4 = None
+        self._networking_v6 = None
+        self._addrs = {socket.AF_INET: set(), socket.AF_INET6: set()}
+        self._addrsMonitorTask = None
+        self._addrChanges = {}
+        self._addrsMonitored = set()
+        self._serverStarted = False
+        self._unicast_num = unicast_num
+        self._multicast_num = multicast_num
+        self._relates_to = relates_to
+        self._dedup_capacity = dedup_capacity
+        self._dedup_window = dedup_window
+        super().__init__(**kwargs)
+
+    def _getNetworkings(self):
+        return [(socket.AF_INET, self._networking_v4), (socket.AF_INET6, self._networking_v6)]
+
+    def _updateAddrs(self, families=None):
+        for family, networking in self._getNetworkings():
+            if networking is None or (families is not None and family not in families):
+                continue
+
+            addrs = set(_getNetworkAddrs(family))
+            if family in self._addrsMonitored:
+                localAddresses.update(family, addrs)
+            else:
+                localAddresses.startMonitoring(family, addrs)
+                self._addrsMonitored.add(family)
+
+            for addr in self._addrs[family].difference(addrs):
+                self._networkAddressRemoved(addr)
+
+            for addr in addrs.difference(self._addrs[family]):
+                self._networkAddressAdded(addr)
+
+            self._addrs[family] = addrs
+
+    async def _monitorAddrs(self):
+        while True:
+            await asyncio.sleep(NETWORK_ADDRESSES_CHECK_TIMEOUT)
+            self._updateAddrs()
+
+    def _watchAddrChanges(self, loop):
+        "subscribe to rtnetlink address changes; tell whether all families are covered"
+        for family, networking in self._getNetworkings():
+            if networking is None:
+                continue
+            changes = openAddressChangeSocket(family)
+            if changes is None:
+                continue
+            try:
+                loop.add_reader(changes.fileno(), self._addrsChanged, family)
+            except NotImplementedError:
+                changes.close()
+                continue
+            self._addrChanges[family] = changes
+        return all(networking is None or family in self._addrChanges
+                   for family, networking in self._getNetworkings())
+
+    def _addrsChanged(self, family):
+        if self._addrChanges[family].readChanges():
+            self._updateAddrs([family])
+
+    def _unwatchAddrChanges(self):
+        loop = asyncio.get_running_loop()
+        for changes in self._addrChanges.values():
+            loop.remove_reader(changes.fileno())
+            changes.close()
+        self._addrChanges = {}
+
+    async def start(self):
+        """start networking - should be awaited before using other methods"""
+        if self._networking_v4 is not None:
+            return
+
+        self._startCapture()
+        loop = asyncio.get_running_loop()
+
+        self._networking_v4 = AsyncioNetworkingIPv4(self, loop)
+        await self._networking_v4.start()
+
+        try:
+            networking_v6 = AsyncioNetworkingIPv6(self, loop)
+            await networking_v6.start()
+        except OSError as e:
+            logger.debug("IPv6 not supported: %s", e)
+        else:
+            self._networking_v6 = networking_v6
+        logger.debug("networking endpoints opened")
+
+        self._serverStarted = True
+        # subscribe before taking the first snapshot, so that no change is missed
+        watched = self._watchAddrChanges(loop)
+        self._updateAddrs()
+        for _, networking in self._getNetworkings():
+            if networking is not None:
+                await networking.ready()
+
+        if not watched:
+            self._addrsMonitorTask = loop.create_task(self._monitorAddrs())
+
+    async def stop(self):
+        """cleans up and stops networking"""
+        if self._addrsMonitorTask is not None:
+            self._addrsMonitorTask.cancel()
+            self._addrsMonitorTask = None
+        self._unwatchAddrChanges()
+        for family in self._addrsMonitored:
+            localAddresses.stopMonitoring(family)
+        self._addrsMonitored.clear()
+
+        for family, networking in self._getNetworkings():
+            if networking is not None:
+                await networking.stop()
+            self._addrs[family] = set()
+
+        self._networking_v4 = None
+        self._networking_v6 = None
+        self._serverStarted = False
+        if self._capture is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._stopCapture)
+
+    def getDedupStats(self):
+        "message deduplication cache statistics per address family"
+        stats = {}
+        if self._networking_v4 is not None:
+            stats["IPv4"] = self._networking_v4.getDedupStats()
+        if self._networking_v6 is not None:
+            stats["IPv6"] = self._networking_v6.getDedupStats()
+        return stats
+
+    def _getNetworkingFor(self, host):
+        try:
+            version = ipaddress.ip_address(host).version
+        except ValueError:
+            # a host name; let the IPv4 resolver have a go at it
+            version = 4
+        if version == 6:
+            return self._networking_v6
+        return self._networking_v4
+
+    def addSourceAddr(self, addr):
+        networking = self._getNetworkingFor(addr)
+        if networking is not None:
+            networking.addSourceAddr(addr)
+
+    def removeSourceAddr(self, addr):
+        networking = self._getNetworkingFor(addr)
+        if networking is not None:
+            networking.removeSourceAddr(addr)
+
+    def sendUnicastMessage(self, env, host, port, initialDelay=0,
+                           unicast_num=UNICAST_UDP_REPEAT, payload=None):
+        "handle unicast message sending; payload may be given if env is already serialized"
+        networking = self._getNetworkingFor(host)
+        if networking is None:
+            logger.warning("no networking available for sending to %s", host)
+            return
+        networking.addUnicastMessage(env, host, port, initialDelay, unicast_num, payload)
+
+    def sendMulticastMessage(self, env, initialDelay=0,
+                             multicast_num=MULTICAST_UDP_REPEAT):
+        "handle multicast message sending"
+        msg = self._networking_v4.addMulticastMessage(env,
+                                                      MULTICAST_IPV4_ADDRESS,
+                                                      MULTICAST_PORT,
+                                                      initialDelay,
+                                                      multicast_num)
+        if self._networking_v6 is not None:
+            # both families send the same bytes; serialize them only once
+            self._networking_v6.addMulticastMessage(env,
+                                                    MULTICAST_IPV6_ADDRESS,
+                                                    MULTICAST_PORT,
+                                                    initialDelay,
+                                                    multicast_num,
+                                                    msg.getPayload())
@@ -1 +1,10 @@
-"""A discovery daemon implementation using asyncio is planned."""
+"""Asyncio WS-Discovery daemons.
+
+``async`` is a reserved word, so this module can only be loaded with
+:func:`importlib.import_module`; import from :mod:`wsdiscovery.aio`,
+:mod:`wsdiscovery.discovery` and :mod:`wsdiscovery.publishing` instead.
+"""
+
+from .aio import AsyncioNetworking
+from .discovery import AsyncWSDiscovery
+from .publishing import AsyncWSPublishing
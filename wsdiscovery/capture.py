@@ -0,0 +1,436 @@
+"""Capture of sent & received datagrams, written off the networking path.
+
+Networking threads only put records holding the raw datagram bytes into a
+bounded queue; a dedicated thread writes them to a capture sink. When the
+sink cannot keep up, records are dropped and counted rather than delaying
+the traffic being captured. Captures are written as JSON lines, which are
+pretty-printed offline with formatCapture() (or the ``wscapture`` command),
+or as pcapng files with synthesized IP & UDP headers for packet analysers.
+"""
+
+import base64
+import itertools
+import json
+import logging
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+from collections import namedtuple
+
+from .util import dom2Str
+
+logger = logging.getLogger("capture")
+
+#: captured events
+CAPTURE_RECV = "RECV"
+CAPTURE_SEND = "SEND"
+CAPTURE_BAD = "BAD"  # received, but could not be parsed
+
+#: default maximum number of records waiting to be written
+DEFAULT_CAPTURE_QUEUE_SIZE = 10000
+
+
+class CaptureRecord(namedtuple("CaptureRecord", "timestamp event peer local data")):
+    """captured datagram
+
+    timestamp is in nanoseconds since the epoch; peer is the (host, port)
+    of the sender of a received datagram or the destination of a sent one;
+    local is the (host, port) of the local socket, None if unknown, its host
+    the unspecified address if not bound to an interface address; data are
+    the raw datagram bytes.
+    """
+
+
+class JsonlCaptureSink:
+    "write capture records to a text file as JSON lines, datagrams base64-encoded"
+
+    def __init__(self, file):
+        self._file = file
+
+    def writeRecord(self, record):
+        self._file.write(json.dumps({
+            "ts": record.timestamp,
+            "event": record.event,
+            "peer": [record.peer[0], record.peer[1]],
+            "local": None if record.local is None else [record.local[0], record.local[1]],
+            "data": base64.b64encode(record.data).decode("ascii"),
+        }, separators=(",", ":")))
+        self._file.write("\n")
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+# pcapng block types, options & constants
+_PCAPNG_SHB = 0x0A0D0D0A
+_PCAPNG_IDB = 0x00000001
+_PCAPNG_EPB = 0x00000006
+_PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+_OPT_ENDOFOPT = 0
+_OPT_COMMENT = 1
+_OPT_IF_NAME = 2
+_OPT_IF_TSRESOL = 9
+_OPT_EPB_FLAGS = 2
+_EPB_FLAGS_INBOUND = 0x1
+_EPB_FLAGS_OUTBOUND = 0x2
+_LINKTYPE_RAW = 101  # packets begin with an IPv4 or IPv6 header
+
+_MULTICAST_GROUPS = {socket.AF_INET: "239.255.255.250", socket.AF_INET6: "ff02::c"}
+_DISCOVERY_PORT = 3702
+
+_IPV4_HEADER = struct.Struct("!BBHHHBBH4s4s")
+_IPV6_HEADER = struct.Struct("!IHBB16s16s")
+_UDP_HEADER = struct.Struct("!HHHH")
+
+
+def _pcapngBlock(blockType, body):
+    length = 12 + len(body)
+    return struct.pack("<II", blockType, length) + body + struct.pack("<I", length)
+
+
+def _pcapngOptions(options):
+    "encode (code, bytes) options, padded to 32 bits & terminated"
+    encoded = []
+    for code, value in options:
+        encoded.append(struct.pack("<HH", code, len(value)))
+        encoded.append(value + b"\0" * (-len(value) % 4))
+    encoded.append(struct.pack("<HH", _OPT_ENDOFOPT, 0))
+    return b"".join(encoded)
+
+
+def _checksum(data):
+    "internet checksum of data"
+    if len(data) % 2:
+        data += b"\0"
+    total = sum(struct.unpack("!%iH" % (len(data) // 2), data))
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
+def _packAddr(family, host):
+    "packed host address, the unspecified address if it is not numeric"
+    try:
+        return socket.inet_pton(family, host.split("%", 1)[0])
+    except (OSError, ValueError):
+        return bytes(4 if family == socket.AF_INET else 16)
+
+
+def _isUnspecified(packed):
+    return not any(packed)
+
+
+def synthesizePacket(src, dst, data):
+    """IPv4 or IPv6 packet carrying a UDP datagram between (host, port) endpoints;
+    the family is that of the dst host"""
+    family = socket.AF_INET6 if ":" in dst[0] else socket.AF_INET
+    srcAddr = _packAddr(family, src[0])
+    dstAddr = _packAddr(family, dst[0])
+    ttl = 1 if dstAddr[0] >= (0xFF if family == socket.AF_INET6 else 0xE0) else 64
+    length = _UDP_HEADER.size + len(data)
+
+    if family == socket.AF_INET:
+        # the UDP checksum is optional over IPv4
+        udp = _UDP_HEADER.pack(src[1], dst[1], length, 0)
+        header = _IPV4_HEADER.pack(0x45, 0, _IPV4_HEADER.size + length, 0, 0, ttl,
+                                   socket.IPPROTO_UDP, 0, srcAddr, dstAddr)
+        header = header[:10] + struct.pack("!H", _checksum(header)) + header[12:]
+    else:
+        pseudo = srcAddr + dstAddr + struct.pack("!IxxxB", length, socket.IPPROTO_UDP)
+        checksum = _checksum(pseudo + _UDP_HEADER.pack(src[1], dst[1], length, 0) + data) or 0xFFFF
+        udp = _UDP_HEADER.pack(src[1], dst[1], length, checksum)
+        header = _IPV6_HEADER.pack(6 << 28, length, socket.IPPROTO_UDP, ttl, srcAddr, dstAddr)
+    return header + udp + data
+
+
+def _recordEndpoints(record):
+    "(source, destination) endpoints of a captured datagram, filling in the unknown"
+    family = socket.AF_INET6 if ":" in record.peer[0] else socket.AF_INET
+    local = record.local
+    if record.event == CAPTURE_SEND:
+        if local is None:
+            local = ("::" if family == socket.AF_INET6 else "0.0.0.0", 0)
+        return local, record.peer
+    if local is None or _isUnspecified(_packAddr(family, local[0])):
+        # received by the socket bound to all addresses, joined to the multicast group
+        local = (_MULTICAST_GROUPS[family], _DISCOVERY_PORT if local is None else local[1])
+    return record.peer, local
+
+
+class PcapngCaptureSink:
+    """write capture records to a binary file in the pcapng format
+
+    Datagrams are written with synthesized IPv4/IPv6 & UDP headers on a
+    single raw IP interface with nanosecond timestamps, so captures can be
+    analysed with Wireshark, tshark & co. The event is recorded in the
+    packet direction flags and comment.
+    """
+
+    def __init__(self, file, interface_name="wsdiscovery"):
+        self._file = file
+        self._file.write(_pcapngBlock(_PCAPNG_SHB, struct.pack(
+            "<IHHq", _PCAPNG_BYTE_ORDER_MAGIC, 1, 0, -1) + _pcapngOptions([])))
+        self._file.write(_pcapngBlock(_PCAPNG_IDB, struct.pack(
+            "<HHI", _LINKTYPE_RAW, 0, 0) + _pcapngOptions([
+                (_OPT_IF_NAME, interface_name.encode("UTF-8")),
+                (_OPT_IF_TSRESOL, b"\x09"),
+            ])))
+
+    def writeRecord(self, record):
+        src, dst = _recordEndpoints(record)
+        packet = synthesizePacket(src, dst, record.data)
+        flags = _EPB_FLAGS_OUTBOUND if record.event == CAPTURE_SEND else _EPB_FLAGS_INBOUND
+        body = struct.pack("<IIIII", 0, record.timestamp >> 32, record.timestamp & 0xFFFFFFFF,
+                           len(packet), len(packet))
+        body += packet + b"\0" * (-len(packet) % 4)
+        body += _pcapngOptions([
+            (_OPT_EPB_FLAGS, struct.pack("<I", flags)),
+            (_OPT_COMMENT, record.event.encode("ascii")),
+        ])
+        self._file.write(_pcapngBlock(_PCAPNG_EPB, body))
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def _parsePacket(packet):
+    "(src, dst, data) of a synthesized IPv4 or IPv6 UDP packet, None for other packets"
+    version = packet[0] >> 4 if packet else None
+    if version == 4 and len(packet) >= _IPV4_HEADER.size:
+        fields = _IPV4_HEADER.unpack_from(packet)
+        family, proto, srcAddr, dstAddr = socket.AF_INET, fields[6], fields[8], fields[9]
+        offset = (fields[0] & 0xF) * 4
+    elif version == 6 and len(packet) >= _IPV6_HEADER.size:
+        fields = _IPV6_HEADER.unpack_from(packet)
+        family, proto, srcAddr, dstAddr = socket.AF_INET6, fields[2], fields[4], fields[5]
+        offset = _IPV6_HEADER.size
+    else:
+        return None
+    if proto != socket.IPPROTO_UDP or len(packet) < offset + _UDP_HEADER.size:
+        return None
+    srcPort, dstPort, length, _ = _UDP_HEADER.unpack_from(packet, offset)
+    data = packet[offset + _UDP_HEADER.size:offset + length]
+    return ((socket.inet_ntop(family, srcAddr), srcPort),
+            (socket.inet_ntop(family, dstAddr), dstPort), data)
+
+
+def _readPcapngOptions(data, order):
+    "iterate over the (code, bytes) options of a block"
+    offset = 0
+    while offset + 4 <= len(data):
+        code, length = struct.unpack_from(order + "HH", data, offset)
+        if code == _OPT_ENDOFOPT:
+            return
+        yield code, data[offset + 4:offset + 4 + length]
+        offset += 4 + length + (-length % 4)
+
+
+def _readPcapng(file, head):
+    "iterate over the CaptureRecords of the UDP packets of a pcapng file"
+    order = "<"
+    interfaces = []  # (link type, timestamp units per second)
+    while True:
+        header = head + file.read(8 - len(head))
+        head = b""
+        if not header:
+            return
+        if len(header) < 8:
+            raise ValueError("truncated pcapng block header")
+        rest = b""
+        if header[:4] == struct.pack("<I", _PCAPNG_SHB):
+            # the section header tells the byte order of its blocks
+            rest = file.read(4)
+            order = "<" if rest == struct.pack("<I", _PCAPNG_BYTE_ORDER_MAGIC) else ">"
+        blockType, length = struct.unpack_from(order + "II", header)
+        rest += file.read(max(0, length - 8 - len(rest)))
+        if length < 12 or len(rest) != length - 8:
+            raise ValueError("truncated pcapng block")
+        body = rest[:-4]
+
+        if blockType == _PCAPNG_SHB:
+            interfaces = []
+        elif blockType == _PCAPNG_IDB:
+            linkType, = struct.unpack_from(order + "H", body)
+            resolution = 10 ** 6  # microseconds by default
+            for code, value in _readPcapngOptions(body[8:], order):
+                if code == _OPT_IF_TSRESOL:
+                    exponent = value[0] & 0x7F
+                    resolution = 2 ** exponent if value[0] & 0x80 else 10 ** exponent
+            interfaces.append((linkType, resolution))
+        elif blockType == _PCAPNG_EPB:
+            interface, high, low, capturedLength, _ = struct.unpack_from(order + "IIIII", body)
+            linkType, resolution = interfaces[interface]
+            packet = body[20:20 + capturedLength]
+            parsed = _parsePacket(packet) if linkType == _LINKTYPE_RAW else None
+            if parsed is None:
+                continue
+            src, dst, data = parsed
+            event = flags = None
+            for code, value in _readPcapngOptions(body[20 + capturedLength + (-capturedLength % 4):], order):
+                if code == _OPT_COMMENT:
+                    event = value.decode("ascii", "replace")
+                elif code == _OPT_EPB_FLAGS:
+                    flags, = struct.unpack(order + "I", value)
+            if event not in (CAPTURE_RECV, CAPTURE_SEND, CAPTURE_BAD):
+                event = CAPTURE_SEND if flags is not None and flags & 0x3 == _EPB_FLAGS_OUTBOUND \
+                    else CAPTURE_RECV
+            timestamp = ((high << 32) | low) * 10 ** 9 // resolution
+            if event == CAPTURE_SEND:
+                yield CaptureRecord(timestamp, event, dst, src, data)
+            else:
+                yield CaptureRecord(timestamp, event, src, dst, data)
+
+
+def readCapture(file):
+    """iterate over the CaptureRecords of a capture: JSON lines written by
+    JsonlCaptureSink, or pcapng written by PcapngCaptureSink read from a
+    binary file
+
+    The local endpoints of pcapng records are those of their packets, the
+    multicast group for datagrams captured with an unknown local endpoint.
+    """
+    head = file.read(4)
+    if head == struct.pack("<I", _PCAPNG_SHB):
+        yield from _readPcapng(file, head)
+        return
+    for line in itertools.chain([head + file.readline()], file):
+        line = line.strip()
+        if not line:
+            continue
+        obj = json.loads(line)
+        local = obj["local"]
+        yield CaptureRecord(obj["ts"], obj["event"], tuple(obj["peer"]),
+                            None if local is None else tuple(local), base64.b64decode(obj["data"]))
+
+
+def formatCapture(records, out):
+    "pretty-print capture records to a text file"
+    t0 = None
+    for seqnum, record in enumerate(records, 1):
+        if t0 is None:
+            t0 = record.timestamp
+        header = "%i %s %s:%s" % (seqnum, record.event, record.peer[0], record.peer[1])
+        if record.local is not None:
+            header += " local=%s:%s" % record.local
+        out.write("%s TS=%s\n" % (header, (record.timestamp - t0) / 1e9))
+        try:
+            out.write(dom2Str(record.data))
+        except Exception:
+            out.write("\n%r\n\n" % record.data)
+
+
+class CaptureWriter:
+    """bounded queue of capture records, written to a sink by a dedicated thread
+
+    capture() never blocks: records that do not fit in the queue are dropped
+    and counted. With close_sink, close() closes the sink too; capture() &
+    flush() then do nothing.
+    """
+
+    def __init__(self, sink, queue_size=DEFAULT_CAPTURE_QUEUE_SIZE, close_sink=False):
+        self._sink = sink
+        self._closeSink = close_sink
+        self._closed = False
+        self._queue = queue.Queue(queue_size)
+        self._lock = threading.Lock()
+
+        self.captured = 0
+        self.dropped = 0
+        self.written = 0
+        self.errors = 0
+
+        self._thread = threading.Thread(target=self._run, name="capture writer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def capture(self, event, peer, local, data):
+        "queue a datagram for writing; peer is a (host, port) tuple"
+        if self._closed:
+            return
+        record = CaptureRecord(time.time_ns(), event, peer, local, data)
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+        else:
+            with self._lock:
+                self.captured += 1
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            try:
+                if record is None:
+                    return
+                self._sink.writeRecord(record)
+                with self._lock:
+                    self.written += 1
+            except Exception:
+                with self._lock:
+                    self.errors += 1
+                logger.exception("failed to write capture record")
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        "wait until all queued records have been written, and flush the sink"
+        if self._closed:
+            return
+        self._queue.join()
+        self._sink.flush()
+
+    def close(self):
+        "write all queued records & stop the writer thread"
+        self._closed = True
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._sink.flush()
+        if self._closeSink:
+            self._sink.close()
+
+    def isClosed(self):
+        return self._closed
+
+    def getStats(self):
+        "captured, dropped, written & failed record counters and queue length"
+        with self._lock:
+            return {
+                "captured": self.captured,
+                "dropped": self.dropped,
+                "written": self.written,
+                "errors": self.errors,
+                "queued": self._queue.qsize(),
+            }
+
+
+def openCaptureSink(path, append=False):
+    """capture sink writing to a new file, or appending to it: pcapng for
+    .pcapng files (appended as a new section), JSON lines otherwise"""
+    if os.fspath(path).endswith(".pcapng"):
+        return PcapngCaptureSink(open(path, "ab" if append else "wb"))
+    return JsonlCaptureSink(open(path, "a" if append else "w"))
+
+
+def openCapture(capture, append=False):
+    """CaptureWriter for the capture option of a daemon: a CaptureWriter,
+    a capture sink, a text file to write JSON lines to or the path of a file
+    to create or append to, see openCaptureSink(); the file is closed with
+    the writer"""
+    if capture is None or isinstance(capture, CaptureWriter):
+        return capture
+    if isinstance(capture, (str, os.PathLike)):
+        return CaptureWriter(openCaptureSink(capture, append), close_sink=True)
+    if hasattr(capture, "writeRecord"):
+        return CaptureWriter(capture)
+    return CaptureWriter(JsonlCaptureSink(capture))
@@ -5,11 +5,14 @@ from urllib.parse import urlparse
 import click
 
 from wsdiscovery.discovery import ThreadedWSDiscovery as WSDiscovery
+from wsdiscovery.discovery import ReplayWSDiscovery
 from wsdiscovery.publishing import ThreadedWSPublishing as WSPublishing
 from wsdiscovery.scope import Scope
 from wsdiscovery.qname import QName
 from wsdiscovery.discovery import DEFAULT_DISCOVERY_TIMEOUT
 from wsdiscovery.udp import UNICAST_UDP_REPEAT, MULTICAST_UDP_REPEAT
+from wsdiscovery.capture import readCapture, formatCapture
+from wsdiscovery.replay import replayCapture
 
 DEFAULT_LOGLEVEL = "INFO"
 
@@ -54,7 +57,8 @@ def setup_logger(name, loglevel):
 @click.option('--loglevel', '-l',  default=DEFAULT_LOGLEVEL, show_default=True,
               type=click.Choice(["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]),
               help='Log level')
-@click.option('--capture', '-c', nargs=1, type=click.File('w'), help='Capture messages to a file')
+@click.option('--capture', '-c', nargs=1, type=click.Path(dir_okay=False),
+              help='Capture messages to a file, see wscapture; in pcapng format if named *.pcapng')
 @click.option('--timeout', '-t', default=DEFAULT_DISCOVERY_TIMEOUT, show_default=True,
               type=int, help='Discovery timeout in seconds')
 @click.option('--unicast-num', '-un', type=int, default=UNICAST_UDP_REPEAT,
@@ -94,7 +98,8 @@ def discover(scope, ptype, address, port, loglevel, capture, timeout,
 @click.option('--loglevel', '-l',  default=DEFAULT_LOGLEVEL, show_default=True,
               type=click.Choice(["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]),
               help='Log level')
-@click.option('--capture', '-c', nargs=1, type=click.File('w'), help='Capture messages to a file')
+@click.option('--capture', '-c', nargs=1, type=click.Path(dir_okay=False),
+              help='Capture messages to a file, see wscapture; in pcapng format if named *.pcapng')
 @click.option('--unicast-num', '-un', type=int, default=UNICAST_UDP_REPEAT,
               show_default=True, help='Number of Unicast messages to send')
 @click.option('--multicast-num', '-mn', type=int, default=MULTICAST_UDP_REPEAT,
@@ -118,3 +123,43 @@ def publish(scope, typename, address, port, loglevel, capture, unicast_num,
 
         xAddrs = ["%s:%i" % (address, port)] if address else ['127.0.0.1']
         svc = wsp.publishService(types, scopes, xAddrs)
+
+
+@click.command(context_settings=CONTEXT_SETTINGS)
+@click.argument('capture', type=click.File('rb'))
+def showcapture(capture):
+    "Pretty-print the messages of a capture file"
+
+    formatCapture(readCapture(capture), click.get_text_stream('stdout'))
+
+
+@click.command(context_settings=CONTEXT_SETTINGS)
+@click.argument('capture', type=click.File('rb'))
+@click.option('--speed', '-s', type=float,
+              help='Replay at the recorded pace sped up by this factor, instead of as fast as possible')
+@click.option('--loglevel', '-l',  default="WARNING", show_default=True,
+              type=click.Choice(["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]),
+              help='Log level')
+def replay(capture, speed, loglevel):
+    "Replay the received messages of a capture file into a discovery daemon"
+
+    logger = setup_logger("ws-replay", loglevel)
+
+    wsd = ReplayWSDiscovery()
+    wsd.start()
+    stats = replayCapture(wsd, readCapture(capture), speed)
+    wsd.stop()
+
+    print("Replayed %i datagrams in %.3f s (%.0f/s), %i failed to parse" % (
+          stats["datagrams"], stats["seconds"], stats["datagrams_per_second"],
+          stats["parse_failures"]))
+    sent = wsd.getSentStats()
+    print("Would have sent %i unicast & %i multicast messages" % (sent["unicast"], sent["multicast"]))
+    for family, caches in wsd.getDedupStats().items():
+        print("%s duplicate message IDs: %i" % (family, caches["message_ids"]["hits"]))
+
+    services = wsd.getRemoteServices()
+    print("\nKnown services: %i\n" % len(services))
+    for service in services:
+        print(" %s" % service.getEPR())
+        print("  - %s\n" % "\n  - ".join([str(x) for x in service.getXAddrs()]))
@@ -9,7 +9,11 @@ from .actions import *
 from .uri import URI
 from .service import Service
 from .envelope import SoapEnvelope
-from .udp import UNICAST_UDP_REPEAT, MULTICAST_UDP_REPEAT
+from .udp import MessagePayload, UNICAST_UDP_REPEAT, MULTICAST_UDP_REPEAT
+from .probecache import CachedProbeMatch
+from .capture import openCapture
+from .metrics import DaemonMetrics
+from .tracing import Tracer, TRACE_DISPATCHED, TRACE_HANDLED
 
 APP_MAX_DELAY = 500 # miliseconds
 
@@ -31,31 +35,93 @@ class Daemon:
         else:
             self.uuid = uuid.uuid4().urn
 
-        self._capture = capture
+        self._captureOption = capture
+        self._capture = openCapture(capture)
+        self._ownsCapture = capture is not None and self._capture is not capture
+        self._metrics = DaemonMetrics()
+        self._tracer = Tracer()
+        self._actionHandlers = {}  # action URI: (bound handler or None, handler name, metrics label)
         self.ttl = ttl
         self._unicast_num = kwargs.get('unicast_num', UNICAST_UDP_REPEAT)
         self._multicast_num = kwargs.get('multicast_num', MULTICAST_UDP_REPEAT)
 
         super().__init__(**kwargs)
 
+    def getCaptureStats(self):
+        "capture writer statistics, None if not capturing"
+        if self._capture is None:
+            return None
+        return self._capture.getStats()
+
+    def _startCapture(self):
+        "open the capture writer for the capture option again after a stop, appending to a file"
+        if self._ownsCapture and self._capture.isClosed():
+            self._capture = openCapture(self._captureOption, append=True)
+
+    def _stopCapture(self):
+        "close the capture writer opened for the capture option, or flush one given"
+        if self._capture is None:
+            return
+        if self._ownsCapture:
+            self._capture.close()
+        else:
+            self._capture.flush()
+
+    def getStats(self):
+        "values of the daemon metrics by name, see wsdiscovery.metrics"
+        return self._metrics.getStats()
+
+    def getMetrics(self):
+        "the DaemonMetrics registry, e.g. for serveMetrics()"
+        return self._metrics
+
+    def addTraceHook(self, hook):
+        "call hook with a TraceEvent at each step of the message lifecycle, see wsdiscovery.tracing"
+        self._tracer.addHook(hook)
+
+    def removeTraceHook(self, hook):
+        self._tracer.removeHook(hook)
+
+    def _resolveHandler(self, action):
+        "the handler method of a registered action & its name, or None, and the metrics label"
+        label = (action[action.rfind('/')+1:],)
+        registered = getAction(action)
+        name = registered.handler if registered is not None else None
+        return getattr(self, name, None) if name else None, name or action, label
+
     def envReceived(self, env, addr):
         action = env.getAction()
-        action_name = '_handle_' + action[action.rfind('/')+1:].lower()
         try:
-            handler = getattr(self, action_name)
-        except AttributeError:
+            handler, action_name, action_label = self._actionHandlers[action]
+        except KeyError:
+            handler, action_name, action_label = self._actionHandlers[action] = \
+                self._resolveHandler(action)
+        self._metrics.messagesReceived.inc(action_label)
+        if handler is None:
             logger.warning("could not find handler for: %s" % action_name)
         else:
+            if self._tracer:
+                self._tracer.emit(TRACE_DISPATCHED, env, addr, action_name)
+            start = time.perf_counter()
             handler(env, addr)
+            self._metrics.handlerSeconds.observe(action_label, time.perf_counter() - start)
+            if self._tracer:
+                self._tracer.emit(TRACE_HANDLED, env, addr, action_name)
 
     def _sendResolveMatch(self, service, relatesTo, addr):
         env = constructResolveMatch(service, relatesTo)
         self.sendUnicastMessage(env, addr[0], addr[1], unicast_num=self._unicast_num)
 
-    def _sendProbeMatch(self, services, relatesTo, addr):
-        env = constructProbeMatch(services, relatesTo)
-        self.sendUnicastMessage(env, addr[0], addr[1], random.randint(0, APP_MAX_DELAY),
-                                unicast_num=self._unicast_num)
+    def _sendProbeMatch(self, services, relatesTo, addr, cached=None, maxSize=None):
+        """send Probe Matches for the services, as many as needed to keep each within
+        maxSize bytes if given; cached may be a CachedProbeMatch of the services"""
+        if cached is None:
+            cached = CachedProbeMatch(services)
+        delay = random.randint(0, APP_MAX_DELAY)
+        for env, data in cached.constructMessages(relatesTo, maxSize):
+            self.sendUnicastMessage(env, addr[0], addr[1], delay,
+                                    unicast_num=self._unicast_num,
+                                    payload=MessagePayload(env, data))
 
     def _sendProbe(self, types=None, scopes=None, address=None, port=None):
         env = constructProbe(types, scopes)
@@ -0,0 +1,177 @@
+"""Bounded, time-expiring cache used for suppressing duplicate messages.
+
+SOAP-over-UDP messages are retransmitted several times, so each message ID
+must be remembered for a while; but in a busy multicast segment remembering
+all of them forever exhausts memory. Entries here are forgotten once they
+are older than the time window, or when the cache is full, oldest first.
+
+As most received datagrams are retransmissions, peekMessageIds() finds the
+message ID in the raw bytes so that known duplicates can be dropped
+without parsing them.
+"""
+
+import functools
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from .namespaces import NS_ADDRESSING, NS_ADDRESSING_1_1
+
+#: default maximum number of entries
+DEFAULT_DEDUP_CAPACITY = 10000
+
+#: default time window in seconds, well beyond the SOAP-over-UDP retransmission period
+DEFAULT_DEDUP_WINDOW = 60
+
+
+class DedupCache:
+    """mapping of recently seen keys, bounded in size & age
+
+    Can be used as a set (add() & ``in``) or as a mapping (``[]``, get()).
+    Membership tests & lookups are counted as hits and misses; entries
+    dropped because the cache is full are counted as evictions, and entries
+    dropped because of their age as expirations.
+    """
+
+    def __init__(self, capacity=DEFAULT_DEDUP_CAPACITY, window=DEFAULT_DEDUP_WINDOW):
+        self._capacity = capacity
+        self._window = window
+        self._entries = OrderedDict()  # key -> (time added, value), oldest first
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _expire(self, now):
+        limit = now - self._window
+        entries = self._entries
+        while entries:
+            key, (added, _) = next(iter(entries.items()))
+            if added > limit:
+                break
+            del entries[key]
+            self.expirations += 1
+
+    def _lookup(self, key):
+        now = time.monotonic()
+        self._expire(now)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._lookup(key) is not None
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._lookup(key)
+            return default if entry is None else entry[1]
+
+    def __getitem__(self, key):
+        with self._lock:
+            entry = self._lookup(key)
+        if entry is None:
+            raise KeyError(key)
+        return entry[1]
+
+    def __setitem__(self, key, value):
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entries = self._entries
+            if key in entries:
+                del entries[key]
+            elif len(entries) >= self._capacity:
+                entries.popitem(last=False)
+                self.evictions += 1
+            entries[key] = (now, value)
+
+    def add(self, key):
+        self[key] = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def getStats(self):
+        "size & hit, miss, eviction and expiration counters"
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "capacity": self._capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+#: namespaces of the WS-Addressing MessageID & RelatesTo elements
+ADDRESSING_NAMESPACES = frozenset([NS_ADDRESSING.encode("ascii"), NS_ADDRESSING_1_1.encode("ascii")])
+
+# element with its namespace prefix, attributes & text, which must not
+# need unescaping; only printable ASCII except for "<" and "&"
+_ELEMENT_PATTERN = r"<(?:([A-Za-z_][\w.-]*):)?%s(\s[^>]*)?>\s*([\x21-\x25\x27-\x3b\x3d-\x7e]+)\s*</[^>]*>"
+
+_NAMES = {name: re.compile(name.encode("ascii")) for name in ("MessageID", "RelatesTo")}
+_ELEMENTS = {name: re.compile((_ELEMENT_PATTERN % name).encode("ascii")) for name in _NAMES}
+_DEFAULT_NAMESPACE = re.compile(rb"""xmlns\s*=\s*["']([^"']*)["']""")
+
+_AMBIGUOUS = object()
+
+
+@functools.lru_cache(maxsize=64)
+def _prefixDeclaration(prefix):
+    return re.compile(rb"""xmlns:""" + re.escape(prefix) + rb"""\s*=\s*["']([^"']*)["']""")
+
+
+def _inAddressingNamespace(data, prefix, attributes):
+    "tell whether an element is certainly in a WS-Addressing namespace"
+    if prefix is None:
+        declaration = _DEFAULT_NAMESPACE.search(attributes or b"")
+        return declaration is not None and declaration.group(1) in ADDRESSING_NAMESPACES
+    # a prefix declared more than once might be bound to another namespace here
+    declarations = _prefixDeclaration(prefix).findall(data)
+    return len(declarations) == 1 and declarations[0] in ADDRESSING_NAMESPACES
+
+
+def _peekElement(data, name):
+    "text of the only WS-Addressing element of the name; None if there is none, or _AMBIGUOUS"
+    occurrences = len(_NAMES[name].findall(data))
+    if occurrences == 0:
+        return None
+    match = _ELEMENTS[name].search(data)
+    # the name must only appear in the start & end tags of the element
+    if occurrences != 2 or match is None:
+        return _AMBIGUOUS
+    prefix, attributes, text = match.groups()
+    if not _inAddressingNamespace(data, prefix, attributes):
+        return _AMBIGUOUS
+    return text.decode("ascii")
+
+
+def peekMessageIds(data):
+    """MessageID & RelatesTo of a raw datagram (bytes or a memoryview), found
+    without parsing it; RelatesTo is None if the message has none
+
+    Returns None unless both are certain to be what parsing the datagram
+    would give, e.g. if the datagram has no MessageID, or the elements are
+    escaped, commented out or in another namespace.
+    """
+    messageId = _peekElement(data, "MessageID")
+    if messageId is None or messageId is _AMBIGUOUS:
+        return None
+    relatesTo = _peekElement(data, "RelatesTo")
+    if relatesTo is _AMBIGUOUS:
+        return None
+    return messageId, relatesTo
@@ -1,28 +1,81 @@
 """Discovery application."""
 
+import asyncio
+import queue
 import time
 import uuid
 
 from .actions import *
 from .uri import URI
-from .util import matchesFilter, filterServices, extractSoapUdpAddressFromURI
+from .util import matchesFilter, extractSoapUdpAddressFromURI
+from .registry import ServiceRegistry
 from .service import Service
 from .namespaces import NS_DISCOVERY
 from .threaded import ThreadedNetworking
+from .aio import AsyncioNetworking
+from .replay import ReplayNetworking
 from .daemon import Daemon
 
 DEFAULT_DISCOVERY_TIMEOUT = 3
 
 
+class _StreamingSearch:
+    "bookkeeping of a streaming search: which services to yield and when to stop"
+
+    def __init__(self, types, scopes, timeout, max_results, quiet_period):
+        self._types = types
+        self._scopes = scopes
+        self._maxResults = max_results
+        self._quietPeriod = quiet_period
+        self._deadline = time.monotonic() + timeout
+        self._lastMatch = time.monotonic()
+        self._yielded = set()
+        self._unresolved = {}
+
+    def getWaitTime(self):
+        "seconds to wait for the next match; zero or less means the search is over"
+        if self._maxResults is not None and len(self._yielded) >= self._maxResults:
+            return 0
+        now = time.monotonic()
+        wait = self._deadline - now
+        if self._quietPeriod is not None:
+            wait = min(wait, self._lastMatch + self._quietPeriod - now)
+        return wait
+
+    def accept(self, service):
+        "tell whether a matched remote service is to be yielded right away"
+        epr = service.getEPR()
+        if epr in self._yielded or not matchesFilter(service, self._types, self._scopes):
+            return False
+
+        self._lastMatch = time.monotonic()
+        if not service.getXAddrs():
+            # wait for the ResolveMatch that will carry the addresses
+            self._unresolved[epr] = service
+            return False
+
+        self._unresolved.pop(epr, None)
+        self._yielded.add(epr)
+        return True
+
+    def getUnresolved(self):
+        "matching services that never got their addresses resolved"
+        services = list(self._unresolved.values())
+        if self._maxResults is not None:
+            services = services[:max(0, self._maxResults - len(self._yielded))]
+        return services
+
+
 class Discovery:
     """networking-agnostic generic remote service discovery mixin"""
 
     def __init__(self, **kwargs):
-        self._remoteServices = {}
+        self._remoteServices = ServiceRegistry()
         self._remoteServiceHelloCallback = None
         self._remoteServiceHelloCallbackTypesFilter = None
         self._remoteServiceHelloCallbackScopesFilter = None
         self._remoteServiceByeCallback = None
+        self._remoteServiceListeners = []
         super().__init__(**kwargs)
 
     def setRemoteServiceHelloCallback(self, cb, types=None, scopes=None):
@@ -58,13 +111,17 @@ class Discovery:
 
     def _handle_probematches(self, env, addr):
         for match in env.getProbeResolveMatches():
-            self._addRemoteService(Service(match.getTypes(), match.getScopes(), match.getXAddrs(), match.getEPR(), 0))
+            service = Service(match.getTypes(), match.getScopes(), match.getXAddrs(), match.getEPR(), 0)
+            self._addRemoteService(service)
             if match.getXAddrs() is None or len(match.getXAddrs()) == 0:
                 self._sendResolve(match.getEPR())
+            self._notifyRemoteServiceListeners(service)
 
     def _handle_resolvematches(self, env, addr):
         for match in env.getProbeResolveMatches():
-            self._addRemoteService(Service(match.getTypes(), match.getScopes(), match.getXAddrs(), match.getEPR(), 0))
+            service = Service(match.getTypes(), match.getScopes(), match.getXAddrs(), match.getEPR(), 0)
+            self._addRemoteService(service)
+            self._notifyRemoteServiceListeners(service)
 
     def _handle_hello(self, env, addr):
         #check if it is from a discovery proxy
@@ -80,9 +137,9 @@ class Discovery:
         service = Service(env.getTypes(), env.getScopes(), env.getXAddrs(), env.getEPR(), 0)
         self._addRemoteService(service)
         if self._remoteServiceHelloCallback is not None:
-            if matchesFilter(service,
-                             self._remoteServiceHelloCallbackTypesFilter,
-                             self._remoteServiceHelloCallbackScopesFilter):
+            if self._remoteServices.matches(service.getEPR(),
+                                            self._remoteServiceHelloCallbackTypesFilter,
+                                            self._remoteServiceHelloCallbackScopesFilter):
                 self._remoteServiceHelloCallback(service)
 
     def _handle_bye(self, env, addr):
@@ -108,16 +165,27 @@ class Discovery:
     # search for & keep track of discovered remote services:
 
     def _addRemoteService(self, service):
-        self._remoteServices[service.getEPR()] = service
+        self._remoteServices.add(service)
+        self._metrics.services.set(("remote",), len(self._remoteServices))
 
     def _removeRemoteService(self, epr):
-        if epr in self._remoteServices:
-            del self._remoteServices[epr]
+        self._remoteServices.remove(epr)
+        self._metrics.services.set(("remote",), len(self._remoteServices))
+
+    def _notifyRemoteServiceListeners(self, service):
+        "pass a service that responded to a Probe or Resolve on to running searches"
+        for listener in list(self._remoteServiceListeners):
+            listener(service)
+
+    def getRemoteServices(self):
+        "remote services currently known, in the order they were discovered"
+        return self._remoteServices.values()
 
     def clearRemoteServices(self):
         'clears remotely discovered services'
 
         self._remoteServices.clear()
+        self._metrics.services.set(("remote",), 0)
 
     def searchServices(self, types=None, scopes=None, address=None, port=None,
                        timeout=DEFAULT_DISCOVERY_TIMEOUT):
@@ -129,7 +197,44 @@ class Discovery:
 
         time.sleep(timeout)
 
-        return filterServices(list(self._remoteServices.values()), types, scopes)
+        return self._remoteServices.filter(types, scopes)
+
+    def iterServices(self, types=None, scopes=None, address=None, port=None,
+                     timeout=DEFAULT_DISCOVERY_TIMEOUT, max_results=None, quiet_period=None):
+        """search for services given the TYPES and SCOPES, yielding each one
+        as soon as its Probe Match (or Resolve Match) has been received
+
+        The search ends after TIMEOUT seconds, once MAX_RESULTS services have
+        been yielded, or when no matching service has responded for
+        QUIET_PERIOD seconds (counted from the Probe until the first match).
+        Unlike searchServices(), only services responding to this search are
+        yielded. Services that respond without addresses are held back until
+        resolved, or yielded as they are when the search ends.
+        """
+        matches = queue.Queue()
+        search = _StreamingSearch(types, scopes, timeout, max_results, quiet_period)
+
+        self._remoteServiceListeners.append(matches.put)
+        try:
+            try:
+                self._sendProbe(types, scopes, address, port)
+            except:
+                raise Exception("Server not started")
+
+            while True:
+                wait = search.getWaitTime()
+                if wait <= 0:
+                    break
+                try:
+                    service = matches.get(timeout=wait)
+                except queue.Empty:
+                    continue
+                if search.accept(service):
+                    yield service
+
+            yield from search.getUnresolved()
+        finally:
+            self._remoteServiceListeners.remove(matches.put)
 
     def stop(self):
         self.clearRemoteServices()
@@ -145,3 +250,70 @@ class ThreadedWSDiscovery(Daemon, Discovery, ThreadedNetworking):
     def stop(self):
         super().stop()
 
+
+class AsyncWSDiscovery(Daemon, Discovery, AsyncioNetworking):
+    """Full asyncio service discovery implementation
+
+    start(), stop() and searchServices() are coroutines.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+    async def searchServices(self, types=None, scopes=None, address=None, port=None,
+                             timeout=DEFAULT_DISCOVERY_TIMEOUT):
+        'search for services given the TYPES and SCOPES within a given TIMEOUT'
+        try:
+            self._sendProbe(types, scopes, address, port)
+        except:
+            raise Exception("Server not started")
+
+        await asyncio.sleep(timeout)
+
+        return self._remoteServices.filter(types, scopes)
+
+    async def iterServices(self, types=None, scopes=None, address=None, port=None,
+                           timeout=DEFAULT_DISCOVERY_TIMEOUT, max_results=None, quiet_period=None):
+        """asynchronous generator version of Discovery.iterServices()"""
+        matches = asyncio.Queue()
+        search = _StreamingSearch(types, scopes, timeout, max_results, quiet_period)
+
+        self._remoteServiceListeners.append(matches.put_nowait)
+        try:
+            try:
+                self._sendProbe(types, scopes, address, port)
+            except:
+                raise Exception("Server not started")
+
+            while True:
+                wait = search.getWaitTime()
+                if wait <= 0:
+                    break
+                try:
+                    service = await asyncio.wait_for(matches.get(), wait)
+                except asyncio.TimeoutError:
+                    continue
+                if search.accept(service):
+                    yield service
+
+            for service in search.getUnresolved():
+                yield service
+        finally:
+            self._remoteServiceListeners.remove(matches.put_nowait)
+
+    async def stop(self):
+        self.clearRemoteServices()
+        await AsyncioNetworking.stop(self)
+
+
+class ReplayWSDiscovery(Daemon, Discovery, ReplayNetworking):
+    """service discovery fed with captured datagrams, see wsdiscovery.replay
+
+    The discovered services are left in the registry when stopped.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+    def stop(self):
+        ReplayNetworking.stop(self)
@@ -1,9 +1,17 @@
 """SOAP envelope implementation."""
 
 
+class BodyDecodeError(ValueError):
+    "the body of a received message could not be decoded"
+
+
 class SoapEnvelope:
     "envelope implementation"
 
+    __slots__ = ("_action", "_messageId", "_relatesTo", "_relationshipType", "_to", "_replyTo",
+                 "_instanceId", "_sequenceId", "_messageNumber", "_epr", "_types", "_scopes",
+                 "_xAddrs", "_metadataVersion", "_probeResolveMatches")
+
     def __init__(self):
         self._action = ""
         self._messageId = ""
@@ -110,3 +118,101 @@ class SoapEnvelope:
 
     def setProbeResolveMatches(self, probeResolveMatches):
         self._probeResolveMatches = probeResolveMatches
+
+    def getFields(self):
+        "the values of all fields, e.g. to pass the envelope to another process"
+        return tuple(getattr(self, name) for name in SoapEnvelope.__slots__)
+
+    @staticmethod
+    def fromFields(fields):
+        "envelope with the field values returned by getFields()"
+        env = SoapEnvelope.__new__(SoapEnvelope)
+        for name, value in zip(SoapEnvelope.__slots__, fields):
+            setattr(env, name, value)
+        return env
+
+
+class LazySoapEnvelope(SoapEnvelope):
+    """envelope of a received message, whose header fields are set when parsing
+    and whose body fields (EPR, types, scopes, XAddrs, metadata version & matches)
+    are decoded from the parsed body element the first time one is accessed
+
+    decodeBody(element, env) sets the body fields; if it fails, every body
+    accessor raises BodyDecodeError.
+    """
+
+    __slots__ = ("_decodeBody", "_bodyElement", "_bodyError")
+
+    def __init__(self, decodeBody, bodyElement):
+        super().__init__()
+        self._decodeBody = decodeBody
+        self._bodyElement = bodyElement
+        self._bodyError = None
+
+    def isBodyDecoded(self):
+        return self._decodeBody is None
+
+    def _decode(self):
+        if self._bodyError is not None:
+            raise self._bodyError
+        decodeBody, self._decodeBody = self._decodeBody, None
+        if decodeBody is not None:
+            element, self._bodyElement = self._bodyElement, None
+            try:
+                decodeBody(element, self)
+            except Exception as e:
+                self._bodyError = BodyDecodeError("invalid %s message body: %s" % (self._action, e))
+                self._bodyError.__cause__ = e
+                raise self._bodyError
+
+    def getEPR(self):
+        self._decode()
+        return self._epr
+
+    def setEPR(self, epr):
+        self._decode()
+        self._epr = epr
+
+    def getTypes(self):
+        self._decode()
+        return self._types
+
+    def setTypes(self, types):
+        self._decode()
+        self._types = types
+
+    def getScopes(self):
+        self._decode()
+        return self._scopes
+
+    def setScopes(self, scopes):
+        self._decode()
+        self._scopes = scopes
+
+    def getXAddrs(self):
+        self._decode()
+        return self._xAddrs
+
+    def setXAddrs(self, xAddrs):
+        self._decode()
+        self._xAddrs = xAddrs
+
+    def getMetadataVersion(self):
+        self._decode()
+        return self._metadataVersion
+
+    def setMetadataVersion(self, metadataVersion):
+        self._decode()
+        self._metadataVersion = metadataVersion
+
+    def getProbeResolveMatches(self):
+        self._decode()
+        return self._probeResolveMatches
+
+    def setProbeResolveMatches(self, probeResolveMatches):
+        self._decode()
+        self._probeResolveMatches = probeResolveMatches
+
+    def getFields(self):
+        self._decode()
+        return super().getFields()
@@ -1,58 +1,70 @@
 """Functions to serialize and deserialize messages between SOAP envelope & string representations"""
 
 import io, sys
-from .namespaces import NS_ADDRESSING, NS_SOAPENV
+from .namespaces import NS_ADDRESSING, NS_ADDRESSING_1_1, NS_SOAPENV
 from .actions import *
-from xml.dom import minidom
+from .parser import parseXML
 
 import logging
 
 logger = logging.getLogger(__name__)
 
+#: namespaces of the Action header of received messages
+ADDRESSING_NAMESPACES = (NS_ADDRESSING, NS_ADDRESSING_1_1)
+
+
+def printableData(data):
+    "received data as it should appear in log messages"
+    return bytes(data) if isinstance(data, memoryview) else data
+
+
 def createSOAPMessage(env):
-    "serialize SOAP envelopes into XML strings"
-
-    if env.getAction() == NS_ACTION_PROBE:
-        return createProbeMessage(env)
-    if env.getAction() == NS_ACTION_PROBE_MATCH:
-        return createProbeMatchMessage(env)
-    if env.getAction() == NS_ACTION_RESOLVE:
-        return createResolveMessage(env)
-    if env.getAction() == NS_ACTION_RESOLVE_MATCH:
-        return createResolveMatchMessage(env)
-    if env.getAction() == NS_ACTION_HELLO:
-        return createHelloMessage(env)
-    if env.getAction() == NS_ACTION_BYE:
-        return createByeMessage(env)
+    "serialize SOAP envelopes into XML strings; None for actions without a registered encoder"
 
+    action = getAction(env.getAction())
+    if action is not None and action.encoder is not None:
+        return action.encoder(env)
 
-def parseSOAPMessage(data, ipAddr):
-    "deserialize XML message strings into SOAP envelope objects"
+
+def parseSOAPEnvelope(data, ipAddr):
+    """parse an XML message into its SOAP envelope Element & action URI;
+    None for faults and messages that are not well-formed or have no action"""
     try:
-        dom = minidom.parseString(data)
+        dom = parseXML(data)
     except Exception as ex:
-        logger.debug('Failed to parse message from %s\n%s: %s', ipAddr, data, ex)
+        logger.debug('Failed to parse message from %s\n%s: %s', ipAddr, printableData(data), ex)
         return None
 
-    if dom.getElementsByTagNameNS(NS_SOAPENV, "Fault"):
-        logger.debug('Fault received from %s: %s', ipAddr, data)
+    bodyEl = dom.find(NS_SOAPENV, "Body")
+    if bodyEl is not None and bodyEl.find(NS_SOAPENV, "Fault") is not None:
+        logger.debug('Fault received from %s: %s', ipAddr, printableData(data))
         return None
 
-    actions = dom.getElementsByTagNameNS(NS_ADDRESSING, "Action")
-    if len(actions) == 0:
-        logger.warning('No action received from %s: %s', ipAddr, data)
+    headerEl = dom.find(NS_SOAPENV, "Header")
+    actionEl = None
+    if headerEl is not None:
+        for namespace in ADDRESSING_NAMESPACES:
+            actionEl = headerEl.find(namespace, "Action")
+            if actionEl is not None:
+                break
+    if actionEl is None:
+        logger.warning('No action received from %s: %s', ipAddr, printableData(data))
         return None
+    return dom, actionEl.getText()
 
-    soapAction = actions[0].firstChild.data.strip()
-    if soapAction == NS_ACTION_PROBE:
-        return parseProbeMessage(dom)
-    elif soapAction == NS_ACTION_PROBE_MATCH:
-        return parseProbeMatchMessage(dom)
-    elif soapAction == NS_ACTION_RESOLVE:
-        return parseResolveMessage(dom)
-    elif soapAction == NS_ACTION_RESOLVE_MATCH:
-        return parseResolveMatchMessage(dom)
-    elif soapAction == NS_ACTION_BYE:
-        return parseByeMessage(dom)
-    elif soapAction == NS_ACTION_HELLO:
-        return parseHelloMessage(dom)
+
+def decodeSOAPEnvelope(dom, actionURI, ipAddr):
+    "decode a parsed SOAP envelope Element with the decoder of its action; None if there is none"
+    action = getAction(actionURI)
+    if action is None or action.decoder is None:
+        logger.debug('Unknown action %s received from %s', actionURI, ipAddr)
+        return None
+    return action.decoder(dom)
+
+
+def parseSOAPMessage(data, ipAddr):
+    "deserialize XML messages (bytes, memoryviews or strings) into SOAP envelope objects"
+    parsed = parseSOAPEnvelope(data, ipAddr)
+    if parsed is None:
+        return None
+    return decodeSOAPEnvelope(*parsed, ipAddr)
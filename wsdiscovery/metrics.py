@@ -0,0 +1,262 @@
+"""Runtime metrics of a daemon, with Prometheus text export.
+
+Daemons count the datagrams they receive & send, parse failures, dropped
+duplicates and handled messages, track send queue depths and registry
+sizes, and record parse & handler latency histograms in a DaemonMetrics
+registry. Read it with ``getStats()``, render it with renderPrometheus(),
+or serve it for scraping with serveMetrics().
+"""
+
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("metrics")
+
+#: default latency histogram bucket upper bounds, in seconds
+DEFAULT_LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                           0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+
+#: content type of the Prometheus text exposition format
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+#: label value of datagrams received or sent on sockets not bound to an interface address
+ANY_INTERFACE = "any"
+
+
+def _escapeLabelValue(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatLabels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (name, _escapeLabelValue(value)) for name, value in pairs)
+
+
+def _formatNumber(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    "values of a metric by tuple of label values"
+
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _items(self):
+        with self._lock:
+            return sorted(self._values.items())
+
+    def getStats(self):
+        "list of {'labels': {name: value}, 'value': value} dicts"
+        return [{"labels": dict(zip(self.labelnames, labels)), "value": value}
+                for labels, value in self._items()]
+
+    def _renderSamples(self):
+        for labels, value in self._items():
+            yield "%s%s %s" % (self.name, _formatLabels(self.labelnames, labels), _formatNumber(value))
+
+    def render(self):
+        "the metric in the Prometheus text exposition format"
+        lines = ["# HELP %s %s" % (self.name, self.help.replace("\\", "\\\\").replace("\n", "\\n")),
+                 "# TYPE %s %s" % (self.name, self.type)]
+        lines.extend(self._renderSamples())
+        return "\n".join(lines) + "\n"
+
+
+class Counter(_Metric):
+    "monotonically increasing count"
+
+    type = "counter"
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, labels=()):
+        with self._lock:
+            return self._values.get(labels, 0)
+
+
+class Gauge(_Metric):
+    "value that goes up and down"
+
+    type = "gauge"
+
+    def set(self, labels, value):
+        with self._lock:
+            self._values[labels] = value
+
+    def get(self, labels=()):
+        with self._lock:
+            return self._values.get(labels, 0)
+
+
+class _HistogramValue:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(_Metric):
+    "distribution of observed values over buckets"
+
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._values.get(labels)
+            if histogram is None:
+                histogram = self._values[labels] = _HistogramValue(self.buckets)
+            histogram.counts[index] += 1
+            histogram.sum += value
+            histogram.count += 1
+
+    def _items(self):
+        "(labels, (cumulative bucket counts, sum, count)) pairs"
+        with self._lock:
+            items = [(labels, (list(h.counts), h.sum, h.count)) for labels, h in self._values.items()]
+        result = []
+        for labels, (counts, total, count) in sorted(items):
+            cumulative = []
+            running = 0
+            for bucketCount in counts:
+                running += bucketCount
+                cumulative.append(running)
+            result.append((labels, (cumulative, total, count)))
+        return result
+
+    def getStats(self):
+        "list of {'labels': ..., 'value': {'buckets': {le: count}, 'sum': ..., 'count': ...}} dicts"
+        stats = []
+        for labels, (cumulative, total, count) in self._items():
+            bounds = self.buckets + (float("inf"),)
+            stats.append({"labels": dict(zip(self.labelnames, labels)),
+                          "value": {"buckets": dict(zip(bounds, cumulative)), "sum": total, "count": count}})
+        return stats
+
+    def _renderSamples(self):
+        bounds = self.buckets + (float("inf"),)
+        for labels, (cumulative, total, count) in self._items():
+            for bound, bucketCount in zip(bounds, cumulative):
+                yield "%s_bucket%s %i" % (self.name, _formatLabels(self.labelnames, labels,
+                                                                   [("le", _formatNumber(bound))]),
+                                          bucketCount)
+            yield "%s_sum%s %s" % (self.name, _formatLabels(self.labelnames, labels), _formatNumber(total))
+            yield "%s_count%s %i" % (self.name, _formatLabels(self.labelnames, labels), count)
+
+
+class MetricsRegistry:
+    "named metrics, exported together"
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError("metric %s already registered" % metric.name)
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def __getitem__(self, name):
+        return self._metrics[name]
+
+    def getStats(self):
+        "values of all metrics by name"
+        return {name: metric.getStats() for name, metric in self._metrics.items()}
+
+    def renderPrometheus(self):
+        "all metrics in the Prometheus text exposition format"
+        return "".join(metric.render() for metric in self._metrics.values())
+
+
+class DaemonMetrics(MetricsRegistry):
+    "the metrics of a WS-Discovery daemon"
+
+    def __init__(self):
+        super().__init__()
+        self.datagramsReceived = self.counter(
+            "wsdiscovery_datagrams_received_total", "Datagrams received",
+            ("family", "interface"))
+        self.datagramsSent = self.counter(
+            "wsdiscovery_datagrams_sent_total", "Datagrams sent, including retransmissions",
+            ("family", "interface"))
+        self.parseFailures = self.counter(
+            "wsdiscovery_parse_failures_total", "Received datagrams that could not be parsed",
+            ("family",))
+        self.duplicatesDropped = self.counter(
+            "wsdiscovery_duplicates_dropped_total",
+            "Received messages dropped as duplicate or out of sequence", ("family", "reason"))
+        self.messagesReceived = self.counter(
+            "wsdiscovery_messages_received_total", "Messages passed on to the daemon, by action",
+            ("action",))
+        self.sendQueueDepth = self.gauge(
+            "wsdiscovery_send_queue_depth", "Messages waiting to be sent or retransmitted",
+            ("family",))
+        self.services = self.gauge(
+            "wsdiscovery_services", "Services in the registries of discovered & published services",
+            ("registry",))
+        self.parseSeconds = self.histogram(
+            "wsdiscovery_parse_seconds", "Time spent parsing a received datagram", ("family",))
+        self.handlerSeconds = self.histogram(
+            "wsdiscovery_handler_seconds", "Time spent handling a received message, by action",
+            ("action",))
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.registry.renderPrometheus().encode("UTF-8")
+        self.send_response(200)
+        self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+def serveMetrics(registry, port, host=""):
+    """serve the metrics of a registry for Prometheus to scrape at /metrics
+    from a background thread; stop it with shutdown() & server_close()"""
+    server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    server.daemon_threads = True
+    server.registry = registry
+    thread = threading.Thread(target=server.serve_forever, name="metrics server")
+    thread.daemon = True
+    thread.start()
+    return server
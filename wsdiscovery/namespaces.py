@@ -7,6 +7,12 @@ NS_ADDRESSING = "http://schemas.xmlsoap.org/ws/2004/08/addressing"
 #: Discovery namespace
 NS_DISCOVERY = "http://schemas.xmlsoap.org/ws/2005/04/discovery"
 
+#: Addressing namespace of WS-Discovery 1.1
+NS_ADDRESSING_1_1 = "http://www.w3.org/2005/08/addressing"
+
+#: WS-Discovery 1.1 namespace, whose actions are not registered by default
+NS_DISCOVERY_1_1 = "http://docs.oasis-open.org/ws-dd/ns/discovery/2009/01"
+
 #: SOAP envelope namespace
 NS_SOAPENV = "http://www.w3.org/2003/05/soap-envelope"
 
@@ -0,0 +1,96 @@
+"""Notification of local address changes through Linux rtnetlink.
+
+The kernel multicasts ``RTM_NEWADDR`` & ``RTM_DELADDR`` messages to the
+address groups of ``NETLINK_ROUTE`` sockets the moment an address is added
+or removed, so address monitors can wait for these instead of enumerating
+the network interfaces periodically. Where rtnetlink is not available,
+openAddressChangeSocket() returns None and the monitors fall back to polling.
+"""
+
+import errno
+import logging
+import socket
+import struct
+
+logger = logging.getLogger("netlink")
+
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+
+_GROUPS = {socket.AF_INET: RTMGRP_IPV4_IFADDR, socket.AF_INET6: RTMGRP_IPV6_IFADDR}
+
+# struct nlmsghdr: length, type, flags, sequence number, port ID
+_NLMSGHDR = struct.Struct("=IHHII")
+# struct ifaddrmsg: family, prefix length, flags, scope, interface index
+_IFADDRMSG = struct.Struct("=BBBBI")
+
+_RECV_SIZE = 0x10000
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def parseAddressChanges(data, family):
+    "tell whether rtnetlink messages in data report an address of the family added or removed"
+    offset = 0
+    while offset + _NLMSGHDR.size <= len(data):
+        length, msgType = _NLMSGHDR.unpack_from(data, offset)[:2]
+        if length < _NLMSGHDR.size or offset + length > len(data):
+            break
+        if msgType in (RTM_NEWADDR, RTM_DELADDR) and length >= _NLMSGHDR.size + _IFADDRMSG.size:
+            if _IFADDRMSG.unpack_from(data, offset + _NLMSGHDR.size)[0] == family:
+                return True
+        offset += _align(length)
+    return False
+
+
+class AddressChangeSocket:
+    "non-blocking rtnetlink socket subscribed to address changes of one address family"
+
+    def __init__(self, family):
+        self._family = family
+        self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        try:
+            self._sock.setblocking(0)
+            self._sock.bind((0, _GROUPS[family]))
+        except OSError:
+            self._sock.close()
+            raise
+
+    def fileno(self):
+        return self._sock.fileno()
+
+    def readChanges(self):
+        "read all pending notifications; tell whether any address of the family changed"
+        changed = False
+        while True:
+            try:
+                data = self._sock.recv(_RECV_SIZE)
+            except BlockingIOError:
+                return changed
+            except OSError as e:
+                if e.errno == errno.ENOBUFS:
+                    # notifications were dropped; assume something changed
+                    changed = True
+                    continue
+                raise
+            if parseAddressChanges(data, self._family):
+                changed = True
+
+    def close(self):
+        self._sock.close()
+
+
+def openAddressChangeSocket(family):
+    "AddressChangeSocket for the family, or None if rtnetlink is not available"
+    if not hasattr(socket, "AF_NETLINK") or family not in _GROUPS:
+        return None
+    try:
+        return AddressChangeSocket(family)
+    except OSError as e:
+        logger.debug("rtnetlink not available, polling for address changes: %s", e)
+        return None
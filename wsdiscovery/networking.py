@@ -0,0 +1,340 @@
+"""Networking facilities shared by the threaded and asyncio daemon implementations."""
+
+import logging
+import platform
+import socket
+import struct
+import time
+
+from .actions import *
+from .envelope import BodyDecodeError
+from .message import parseSOAPMessage, printableData
+from .capture import CAPTURE_RECV, CAPTURE_SEND, CAPTURE_BAD
+from .dedup import DedupCache, peekMessageIds
+from .metrics import ANY_INTERFACE
+from .tracing import TRACE_RECEIVED, TRACE_PARSED, TRACE_DUPLICATE, TRACE_ENQUEUED, \
+                     TRACE_SENT, TRACE_FINISHED
+
+BUFFER_SIZE = 0xffff
+#: size of the buffer a batch of received datagrams is read into
+RECV_BUFFER_SIZE = 0x100000
+#: maximum number of datagrams read in a batch before handling them
+RECV_BATCH_SIZE = 256
+#: socket receive buffer size requested, to hold bursts of responses; capped by the OS
+SOCKET_RECV_BUFFER_SIZE = 0x100000
+NETWORK_ADDRESSES_CHECK_TIMEOUT = 5
+MULTICAST_PORT = 3702
+MULTICAST_IPV4_ADDRESS = "239.255.255.250"
+MULTICAST_IPV6_ADDRESS = "FF02::C"
+
+logger = logging.getLogger("networking")
+
+
+class MulticastSockets:
+    "address family agnostic multicast socket creation"
+
+    def _makeMreq(self, addr) -> bytes:
+        pass
+
+    def _get_inet(self) -> int:
+        pass
+
+    def _get_multicast(self) -> int:
+        pass
+
+    def _get_ip_proto(self) -> int:
+        pass
+
+    def _get_ip_join(self) -> int:
+        pass
+
+    def _get_ip_leave(self) -> int:
+        pass
+
+    def _get_multicast_ttl(self) -> int:
+        pass
+
+    def _setRecvBufferSize(self, sock):
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_RECV_BUFFER_SIZE)
+        except OSError as e:
+            logger.debug("could not set the socket receive buffer size: %s", e)
+
+    def _createMulticastOutSocket(self, addr, ttl):
+        ip_proto = self._get_ip_proto()
+        sock = socket.socket(self._get_inet(), socket.SOCK_DGRAM)
+        sock.setblocking(0)
+        self._setRecvBufferSize(sock)
+        sock.setsockopt(ip_proto, self._get_multicast_ttl(), ttl)
+
+        if not addr:
+            iface = socket.INADDR_ANY
+        elif self._get_inet() == socket.AF_INET:
+            iface = addr.packed
+        else:
+            iface = int(addr.scope_id)
+
+        try:
+            sock.setsockopt(ip_proto, self._get_multicast(), iface)
+        except OSError as e:
+            logger.warning(
+                "Interface for %s does not support "
+                "multicast flags or is not UP: OSError %s",
+                addr,
+                e
+            )
+
+        return sock
+
+    def _createMulticastInSocket(self):
+        sock = socket.socket(self._get_inet(), socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+        if platform.system() in ["Darwin", "FreeBSD"]:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+        sock.bind(('', MULTICAST_PORT))
+        sock.setblocking(0)
+        self._setRecvBufferSize(sock)
+
+        return sock
+
+
+class IPv4Sockets(MulticastSockets):
+    "IPv4 multicast socket options"
+
+    def _makeMreq(self, addr):
+        "IPvv multicast group join/leave request"
+        return struct.pack("4s4s", socket.inet_aton(MULTICAST_IPV4_ADDRESS), addr.packed)
+
+    def _get_inet(self):
+        return socket.AF_INET
+
+    def _get_multicast(self):
+        return socket.IP_MULTICAST_IF
+
+    def _get_ip_proto(self):
+        return socket.IPPROTO_IP
+
+    def _get_ip_join(self):
+        return socket.IP_ADD_MEMBERSHIP
+
+    def _get_ip_leave(self):
+        return socket.IP_DROP_MEMBERSHIP
+
+    def _get_multicast_ttl(self):
+        return socket.IP_MULTICAST_TTL
+
+
+class IPv6Sockets(MulticastSockets):
+    "IPv6 multicast socket options"
+
+    def _makeMreq(self, addr):
+        "IPv6 multicast group join/leave request"
+        return struct.pack("=16si", socket.inet_pton(socket.AF_INET6, MULTICAST_IPV6_ADDRESS), int(addr.scope_id))
+
+    def _get_inet(self):
+        return socket.AF_INET6
+
+    def _get_multicast(self):
+        return socket.IPV6_MULTICAST_IF
+
+    def _get_ip_proto(self):
+        return socket.IPPROTO_IPV6
+
+    def _get_ip_join(self):
+        return socket.IPV6_JOIN_GROUP
+
+    def _get_ip_leave(self):
+        return socket.IPV6_LEAVE_GROUP
+
+    def _get_multicast_ttl(self):
+        return socket.IPV6_MULTICAST_HOPS
+
+
+class ReceiveBuffer:
+    """preallocated buffer that a batch of datagrams is received into, back to back
+
+    The datagrams are memoryviews of the buffer, valid until reset().
+    """
+
+    def __init__(self, size=RECV_BUFFER_SIZE):
+        self._buffer = bytearray(max(size, BUFFER_SIZE))
+        self._view = memoryview(self._buffer)
+        self._offset = 0
+
+    def isFull(self):
+        "tell whether a datagram of the largest size might not fit"
+        return len(self._buffer) - self._offset < BUFFER_SIZE
+
+    def recvFrom(self, sock):
+        "receive a datagram from a socket; return (datagram view, sender address)"
+        nbytes, addr = sock.recvfrom_into(self._view[self._offset:], BUFFER_SIZE)
+        data = self._view[self._offset:self._offset + nbytes]
+        self._offset += nbytes
+        return data, addr
+
+    def reset(self):
+        self._offset = 0
+
+
+class DatagramHandler:
+    """parse incoming datagrams, drop duplicate & out-of-sequence messages
+    and pass the rest on to the observer (the daemon)"""
+
+    def __init__(self, observer):
+        self._knownMessageIds = DedupCache(observer._dedup_capacity, observer._dedup_window)
+        self._iidMap = DedupCache(observer._dedup_capacity, observer._dedup_window)
+        self._observer = observer
+        self._capture = observer._capture
+        self._relates_to = observer._relates_to
+        self._metrics = observer._metrics
+        self._tracer = observer._tracer
+        self._family = "IPv6" if self._get_inet() == socket.AF_INET6 else "IPv4"
+        self._familyLabel = (self._family,)
+
+    def _getOwnAddrs(self):
+        "local addresses, messages from which are not logged or captured"
+        return ()
+
+    def _rememberMessageId(self, mid):
+        self._knownMessageIds.add(mid)
+
+    def _checkDuplicate(self, mid, relatesTo, remember=True):
+        """remember the message ID of a received message unless told not to; tell
+        whether it was known, and the message is not to be handled anyway for
+        relating to a known message"""
+        if mid in self._knownMessageIds:
+            return not (self._relates_to and relatesTo in self._knownMessageIds)
+        if remember:
+            self._knownMessageIds.add(mid)
+        return False
+
+    def getDedupStats(self):
+        "statistics of the message ID & application sequence caches"
+        return {
+            "message_ids": self._knownMessageIds.getStats(),
+            "app_sequences": self._iidMap.getStats(),
+        }
+
+    def _getLocalEndpoint(self, sockname, source=None):
+        "local (host, port) of a socket, with its source address if bound to all"
+        return (sockname[0] if source is None else str(source), sockname[1])
+
+    def _traceEnqueued(self, msg):
+        self._tracer.emit(TRACE_ENQUEUED, msg.getEnv(), (msg.getAddr(), msg.getPort()), msg.msgType())
+
+    def _traceSent(self, msg):
+        "trace a message (re)transmission, and its last one"
+        env = msg.getEnv()
+        peer = (msg.getAddr(), msg.getPort())
+        self._tracer.emit(TRACE_SENT, env, peer, msg.getSendCount())
+        if msg.isFinished():
+            self._tracer.emit(TRACE_FINISHED, env, peer, msg.getSendCount())
+
+    def _captureReceived(self, event, data, addr, local):
+        # the capture is written later, while data may be a view of a reused buffer
+        self._capture.capture(event, addr, local, bytes(data))
+
+    def _captureSent(self, data, addr, port, local=None):
+        self._capture.capture(CAPTURE_SEND, (addr, port), local, data)
+
+    def _interfaceLabel(self, iface):
+        "metrics labels of a socket with source address iface, None if bound to all"
+        return (self._family, ANY_INTERFACE if iface is None else str(iface))
+
+    def _handleDatagram(self, data, addr, local=None, iface=None):
+        """handle a single received datagram, as bytes or a memoryview; addr is
+        the sender (host, port) tuple, local the (host, port) it was received on
+        if known, iface the source address of the receiving socket, None if
+        bound to all addresses
+
+        Tells whether the datagram could be parsed.
+        """
+        if self._receiveDatagram(data, addr, local, iface):
+            return True
+        return self._handleParsed(*self._parseDatagram(data, addr), data, addr, local)
+
+    def _parseDatagram(self, data, addr):
+        "envelope parsed from a received datagram, None if it could not be, and the parse time"
+        start = time.perf_counter()
+        try:
+            env = parseSOAPMessage(data, addr[0])
+        except Exception as e:
+            logger.debug("Failed to parse message from %s\n%s: %s", addr[0], printableData(data), e,
+                         exc_info=True)
+            env = None
+        return env, time.perf_counter() - start
+
+    def _receiveDatagram(self, data, addr, local, iface):
+        """count a received datagram; tell whether it is dropped for repeating a known message ID"""
+        self._metrics.datagramsReceived.inc(self._interfaceLabel(iface))
+        if self._tracer:
+            self._tracer.emit(TRACE_RECEIVED, None, addr, len(data))
+
+        # most datagrams are retransmissions: drop known ones without parsing them;
+        # the message ID is only remembered once parsed, not to drop valid copies of a bad one
+        peeked = peekMessageIds(data)
+        if peeked is not None and self._checkDuplicate(*peeked, remember=False):
+            self._metrics.duplicatesDropped.inc((self._family, "message_id"))
+            if self._tracer:
+                self._tracer.emit(TRACE_DUPLICATE, None, addr, "message_id", *peeked)
+            if self._capture and addr[0] not in self._getOwnAddrs():
+                self._captureReceived(CAPTURE_RECV, data, addr, local)
+            return True
+        return False
+
+    def _handleParsed(self, env, seconds, data, addr, local):
+        """handle the envelope parsed from a received datagram in the given time,
+        None if it could not be parsed; tells whether it could"""
+        self._metrics.parseSeconds.observe(self._familyLabel, seconds)
+        if self._tracer:
+            self._tracer.emit(TRACE_PARSED, env, addr, env is not None)
+
+        if env is None:  # fault or failed to parse
+            self._metrics.parseFailures.inc(self._familyLabel)
+            if self._capture:
+                self._captureReceived(CAPTURE_BAD, data, addr, local)
+            return False
+
+        if addr[0] not in self._getOwnAddrs():
+            if env.getAction() == NS_ACTION_PROBE_MATCH:
+                # the raw message, as decoding the body is left to the handler
+                msg = "probe response from %s:\n --- begin ---\n%s\n--- end ---\n"
+                logger.debug(msg, addr[0], printableData(data))
+
+            if self._capture:
+                self._captureReceived(CAPTURE_RECV, data, addr, local)
+
+        mid = env.getMessageId()
+        if self._checkDuplicate(mid, env.getRelatesTo()):
+            self._metrics.duplicatesDropped.inc((self._family, "message_id"))
+            if self._tracer:
+                self._tracer.emit(TRACE_DUPLICATE, env, addr, "message_id")
+            return True
+
+        iid = env.getInstanceId()
+        if len(iid) > 0 and int(iid) >= 0:
+            mnum = env.getMessageNumber()
+            key = addr[0] + ":" + str(addr[1]) + ":" + str(iid)
+            if mid is not None and len(mid) > 0:
+                key = key + ":" + mid
+            tmnum = self._iidMap.get(key)
+            if tmnum is None:
+                self._iidMap[key] = iid
+            else:
+                if mnum > tmnum:
+                    self._iidMap[key] = mnum
+                else:
+                    self._metrics.duplicatesDropped.inc((self._family, "app_sequence"))
+                    if self._tracer:
+                        self._tracer.emit(TRACE_DUPLICATE, env, addr, "app_sequence")
+                    return True
+
+        try:
+            self._observer.envReceived(env, addr)
+        except BodyDecodeError as e:
+            logger.debug("Failed to decode message from %s\n%s: %s", addr[0], printableData(data), e)
+            self._metrics.parseFailures.inc(self._familyLabel)
+            return False
+        return True
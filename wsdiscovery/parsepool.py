@@ -0,0 +1,92 @@
+"""Parsing of received datagrams in worker processes.
+
+With the ``parse_workers`` option, the networking threads of threaded
+daemons only read datagrams and drop known duplicates; a pool of processes
+parses the other datagrams in batches into envelope fields, and the
+networking threads handle the resulting envelopes in the order the
+datagrams were received. This spreads the parsing of high message rates
+over several cores, where the networking threads are bound by the GIL.
+
+The workers decode messages with the actions registered on import of the
+package. Messages of actions registered, or registered differently, in the
+daemon process only are parsed again by the networking threads.
+"""
+
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .actions import getAction, getActions
+from .message import parseSOAPEnvelope, decodeSOAPEnvelope
+
+logger = logging.getLogger("parsepool")
+
+
+def _decoderName(action):
+    "qualified name of the decoder of an Action, None if it has none"
+    if action is None or action.decoder is None:
+        return None
+    return "%s.%s" % (action.decoder.__module__, action.decoder.__qualname__)
+
+
+def getDecoderNames():
+    "qualified names of the decoders of the registered actions, by action URI"
+    return {action.uri: _decoderName(action) for action in getActions()}
+
+
+def parseBatch(datagrams):
+    """parse a list of (data, sender host) pairs into a list of (envelope fields,
+    parse seconds, action URI) tuples, see SoapEnvelope.getFields(); fields are
+    None for datagrams that could not be parsed, the action URI for those
+    without a SOAP envelope & action"""
+    results = []
+    for data, host in datagrams:
+        start = time.perf_counter()
+        fields = actionURI = None
+        try:
+            parsed = parseSOAPEnvelope(data, host)
+            if parsed is not None:
+                actionURI = parsed[1]
+                env = decodeSOAPEnvelope(*parsed, host)
+                # the body is decoded here rather than in the networking thread
+                fields = env.getFields() if env is not None else None
+        except Exception as e:
+            logger.debug("Failed to parse message from %s: %s", host, e)
+            fields = None
+        results.append((fields, time.perf_counter() - start, actionURI))
+    return results
+
+
+class ParsePool:
+    """worker processes parsing batches of received datagrams
+
+    The workers are spawned, as forking a process running threads may
+    deadlock them, and they are started right away rather than from a
+    networking thread. As with any spawned process, the main module must
+    be importable without side effects: start daemons under an
+    ``if __name__ == "__main__":`` guard.
+    """
+
+    def __init__(self, workers):
+        self._executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+        #: batches being parsed, beyond which a networking thread waits for the oldest
+        self.maxPending = 2 * workers
+        try:
+            for future in [self._executor.submit(parseBatch, []) for i in range(workers)]:
+                future.result()
+            self._decoderNames = self._executor.submit(getDecoderNames).result()
+        except BaseException:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    def decodes(self, actionURI):
+        "tell whether the workers decode messages of the action as the daemon process does"
+        return self._decoderNames.get(actionURI) == _decoderName(getAction(actionURI))
+
+    def submit(self, datagrams):
+        "future of the parseBatch() results of a list of (data, sender host) pairs"
+        return self._executor.submit(parseBatch, datagrams)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,122 @@
+"""Single-pass XML parser for incoming SOAP messages.
+
+Builds a light-weight element tree with :mod:`xml.parsers.expat`, keeping the
+namespace prefix declarations in scope at each element, so that qualified
+names in element text (e.g. ``dn:NetworkVideoTransmitter`` in ``Types``) can
+be resolved without walking back up the tree.
+"""
+
+from xml.parsers import expat
+
+#: separator between namespace URI & local name in names reported by expat
+_NS_SEPARATOR = " "
+
+
+class Element:
+    "parsed XML element"
+
+    __slots__ = ("namespace", "localname", "attributes", "children", "nsmap", "text")
+
+    def __init__(self, namespace, localname, attributes, nsmap):
+        self.namespace = namespace
+        self.localname = localname
+        self.attributes = attributes
+        self.children = []
+        self.nsmap = nsmap
+        self.text = ""
+
+    def find(self, namespace, localname):
+        "first child element with the given name, or None"
+        for child in self.children:
+            if child.localname == localname and child.namespace == namespace:
+                return child
+        return None
+
+    def findAll(self, namespace, localname):
+        "all child elements with the given name"
+        return [child for child in self.children
+                if child.localname == localname and child.namespace == namespace]
+
+    def findText(self, namespace, localname):
+        "stripped text of the first child element with the given name; raise ValueError if missing"
+        child = self.find(namespace, localname)
+        if child is None:
+            raise ValueError("missing %s element in %s" % (localname, self.localname))
+        return child.getText()
+
+    def getText(self):
+        return self.text.strip()
+
+    def getAttribute(self, name):
+        "value of an unqualified attribute, empty string if missing"
+        return self.attributes.get(name, "")
+
+    def lookupNamespace(self, prefix):
+        "namespace URI bound to prefix (None for the default namespace), empty string if unbound"
+        return self.nsmap.get(prefix, "")
+
+    def __repr__(self):
+        return "<%s %s>" % (self.namespace, self.localname)
+
+
+class _TreeBuilder:
+    "expat handlers building the element tree"
+
+    def __init__(self):
+        self.root = None
+        self._stack = []
+        self._nsmap = {}
+        self._pendingNsmap = None
+        self._text = []
+
+    def startNamespaceDecl(self, prefix, uri):
+        if self._pendingNsmap is None:
+            self._pendingNsmap = dict(self._nsmap)
+        self._pendingNsmap[prefix] = uri
+
+    def startElement(self, name, attributes):
+        if self._pendingNsmap is not None:
+            self._nsmap = self._pendingNsmap
+            self._pendingNsmap = None
+
+        namespace, _, localname = name.rpartition(_NS_SEPARATOR)
+        el = Element(namespace, localname, attributes, self._nsmap)
+
+        if self._stack:
+            parent = self._stack[-1]
+            parent.text += "".join(self._text)
+            parent.children.append(el)
+        else:
+            self.root = el
+        self._text = []
+        self._stack.append(el)
+
+    def endElement(self, name):
+        el = self._stack.pop()
+        el.text += "".join(self._text)
+        self._text = []
+        if self._stack:
+            self._nsmap = self._stack[-1].nsmap
+
+    def characterData(self, data):
+        self._text.append(data)
+
+    def startDoctypeDecl(self, *args):
+        # SOAP messages must not contain a DTD; refusing one also rules out entity expansion attacks
+        raise ValueError("DTDs are not allowed in SOAP messages")
+
+
+def parseXML(data):
+    "parse an XML document given as bytes or string; return the root Element"
+    builder = _TreeBuilder()
+
+    parser = expat.ParserCreate(namespace_separator=_NS_SEPARATOR)
+    parser.buffer_text = True
+    parser.StartNamespaceDeclHandler = builder.startNamespaceDecl
+    parser.StartElementHandler = builder.startElement
+    parser.EndElementHandler = builder.endElement
+    parser.CharacterDataHandler = builder.characterData
+    parser.StartDoctypeDeclHandler = builder.startDoctypeDecl
+
+    parser.Parse(data, True)
+    return builder.root
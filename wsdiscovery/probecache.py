@@ -0,0 +1,159 @@
+"""Cache of the Probe Match responses of a publisher.
+
+Most probes on a network carry the same few Types & Scopes filters, so the
+services matching a filter and the rendered body of the Probe Match
+message listing them are kept, and only the header (message ID, RelatesTo
+and application sequence) is rendered for each response. Responses listing
+many services are split into several messages, each within a payload budget.
+"""
+
+import threading
+from collections import OrderedDict
+
+from .actions import constructProbeMatch, createProbeMatchMessage, renderProbeMatchFragments, \
+                     renderProbeMatchesBody
+from .actions import ProbeResolveMatch
+from .scopematch import ScopeMatcher
+from .serializer import NamespacePrefixes
+
+#: default maximum number of distinct probe filters to keep responses for
+DEFAULT_PROBE_MATCH_CACHE_SIZE = 256
+
+#: default payload budget of a Probe Match message, in bytes, to stay within a typical MTU
+DEFAULT_PROBE_MATCH_MAX_SIZE = 1400
+
+
+def probeFilterKey(types, scopes):
+    "hashable key, equal for probe filters matching the same services"
+    return (frozenset(ttype.getFullname() for ttype in types or []),
+            frozenset(ScopeMatcher(scope).getKey() for scope in scopes or []))
+
+
+class CachedProbeMatch:
+    """services matching a probe filter, with their rendered ``ProbeMatch`` elements
+
+    A response lists all the services in one Probe Match message, or is split
+    into as many messages as needed to keep each one within a payload budget.
+    """
+
+    def __init__(self, services):
+        self._services = list(services)
+        self._probeMatches = [ProbeResolveMatch(srv.getEPR(), srv.getTypes(), srv.getScopes(),
+                                                srv.getXAddrs(), str(srv.getMetadataVersion()))
+                              for srv in self._services]
+        self._prefixes = NamespacePrefixes()
+        self._fragments = renderProbeMatchFragments(self._probeMatches, self._prefixes)
+        self._sizes = [len(fragment.encode("UTF-8")) for fragment in self._fragments]
+        self._renderedBody = renderProbeMatchesBody(self._probeMatches, self._fragments, self._prefixes)
+
+    def getServices(self):
+        return self._services
+
+    def constructEnvelope(self, relatesTo):
+        "Probe Match envelope listing all the services, in response to the probe with the given message ID"
+        return constructProbeMatch(self._services, relatesTo, self._probeMatches)
+
+    def render(self, env):
+        "serialize an envelope made by constructEnvelope()"
+        return createProbeMatchMessage(env, self._renderedBody)
+
+    def _pack(self, maxSize, overhead):
+        "split the fragments into (start, end) ranges of at most maxSize bytes with overhead"
+        ranges = []
+        start = 0
+        size = overhead
+        for i, fragmentSize in enumerate(self._sizes):
+            if i > start and size + fragmentSize > maxSize:
+                ranges.append((start, i))
+                start = i
+                size = overhead
+            size += fragmentSize
+        ranges.append((start, len(self._sizes)))
+        return ranges
+
+    def constructMessages(self, relatesTo, maxSize=None):
+        """Probe Match envelopes with their UTF-8 encoded serializations, in response
+        to the probe with the given message ID
+
+        If maxSize is given, the services are packed into as many messages as
+        needed to keep each within maxSize bytes; these share the instance ID
+        and are numbered in order. A service too large for a message on its
+        own is sent in a message of its own anyway.
+        """
+        env = self.constructEnvelope(relatesTo)
+        if maxSize is None or len(self._services) < 2 or sum(self._sizes) < maxSize:
+            data = self.render(env).encode("UTF-8")
+            if maxSize is None or len(data) <= maxSize or len(self._services) < 2:
+                return [(env, data)]
+
+        # envelope & header size, with the longest message number
+        env.setMessageNumber(str(len(self._services)))
+        overhead = len(createProbeMatchMessage(env, renderProbeMatchesBody([], [], self._prefixes))
+                       .encode("UTF-8"))
+
+        messages = []
+        for number, (start, end) in enumerate(self._pack(maxSize, overhead), 1):
+            part = constructProbeMatch(self._services[start:end], relatesTo, self._probeMatches[start:end])
+            part.setInstanceId(env.getInstanceId())
+            part.setMessageNumber(str(number))
+            body = renderProbeMatchesBody(None, self._fragments[start:end], self._prefixes)
+            messages.append((part, createProbeMatchMessage(part, body).encode("UTF-8")))
+        return messages
+
+
+class ProbeMatchCache:
+    """Probe Match responses by probe filter, least recently used dropped first
+
+    clear() must be called whenever the published services, or their
+    addresses, change.
+    """
+
+    def __init__(self, capacity=DEFAULT_PROBE_MATCH_CACHE_SIZE):
+        self._capacity = capacity
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, types, scopes, findServices):
+        """cached response to a probe filter; on a miss, findServices(types, scopes)
+        is called for the matching services and the response is cached"""
+        key = probeFilterKey(types, scopes)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            generation = self._generation
+
+        entry = CachedProbeMatch(findServices(types, scopes))
+
+        with self._lock:
+            # do not keep a response computed from services that have changed since
+            if generation == self._generation and self._capacity > 0:
+                self._entries[key] = entry
+                if len(self._entries) > self._capacity:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def getStats(self):
+        "size & hit and miss counters"
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "capacity": self._capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
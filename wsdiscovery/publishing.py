@@ -7,23 +7,32 @@ import uuid
 
 from .actions import *
 from .uri import URI
-from .util import filterServices, _generateInstanceId
+from .util import _generateInstanceId
+from .registry import ServiceRegistry
+from .probecache import ProbeMatchCache, DEFAULT_PROBE_MATCH_CACHE_SIZE, DEFAULT_PROBE_MATCH_MAX_SIZE
 from .service import Service
 from .threaded import ThreadedNetworking
+from .aio import AsyncioNetworking
+from .replay import ReplayNetworking
 from .daemon import Daemon
 
 
 class Publishing:
     "networking-agnostic generic service publishing mixin"
 
-    def __init__(self, **kwargs):
-        self._localServices = {}
+    def __init__(self, probe_match_cache_size=DEFAULT_PROBE_MATCH_CACHE_SIZE,
+                 probe_match_max_size=DEFAULT_PROBE_MATCH_MAX_SIZE, **kwargs):
+        self._probeMatchCache = ProbeMatchCache(probe_match_cache_size)
+        # Probe Match responses list the published services as they were
+        self._localServices = ServiceRegistry(on_change=self._probeMatchCache.clear)
+        self._probe_match_max_size = probe_match_max_size
         super().__init__(**kwargs)
 
     def _handle_probe(self, env, addr):
         "handle NS_ACTION_PROBE"
-        services = filterServices(list(self._localServices.values()), env.getTypes(), env.getScopes())
-        self._sendProbeMatch(services, env.getMessageId(), addr)
+        cached = self._probeMatchCache.get(env.getTypes(), env.getScopes(), self._localServices.filter)
+        self._sendProbeMatch(cached.getServices(), env.getMessageId(), addr, cached,
+                             self._probe_match_max_size)
 
     def _handle_resolve(self, env, addr):
         "handle NS_ACTION_RESOLVE"
@@ -34,28 +43,60 @@ class Publishing:
 
     def  _networkAddressAdded(self, addr):
         self.addSourceAddr(addr)
+        # {ip} XAddrs of the published services expand to the new address
+        self._probeMatchCache.clear()
         for service in list(self._localServices.values()):
             self._sendHello(service)
 
     def _networkAddressRemoved(self, addr):
         self.removeSourceAddr(addr)
+        self._probeMatchCache.clear()
 
 
-    def publishService(self, types, scopes, xAddrs):
+    def publishService(self, types, scopes, xAddrs, epr=None):
         """Publish a service with the given TYPES, SCOPES and XAddrs (service addresses)
 
         if xAddrs contains item, which includes {ip} pattern, one item per IP address will be sent
+
+        The service endpoint reference is the daemon UUID unless EPR is given;
+        publishing again with the same EPR replaces the service.
+        Return the published service.
+        """
+        return self.publishServices([(types, scopes, xAddrs, epr)])[0]
+
+    def publishServices(self, services):
+        """Publish many services at once, given as (types, scopes, xAddrs, epr)
+        tuples, each with its own endpoint reference & application sequence
+
+        Return the published services.
         """
 
         if not self._serverStarted:
             raise Exception("Server not started")
 
-        instanceId = _generateInstanceId()
+        published = []
+        for types, scopes, xAddrs, epr in services:
+            service = Service(types, scopes, xAddrs, epr if epr is not None else self.uuid,
+                              _generateInstanceId())
+            self._localServices.add(service)
+            published.append(service)
+        self._probeMatchCache.clear()
+        self._metrics.services.set(("local",), len(self._localServices))
 
-        service = Service(types, scopes, xAddrs, self.uuid, instanceId)
-        self._localServices[self.uuid] = service
-        self._sendHello(service)
+        for service in published:
+            self._sendHello(service)
+        return published
 
+    def unpublishService(self, epr):
+        'send a Bye message for the service with the given EPR and remove it'
+
+        service = self._localServices.get(epr)
+        if service is None:
+            return
+        self._sendBye(service)
+        self._localServices.remove(epr)
+        self._probeMatchCache.clear()
+        self._metrics.services.set(("local",), len(self._localServices))
 
     def clearLocalServices(self):
         'send Bye messages for the services and remove them'
@@ -64,6 +105,12 @@ class Publishing:
             self._sendBye(service)
 
         self._localServices.clear()
+        self._probeMatchCache.clear()
+        self._metrics.services.set(("local",), 0)
+
+    def getProbeMatchCacheStats(self):
+        "statistics of the Probe Match response cache"
+        return self._probeMatchCache.getStats()
 
     def stop(self):
         self.clearLocalServices()
@@ -74,3 +121,25 @@ class ThreadedWSPublishing(ThreadedNetworking, Publishing, Daemon):
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+
+
+class AsyncWSPublishing(AsyncioNetworking, Publishing, Daemon):
+    """asyncio service publishing
+
+    start() and stop() are coroutines; stop() sends Bye messages for the
+    published services before closing the networking endpoints.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+    async def stop(self):
+        self.clearLocalServices()
+        await AsyncioNetworking.stop(self)
+
+
+class ReplayWSPublishing(ReplayNetworking, Publishing, Daemon):
+    "service publishing answering captured datagrams, see wsdiscovery.replay"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
@@ -1,13 +1,22 @@
 """Qualified name support; see e.g. https://en.wikipedia.org/wiki/QName"""
 
+import sys
+from functools import lru_cache
+
 
 class QName:
-    "Qualified name implementation"
+    """Qualified name implementation
+
+    QNames are immutable; equal if their namespace & local name are, whatever
+    the prefix. The strings are interned, being shared by many services.
+    """
+
+    __slots__ = ("_namespace", "_localname", "_namespace_prefix")
 
     def __init__(self, namespace, localname, namespace_prefix=None):
-        self._namespace = namespace
-        self._localname = localname
-        self._namespace_prefix = namespace_prefix
+        self._namespace = sys.intern(namespace)
+        self._localname = sys.intern(localname)
+        self._namespace_prefix = sys.intern(namespace_prefix) if namespace_prefix else namespace_prefix
 
     def getNamespace(self):
         return self._namespace
@@ -21,8 +30,23 @@ class QName:
     def getFullname(self):
         return self.getNamespace() + ":" + self.getLocalname()
 
+    def __eq__(self, other):
+        if not isinstance(other, QName):
+            return NotImplemented
+        return self._namespace == other._namespace and self._localname == other._localname
+
+    def __hash__(self):
+        return hash((self._namespace, self._localname))
+
+    def __reduce__(self):
+        # unpickled names are shared like those of parsed messages
+        return internQName, (self._namespace, self._localname, self._namespace_prefix)
+
     def __repr__(self):
         return self.getFullname()
 
 
-
+@lru_cache(maxsize=4096)
+def internQName(namespace, localname, namespace_prefix=None):
+    "shared QName instance of the given name, for the types of received messages"
+    return QName(namespace, localname, namespace_prefix)
@@ -0,0 +1,165 @@
+"""Registry of published or discovered services, indexed for fast filtering.
+
+Services are indexed by the full names of their types, and by their scopes
+in a :class:`~wsdiscovery.scopematch.ScopeIndex`, so that a filter lookup
+is a handful of dictionary & trie lookups and set intersections, however
+many services are registered. Registered services report their changes,
+upon which they are indexed again.
+"""
+
+import functools
+import itertools
+import threading
+
+from .scopematch import ScopeIndex
+
+_EMPTY = frozenset()
+
+
+class ServiceRegistry:
+    """services by endpoint reference, with type & scope indexes
+
+    Behaves like a read-only dict from EPR to service; use add() & remove()
+    to change the contents. on_change is called without arguments after a
+    registered service changed.
+    """
+
+    def __init__(self, on_change=None):
+        self._onChange = on_change
+        self._services = {}
+        self._order = {}
+        self._counter = itertools.count()
+        self._indexed = {}  # EPR: (type full names, scopes) the service is indexed by
+        self._typeIndex = {}
+        self._scopeIndex = ScopeIndex()
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _indexAdd(index, key, epr):
+        eprs = index.get(key)
+        if eprs is None:
+            eprs = index[key] = set()
+        eprs.add(epr)
+
+    @staticmethod
+    def _indexRemove(index, key, epr):
+        eprs = index.get(key)
+        if eprs is not None:
+            eprs.discard(epr)
+            if not eprs:
+                del index[key]
+
+    def _index(self, epr, service):
+        typeNames = tuple(ttype.getFullname() for ttype in service.getTypes() or [])
+        scopes = tuple(service.getScopes() or [])
+        for typeName in typeNames:
+            self._indexAdd(self._typeIndex, typeName, epr)
+        for scope in scopes:
+            self._scopeIndex.add(scope, epr)
+        self._indexed[epr] = (typeNames, scopes)
+
+    def _unindex(self, epr):
+        typeNames, scopes = self._indexed.pop(epr)
+        for typeName in typeNames:
+            self._indexRemove(self._typeIndex, typeName, epr)
+        for scope in scopes:
+            self._scopeIndex.remove(scope, epr)
+
+    def add(self, service):
+        "add a service, replacing any service with the same EPR"
+        epr = service.getEPR()
+        with self._lock:
+            self.remove(epr)
+            self._services[epr] = service
+            self._order[epr] = next(self._counter)
+            self._index(epr, service)
+            service._setObserver(functools.partial(self._serviceChanged, epr))
+
+    def remove(self, epr):
+        "remove the service with the given EPR, if any"
+        with self._lock:
+            service = self._services.pop(epr, None)
+            if service is None:
+                return
+            del self._order[epr]
+            self._unindex(epr)
+            service._setObserver(None)
+
+    def _serviceChanged(self, epr, service):
+        "index a registered service again after it changed, under its new EPR if that changed"
+        with self._lock:
+            if self._services.get(epr) is not service:
+                return
+            self._unindex(epr)
+            newEpr = service.getEPR()
+            if newEpr != epr:
+                self.remove(newEpr)
+                # keep the registration order
+                self._services = {newEpr if key == epr else key: value
+                                  for key, value in self._services.items()}
+                self._order[newEpr] = self._order.pop(epr)
+                service._setObserver(functools.partial(self._serviceChanged, newEpr))
+            self._index(newEpr, service)
+        if self._onChange is not None:
+            self._onChange()
+
+    def clear(self):
+        with self._lock:
+            for service in self._services.values():
+                service._setObserver(None)
+            self._services.clear()
+            self._order.clear()
+            self._indexed.clear()
+            self._typeIndex.clear()
+            self._scopeIndex.clear()
+
+    def __getitem__(self, epr):
+        return self._services[epr]
+
+    def get(self, epr, default=None):
+        return self._services.get(epr, default)
+
+    def __contains__(self, epr):
+        return epr in self._services
+
+    def __len__(self):
+        return len(self._services)
+
+    def values(self):
+        with self._lock:
+            return list(self._services.values())
+
+    def _filterEPRs(self, types, scopes):
+        "EPRs of services matching all types & scopes; None if there are no criteria"
+        candidates = None
+        criteria = [self._typeIndex.get(ttype.getFullname(), _EMPTY) for ttype in types or []]
+        criteria.extend(self._scopeIndex.find(scope) for scope in scopes or [])
+        for eprs in sorted(criteria, key=len):
+            if candidates is None:
+                candidates = set(eprs)
+            else:
+                candidates.intersection_update(eprs)
+            if not candidates:
+                break
+        return candidates
+
+    def filter(self, types=None, scopes=None):
+        "services matching all the given types & scopes, in registration order"
+        with self._lock:
+            eprs = self._filterEPRs(types, scopes)
+            if eprs is None:
+                return list(self._services.values())
+            return [self._services[epr] for epr in sorted(eprs, key=self._order.__getitem__)]
+
+    def matches(self, epr, types=None, scopes=None):
+        "tell whether the registered service with the given EPR matches all types & scopes"
+        with self._lock:
+            if epr not in self._services:
+                return False
+            for ttype in types or []:
+                if epr not in self._typeIndex.get(ttype.getFullname(), _EMPTY):
+                    return False
+            for scope in scopes or []:
+                if epr not in self._scopeIndex.find(scope):
+                    return False
+            return True
@@ -0,0 +1,140 @@
+"""Replay of captured traffic into a daemon, without any sockets.
+
+The datagrams a daemon received, as recorded by the ``capture`` option, are
+fed through the same parsing, deduplication & message handling as live
+traffic, either as fast as possible or at the recorded pace. Messages the
+daemon sends in response are counted and dropped. This gives deterministic
+load & regression runs from captures of real networks.
+"""
+
+import logging
+import socket
+import time
+
+from .capture import CAPTURE_RECV, CAPTURE_BAD
+from .dedup import DEFAULT_DEDUP_CAPACITY, DEFAULT_DEDUP_WINDOW
+from .networking import DatagramHandler, IPv4Sockets, IPv6Sockets
+from .udp import UNICAST_UDP_REPEAT, MULTICAST_UDP_REPEAT
+
+logger = logging.getLogger("replay")
+
+#: captured events that are replayed
+REPLAYED_EVENTS = frozenset([CAPTURE_RECV, CAPTURE_BAD])
+
+
+class ReplayNetworkingFamily(DatagramHandler):
+    "datagram handling for a single address family, with its own deduplication"
+
+
+class ReplayNetworkingIPv4(IPv4Sockets, ReplayNetworkingFamily):
+    pass
+
+
+class ReplayNetworkingIPv6(IPv6Sockets, ReplayNetworkingFamily):
+    pass
+
+
+class ReplayNetworking:
+    """networking mixin taking datagrams from replayDatagram() instead of sockets
+
+    Messages sent by the daemon are counted, not sent.
+    """
+
+    def __init__(self,
+                 unicast_num=UNICAST_UDP_REPEAT,
+                 multicast_num=MULTICAST_UDP_REPEAT,
+                 relates_to=False,
+                 dedup_capacity=DEFAULT_DEDUP_CAPACITY,
+                 dedup_window=DEFAULT_DEDUP_WINDOW, **kwargs):
+        self._handlers = {}
+        self._serverStarted = False
+        self._unicast_num = unicast_num
+        self._multicast_num = multicast_num
+        self._relates_to = relates_to
+        self._dedup_capacity = dedup_capacity
+        self._dedup_window = dedup_window
+        self._sentUnicast = 0
+        self._sentMulticast = 0
+        super().__init__(**kwargs)
+
+    def start(self):
+        self._startCapture()
+        self._handlers = {
+            socket.AF_INET: ReplayNetworkingIPv4(self),
+            socket.AF_INET6: ReplayNetworkingIPv6(self),
+        }
+        self._serverStarted = True
+
+    def stop(self):
+        self._serverStarted = False
+        self._stopCapture()
+
+    def replayDatagram(self, data, addr, local=None):
+        """handle a datagram as if received from addr, a (host, port) tuple;
+        tell whether it could be parsed"""
+        family = socket.AF_INET6 if ":" in addr[0] else socket.AF_INET
+        return self._handlers[family]._handleDatagram(data, addr, local)
+
+    def getDedupStats(self):
+        "message deduplication cache statistics per address family"
+        if not self._handlers:
+            return {}
+        return {
+            "IPv4": self._handlers[socket.AF_INET].getDedupStats(),
+            "IPv6": self._handlers[socket.AF_INET6].getDedupStats(),
+        }
+
+    def getSentStats(self):
+        "numbers of unicast & multicast messages the daemon would have sent"
+        return {"unicast": self._sentUnicast, "multicast": self._sentMulticast}
+
+    def addSourceAddr(self, addr):
+        pass
+
+    def removeSourceAddr(self, addr):
+        pass
+
+    def sendUnicastMessage(self, env, host, port, initialDelay=0,
+                           unicast_num=UNICAST_UDP_REPEAT, payload=None):
+        self._sentUnicast += 1
+
+    def sendMulticastMessage(self, env, initialDelay=0,
+                             multicast_num=MULTICAST_UDP_REPEAT):
+        self._sentMulticast += 1
+
+
+def replayCapture(daemon, records, speed=None):
+    """feed the received datagrams of capture records to a started replay daemon
+
+    With speed None, datagrams are replayed as fast as possible; otherwise
+    at the recorded pace, sped up by the given factor. Returns statistics of
+    the run: the numbers of datagrams replayed & failing to parse, the
+    elapsed time and the datagram rate.
+    """
+    datagrams = 0
+    failures = 0
+    t0 = None
+    start = time.perf_counter()
+
+    for record in records:
+        if record.event not in REPLAYED_EVENTS:
+            continue
+        if speed is not None:
+            if t0 is None:
+                t0 = record.timestamp
+            delay = (record.timestamp - t0) / 1e9 / speed - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+
+        datagrams += 1
+        if not daemon.replayDatagram(record.data, record.peer, record.local):
+            failures += 1
+
+    elapsed = time.perf_counter() - start
+    logger.debug("replayed %i datagrams in %.3fs", datagrams, elapsed)
+    return {
+        "datagrams": datagrams,
+        "parse_failures": failures,
+        "seconds": elapsed,
+        "datagrams_per_second": datagrams / elapsed if elapsed > 0 else 0.0,
+    }
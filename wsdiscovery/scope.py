@@ -1,12 +1,85 @@
 """Service scopes are used to constrain service discovery."""
 
+import re
+import sys
+import uuid
+from collections import namedtuple
+from functools import lru_cache
+from urllib.parse import unquote, urlsplit
+
+#: :term:`LDAP` scope matching rule
+MATCH_BY_LDAP = "http://schemas.xmlsoap.org/ws/2005/04/discovery/ldap"
+
+#: RFC 2396 scope matching rule, the default
+MATCH_BY_URI = "http://schemas.xmlsoap.org/ws/2005/04/discovery/rfc2396"
+
+#: UUID scope matching rule
+MATCH_BY_UUID = "http://schemas.xmlsoap.org/ws/2005/04/discovery/uuid"
+
+#: case-sensitive string comparison scope matching rule
+MATCH_BY_STRCMP = "http://schemas.xmlsoap.org/ws/2005/04/discovery/strcmp0"
+
+_DOT_SEGMENTS = frozenset([".", ".."])
+_RDN_SEPARATOR = re.compile(r"(?<!\\),")
+
+
+class NormalizedScope(namedtuple("NormalizedScope", "value scheme authority segments uuid rdns")):
+    """scope value parsed & canonicalized for matching
+
+    scheme and authority are lower-cased; segments are the unescaped, non-empty
+    path segments (None if there is a ``.`` or ``..`` segment); uuid is the
+    128-bit integer of ``uuid:`` and ``urn:uuid:`` scopes; rdns is the
+    RDNSequence of the distinguished name of ``ldap:`` scopes, root first.
+    Fields that do not apply to the scope are None.
+    """
+
+
+@lru_cache(maxsize=4096)
+def normalizeScope(value):
+    "parse a scope value into a NormalizedScope"
+    try:
+        parts = urlsplit(value)
+    except ValueError:
+        return NormalizedScope(value, "", "", None, None, None)
+
+    scheme = parts.scheme.lower()
+    authority = unquote(parts.netloc).lower()
+    segments = tuple(unquote(segment) for segment in parts.path.split("/") if segment)
+    if _DOT_SEGMENTS.intersection(segments):
+        segments = None
+
+    uuidValue = None
+    if scheme == "uuid":
+        uuidValue = parts.path
+    elif scheme == "urn" and parts.path[:5].lower() == "uuid:":
+        uuidValue = parts.path[5:]
+    if uuidValue is not None:
+        try:
+            uuidValue = uuid.UUID(uuidValue).int
+        except ValueError:
+            uuidValue = None
+
+    rdns = None
+    if scheme == "ldap":
+        dn = unquote(parts.path.lstrip("/"))
+        rdns = tuple(reversed([rdn.strip() for rdn in _RDN_SEPARATOR.split(dn) if rdn.strip()]))
+
+    return NormalizedScope(value, scheme, authority, segments, uuidValue, rdns)
+
 
 class Scope:
-    "Service scope implementation."
+    """Service scope implementation.
+
+    Scopes are immutable; equal if their value & matching rule are. The
+    strings are interned, being shared by many services.
+    """
+
+    __slots__ = ("_matchBy", "_value", "_normalized")
 
     def __init__(self, value, matchBy=None):
-        self._matchBy = matchBy
-        self._value = value
+        self._matchBy = sys.intern(matchBy) if matchBy else matchBy
+        self._value = sys.intern(value)
+        self._normalized = None
 
     def getMatchBy(self):
         return self._matchBy
@@ -17,6 +90,24 @@ class Scope:
     def getQuotedValue(self):
         return self._value.replace(' ', '%20')
 
+    def getNormalized(self):
+        "the value parsed for matching, see NormalizedScope"
+        if self._normalized is None:
+            self._normalized = normalizeScope(self._value)
+        return self._normalized
+
+    def __eq__(self, other):
+        if not isinstance(other, Scope):
+            return NotImplemented
+        return self._value == other._value and (self._matchBy or None) == (other._matchBy or None)
+
+    def __hash__(self):
+        return hash(self._value)
+
+    def __reduce__(self):
+        # unpickled scopes are shared like those of parsed messages
+        return internScope, (self._value, self._matchBy)
+
     def __repr__(self):
         if self.getMatchBy() == None or len(self.getMatchBy()) == 0:
             return self.getValue()
@@ -24,3 +115,7 @@ class Scope:
             return self.getMatchBy() + ":" + self.getValue()
 
 
+@lru_cache(maxsize=4096)
+def internScope(value, matchBy=None):
+    "shared Scope instance of the given value & matching rule, for the scopes of received messages"
+    return Scope(value, matchBy)
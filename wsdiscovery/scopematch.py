@@ -0,0 +1,197 @@
+"""Scope matching as per the WS-Discovery matching rules.
+
+A probe scope is compiled once into a ScopeMatcher for testing service
+scopes one by one. To find the services matched by a probe scope among
+many, keep their scopes in a ScopeIndex: the prefix-matching RFC 2396 and
+LDAP rules are answered by walking a segment trie, in time proportional to
+the depth of the probe scope path rather than to the number of services.
+"""
+
+from .scope import MATCH_BY_LDAP, MATCH_BY_URI, MATCH_BY_UUID, MATCH_BY_STRCMP
+
+_EMPTY = frozenset()
+
+#: matching rules by MatchBy attribute value; no MatchBy means RFC 2396
+_RULES = {
+    None: MATCH_BY_URI,
+    "": MATCH_BY_URI,
+    MATCH_BY_URI: MATCH_BY_URI,
+    MATCH_BY_LDAP: MATCH_BY_LDAP,
+    MATCH_BY_UUID: MATCH_BY_UUID,
+    MATCH_BY_STRCMP: MATCH_BY_STRCMP,
+}
+
+#: rules matching when the probe scope key is a prefix of the service scope key
+_PREFIX_RULES = frozenset([MATCH_BY_URI, MATCH_BY_LDAP])
+
+
+def _ruleKey(rule, normalized):
+    "what a scope is compared by under a matching rule; None if the rule never matches it"
+    if rule == MATCH_BY_URI:
+        if normalized.segments is None:
+            return None
+        return (normalized.scheme, normalized.authority) + normalized.segments
+    elif rule == MATCH_BY_LDAP:
+        if normalized.rdns is None:
+            return None
+        return (normalized.authority,) + normalized.rdns
+    elif rule == MATCH_BY_UUID:
+        return normalized.uuid
+    else:
+        return normalized.value
+
+
+class ScopeMatcher:
+    "probe scope compiled for matching service scopes"
+
+    def __init__(self, scope):
+        self._rule = _RULES.get(scope.getMatchBy())
+        self._key = None if self._rule is None else _ruleKey(self._rule, scope.getNormalized())
+        self._prefix = self._rule in _PREFIX_RULES
+
+    def getKey(self):
+        "hashable (rule, key) pair, equal for probe scopes that match the same service scopes"
+        if self._key is None:
+            return (None, None)
+        return (self._rule, self._key)
+
+    def matches(self, scope):
+        "tell whether the probe scope matches a service scope"
+        if self._key is None:
+            return False
+        target = _ruleKey(self._rule, scope.getNormalized())
+        if target is None:
+            return False
+        if self._prefix:
+            return target[:len(self._key)] == self._key
+        return target == self._key
+
+    def matchesAny(self, scopes):
+        "tell whether the probe scope matches any of the service scopes"
+        return any(self.matches(scope) for scope in scopes)
+
+
+class _TrieNode:
+    __slots__ = ("children", "keys")
+
+    def __init__(self):
+        self.children = {}
+        self.keys = {}  # key -> number of entries at or below this node
+
+
+class _SegmentTrie:
+    "keys stored by segment sequence, found by any prefix of it"
+
+    def __init__(self):
+        self._root = _TrieNode()
+
+    def add(self, segments, key):
+        node = self._root
+        node.keys[key] = node.keys.get(key, 0) + 1
+        for segment in segments:
+            child = node.children.get(segment)
+            if child is None:
+                child = node.children[segment] = _TrieNode()
+            node = child
+            node.keys[key] = node.keys.get(key, 0) + 1
+
+    def remove(self, segments, key):
+        nodes = [self._root]
+        for segment in segments:
+            node = nodes[-1].children.get(segment)
+            if node is None:
+                return
+            nodes.append(node)
+
+        for depth in range(len(nodes) - 1, -1, -1):
+            node = nodes[depth]
+            count = node.keys.get(key, 0) - 1
+            if count > 0:
+                node.keys[key] = count
+            else:
+                node.keys.pop(key, None)
+            if depth > 0 and not node.keys:
+                del nodes[depth - 1].children[segments[depth - 1]]
+
+    def find(self, segments):
+        node = self._root
+        for segment in segments:
+            node = node.children.get(segment)
+            if node is None:
+                return _EMPTY
+        return node.keys.keys()
+
+    def clear(self):
+        self._root = _TrieNode()
+
+
+class _ExactIndex:
+    "keys stored by value, found by the same value"
+
+    def __init__(self):
+        self._entries = {}
+
+    def add(self, value, key):
+        keys = self._entries.setdefault(value, {})
+        keys[key] = keys.get(key, 0) + 1
+
+    def remove(self, value, key):
+        keys = self._entries.get(value)
+        if keys is None or key not in keys:
+            return
+        keys[key] -= 1
+        if not keys[key]:
+            del keys[key]
+            if not keys:
+                del self._entries[value]
+
+    def find(self, value):
+        keys = self._entries.get(value)
+        return _EMPTY if keys is None else keys.keys()
+
+    def clear(self):
+        self._entries.clear()
+
+
+class ScopeIndex:
+    """keys (such as service EPRs) stored by scope, found by matching probe scope
+
+    A key may be added with several scopes, and with the same scope several
+    times; each add() must be balanced by a remove() with the same scope.
+    """
+
+    def __init__(self):
+        self._indexes = {
+            MATCH_BY_URI: _SegmentTrie(),
+            MATCH_BY_LDAP: _SegmentTrie(),
+            MATCH_BY_UUID: _ExactIndex(),
+            MATCH_BY_STRCMP: _ExactIndex(),
+        }
+
+    def add(self, scope, key):
+        normalized = scope.getNormalized()
+        for rule, index in self._indexes.items():
+            ruleKey = _ruleKey(rule, normalized)
+            if ruleKey is not None:
+                index.add(ruleKey, key)
+
+    def remove(self, scope, key):
+        normalized = scope.getNormalized()
+        for rule, index in self._indexes.items():
+            ruleKey = _ruleKey(rule, normalized)
+            if ruleKey is not None:
+                index.remove(ruleKey, key)
+
+    def find(self, scope):
+        "set-like view of the keys stored with a scope matched by the probe scope"
+        rule = _RULES.get(scope.getMatchBy())
+        if rule is None:
+            return _EMPTY
+        ruleKey = _ruleKey(rule, scope.getNormalized())
+        if ruleKey is None:
+            return _EMPTY
+        return self._indexes[rule].find(ruleKey)
+
+    def clear(self):
+        for index in self._indexes.values():
+            index.clear()
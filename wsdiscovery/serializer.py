@@ -0,0 +1,133 @@
+"""Compact, deterministic rendering of outgoing SOAP messages from string templates.
+
+Messages are rendered without any indentation whitespace, and the same
+envelope always renders to the same string: namespaces of types that come
+without a usable prefix get ``ns0``, ``ns1``, ... in order of appearance.
+"""
+
+from functools import lru_cache
+from xml.sax.saxutils import escape
+
+from .namespaces import NS_ADDRESSING, NS_DISCOVERY, NS_SOAPENV
+
+_ENVELOPE_OPEN = '<s:Envelope xmlns:a="%s" xmlns:d="%s" xmlns:s="%s"' % (
+    NS_ADDRESSING, NS_DISCOVERY, NS_SOAPENV)
+_ENVELOPE_CLOSE = '</s:Body></s:Envelope>'
+_BODY_OPEN = '</s:Header><s:Body>'
+
+_ATTR_ENTITIES = {'"': "&quot;"}
+
+
+def _text(value):
+    "escape element text"
+    return escape(value)
+
+
+def _attr(value):
+    "escape a double-quoted attribute value"
+    return escape(value, _ATTR_ENTITIES)
+
+
+class NamespacePrefixes:
+    "prefixes of the namespaces used by the types in a message"
+
+    def __init__(self):
+        self._prefixes = {NS_SOAPENV: "s", NS_ADDRESSING: "a", NS_DISCOVERY: "d"}
+        self._namespaces = {prefix: ns for ns, prefix in self._prefixes.items()}
+        self._declared = []
+        self._generated = 0
+
+    def getPrefix(self, qname):
+        "prefix for the namespace of qname, declaring it if necessary"
+        ns = qname.getNamespace()
+        prefix = self._prefixes.get(ns)
+        if prefix is not None:
+            return prefix
+
+        prefix = qname.getNamespacePrefix()
+        if not prefix or prefix in self._namespaces or prefix.lower().startswith("xml"):
+            prefix = "ns%i" % self._generated
+            self._generated += 1
+            while prefix in self._namespaces:
+                prefix = "_" + prefix
+
+        self._prefixes[ns] = prefix
+        self._namespaces[prefix] = ns
+        self._declared.append(prefix)
+        return prefix
+
+    def renderDeclarations(self):
+        return "".join(' xmlns:%s="%s"' % (prefix, _attr(self._namespaces[prefix]))
+                       for prefix in self._declared)
+
+
+@lru_cache(maxsize=None)
+def _renderEnvelopeHead(action):
+    return '><s:Header><a:Action>%s</a:Action>' % _text(action)
+
+
+def renderEnvelope(action, header, body, prefixes=None):
+    "render a complete message from rendered header & body contents"
+    return "".join((_ENVELOPE_OPEN,
+                    prefixes.renderDeclarations() if prefixes is not None else "",
+                    _renderEnvelopeHead(action),
+                    header,
+                    _BODY_OPEN,
+                    body,
+                    _ENVELOPE_CLOSE))
+
+
+def renderElement(name, value):
+    return "<%s>%s</%s>" % (name, _text(value), name)
+
+
+def renderRelatesTo(relatesTo, relationshipType=None):
+    if relationshipType is None:
+        return renderElement("a:RelatesTo", relatesTo)
+    return '<a:RelatesTo RelationshipType="%s">%s</a:RelatesTo>' % (
+        _attr(relationshipType), _text(relatesTo))
+
+
+def renderAppSequence(env):
+    return '<d:AppSequence InstanceId="%s" MessageNumber="%s"/>' % (
+        _attr(env.getInstanceId()), _attr(env.getMessageNumber()))
+
+
+def renderEPR(epr):
+    return "<a:EndpointReference><a:Address>%s</a:Address></a:EndpointReference>" % _text(epr)
+
+
+def renderTypes(types, prefixes):
+    if not types:
+        return ""
+    names = []
+    for qname in types:
+        if qname.getNamespace():
+            names.append(prefixes.getPrefix(qname) + ":" + qname.getLocalname())
+        else:
+            names.append(qname.getLocalname())
+    return renderElement("d:Types", " ".join(names))
+
+
+def renderScopes(scopes):
+    if not scopes:
+        return ""
+    value = " ".join([scope.getQuotedValue() for scope in scopes])
+    matchBy = scopes[0].getMatchBy()
+    if matchBy:
+        return '<d:Scopes MatchBy="%s">%s</d:Scopes>' % (_attr(matchBy), _text(value))
+    return renderElement("d:Scopes", value)
+
+
+def renderXAddrs(xAddrs):
+    # always present, even if empty, as ResolveMatch requires it
+    return renderElement("d:XAddrs", " ".join(xAddrs or []))
+
+
+def renderServiceInfo(epr, types, scopes, xAddrs, metadataVersion, prefixes):
+    "EPR, types, scopes, addresses & metadata version of a Hello, ProbeMatch or ResolveMatch"
+    return "".join((renderEPR(epr),
+                    renderTypes(types, prefixes),
+                    renderScopes(scopes),
+                    renderXAddrs(xAddrs),
+                    renderElement("d:MetadataVersion", metadataVersion)))
@@ -1,20 +1,45 @@
 """Discoverable WS-Discovery service."""
+import ipaddress
 import socket
 
-from .util import _getNetworkAddrs
+from .util import localAddresses
+
+
+def _formatIPAddr(ipAddr):
+    "IP address as it appears in a URL: IPv6 in brackets, without any zone index"
+    if ipAddr.version == 6:
+        return "[%s]" % ipaddress.IPv6Address(int(ipAddr))
+    return str(ipAddr)
 
 
 class Service:
-    "A web service representation implementation"
+    """A web service representation implementation
+
+    Services are mutable, so they are equal & hashed by identity. Changes
+    of the types, scopes, XAddrs, EPR or metadata version are reported to
+    the registry holding the service, to keep its indexes up to date.
+    """
+
+    __slots__ = ("_types", "_scopes", "_xAddrs", "_expandedXAddrs", "_epr", "_instanceId",
+                 "_messageNumber", "_metadataVersion", "_observer")
 
     def __init__(self, types, scopes, xAddrs, epr, instanceId):
         self._types = types
         self._scopes = scopes
         self._xAddrs = xAddrs
+        self._expandedXAddrs = None  # (address snapshot generation, expanded XAddrs)
         self._epr = epr
         self._instanceId = instanceId
         self._messageNumber = 0
         self._metadataVersion = 1
+        self._observer = None  # called with the service when it changed
+
+    def _setObserver(self, observer):
+        self._observer = observer
+
+    def _changed(self):
+        if self._observer is not None:
+            self._observer(self)
 
     def getTypes(self):
         "get service types"
@@ -23,6 +48,7 @@ class Service:
     def setTypes(self, types):
         "set service types"
         self._types = types
+        self._changed()
 
     def getScopes(self):
         "get the service scopes"
@@ -31,26 +57,39 @@ class Service:
     def setScopes(self, scopes):
         "set the service scopes"
         self._scopes = scopes
+        self._changed()
 
     def getXAddrs(self):
-        "get service network address"
+        """get service network address
+
+        XAddrs with an {ip} pattern expand to one item per local IP address;
+        the expansion is kept until the local addresses change."""
+        if not any('{ip}' in xAddr for xAddr in self._xAddrs):
+            return list(self._xAddrs)
+
+        generation = localAddresses.getGeneration()
+        cached = self._expandedXAddrs
+        if cached is not None and cached[0] == generation:
+            return list(cached[1])
+
+        ipAddrs = localAddresses.getAddrs(socket.AF_INET) + localAddresses.getAddrs(socket.AF_INET6)
         ret = []
-        ipAddrs = None
         for xAddr in self._xAddrs:
             if '{ip}' in xAddr:
-                if ipAddrs is None:
-                    ipAddrs = _getNetworkAddrs(socket.AF_INET)
-                    ipAddrs.append(_getNetworkAddrs(socket.AF_INET6))
                 for ipAddr in ipAddrs:
                     if not ipAddr.is_loopback:
-                        ret.append(xAddr.format(ip=str(ipAddr)))
+                        ret.append(xAddr.format(ip=_formatIPAddr(ipAddr)))
             else:
                 ret.append(xAddr)
-        return ret
+
+        self._expandedXAddrs = (generation, ret)
+        return list(ret)
 
     def setXAddrs(self, xAddrs):
         "set service network address"
         self._xAddrs = xAddrs
+        self._expandedXAddrs = None
+        self._changed()
 
     def getEPR(self):
         "get endpoint reference"
@@ -59,6 +98,7 @@ class Service:
     def setEPR(self, epr):
         "set endpoint reference"
         self._epr = epr
+        self._changed()
 
     def getInstanceId(self):
         return self._instanceId
@@ -77,6 +117,7 @@ class Service:
 
     def setMetadataVersion(self, metadataVersion):
         self._metadataVersion = metadataVersion
+        self._changed()
 
     def incrementMessageNumber(self):
         self._messageNumber = self._messageNumber + 1
@@ -1,25 +1,28 @@
 """Threaded networking facilities for implementing threaded WS-Discovery daemons."""
+import collections
+import heapq
 import ipaddress
+import itertools
 import logging
-import platform
+import select
 import selectors
 import socket
-import struct
 import threading
 import time
+from concurrent.futures import Future
 from typing import cast
 
 from .actions import *
-from .message import createSOAPMessage, parseSOAPMessage
+from .envelope import SoapEnvelope
+from .parsepool import ParsePool, parseBatch
 from .udp import UDPMessage
-from .util import _getNetworkAddrs, dom2Str
+from .util import _getNetworkAddrs, localAddresses
+from .netlink import openAddressChangeSocket
 from .udp import UNICAST_UDP_REPEAT, MULTICAST_UDP_REPEAT
-
-BUFFER_SIZE = 0xffff
-NETWORK_ADDRESSES_CHECK_TIMEOUT = 5
-MULTICAST_PORT = 3702
-MULTICAST_IPV4_ADDRESS = "239.255.255.250"
-MULTICAST_IPV6_ADDRESS = "FF02::C"
+from .dedup import DEFAULT_DEDUP_CAPACITY, DEFAULT_DEDUP_WINDOW
+from .networking import MulticastSockets, IPv4Sockets, IPv6Sockets, DatagramHandler, ReceiveBuffer
+from .networking import BUFFER_SIZE, RECV_BATCH_SIZE, NETWORK_ADDRESSES_CHECK_TIMEOUT, MULTICAST_PORT, \
+                        MULTICAST_IPV4_ADDRESS, MULTICAST_IPV6_ADDRESS
 
 logger = logging.getLogger("threading")
 
@@ -43,17 +46,33 @@ class _StoppableDaemonThread(threading.Thread):
 
 
 class AddressMonitorThread(_StoppableDaemonThread):
-    "trigger address change callbacks when local service addresses change"
+    """trigger address change callbacks when local service addresses change
+
+    Addresses are checked as soon as rtnetlink reports a change where it is
+    available (Linux), and every NETWORK_ADDRESSES_CHECK_TIMEOUT seconds
+    otherwise.
+    """
 
     def __init__(self, wsd, protocol_version):
         self._addrs = set()
+        self._monitoring = False
         self._wsd = wsd
         self._protocolVersion = protocol_version
         super(AddressMonitorThread, self).__init__()
+        # subscribe before taking the first snapshot, so that no change is missed
+        self._changes = openAddressChangeSocket(protocol_version)
+        self._wakeupReader = self._wakeupWriter = None
+        if self._changes is not None:
+            self._wakeupReader, self._wakeupWriter = socket.socketpair()
         self._updateAddrs()
 
     def _updateAddrs(self):
         addrs = set(_getNetworkAddrs(self._protocolVersion))
+        if self._monitoring:
+            localAddresses.update(self._protocolVersion, addrs)
+        else:
+            localAddresses.startMonitoring(self._protocolVersion, addrs)
+            self._monitoring = True
 
         disappeared = self._addrs.difference(addrs)
         new = addrs.difference(self._addrs)
@@ -66,84 +85,77 @@ class AddressMonitorThread(_StoppableDaemonThread):
 
         self._addrs = addrs
 
+    def schedule_stop(self):
+        super(AddressMonitorThread, self).schedule_stop()
+        if self._wakeupWriter is not None:
+            try:
+                self._wakeupWriter.send(b"\0")
+            except OSError:
+                pass
+
+    def _waitForChanges(self):
+        while not self._quitEvent.is_set():
+            select.select([self._changes, self._wakeupReader], [], [])
+            if self._changes.readChanges() and not self._quitEvent.is_set():
+                self._updateAddrs()
+
     def run(self):
-        while not self._quitEvent.wait(NETWORK_ADDRESSES_CHECK_TIMEOUT):
-            self._updateAddrs()
+        try:
+            if self._changes is None:
+                while not self._quitEvent.wait(NETWORK_ADDRESSES_CHECK_TIMEOUT):
+                    self._updateAddrs()
+            else:
+                self._waitForChanges()
+        finally:
+            localAddresses.stopMonitoring(self._protocolVersion)
+            if self._changes is not None:
+                self._changes.close()
+                self._wakeupReader.close()
+                self._wakeupWriter.close()
 
 
-class NetworkingThread(_StoppableDaemonThread):
+class NetworkingThread(MulticastSockets, DatagramHandler, _StoppableDaemonThread):
     def __init__(self, observer):
-        super(NetworkingThread, self).__init__()
+        _StoppableDaemonThread.__init__(self)
+        DatagramHandler.__init__(self, observer)
 
         self.daemon = True
-        self._queue = []  # FIXME synchronisation
+        self._queue = []  # heap of (next send time, sequence number, message)
+        self._queueLock = threading.Lock()
+        self._queueSeq = itertools.count()
 
-        self._knownMessageIds = set()
-        self._iidMap = {}
-        self._observer = observer
-        self._capture = observer._capture
-        self._relates_to = observer._relates_to
-
-        self._seqnum = 1  # capture sequence number
         self._selector = selectors.DefaultSelector()
+        self._recvBuffer = ReceiveBuffer()
+        self._parsePool = observer._parsePool
+        self._parsing = collections.deque()  # (future of parse results, received datagrams)
 
-    def _makeMreq(self, addr) -> bytes:
-        pass
-
-    def _get_inet(self) -> int:
-        pass
-
-    def _get_multicast(self) -> int:
-        pass
-
-    def _get_ip_proto(self) -> int:
-        pass
-
-    def _get_ip_join(self) -> int:
-        pass
+        # written to in order to interrupt a select() waiting for the next deadline
+        self._wakeupReader, self._wakeupWriter = socket.socketpair()
+        self._wakeupReader.setblocking(0)
+        self._wakeupWriter.setblocking(0)
+        self._selector.register(self._wakeupReader, selectors.EVENT_READ)
 
-    def _get_ip_leave(self) -> int:
-        pass
+    def _getOwnAddrs(self):
+        monitor = self._observer._addrsMonitorThread_v4
+        # messages may arrive before the address monitor has been started
+        return monitor._addrs if monitor is not None else ()
 
-    def _get_multicast_ttl(self) -> int:
-        pass
-
-    def _createMulticastOutSocket(self, addr, ttl):
-        ip_proto = self._get_ip_proto()
-        sock = socket.socket(self._get_inet(), socket.SOCK_DGRAM)
-        sock.setblocking(0)
-        sock.setsockopt(ip_proto, self._get_multicast_ttl(), ttl)
-
-        if not addr:
-            iface = socket.INADDR_ANY
-        elif self._get_inet() == socket.AF_INET:
-            iface = addr.packed
-        else:
-            iface = int(addr.scope_id)
+    def schedule_stop(self):
+        super(NetworkingThread, self).schedule_stop()
+        self._wakeup()
 
+    def _wakeup(self):
         try:
-            sock.setsockopt(ip_proto, self._get_multicast(), iface)
-        except OSError as e:
-            logger.warning(
-                "Interface for %s does not support "
-                "multicast flags or is not UP: OSError %s",
-                addr,
-                e
-            )
+            self._wakeupWriter.send(b"\0")
+        except OSError:
+            pass  # buffer full, a wakeup is pending anyway
 
-        return sock
-
-    def _createMulticastInSocket(self):
-        sock = socket.socket(self._get_inet(), socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-
-        if platform.system() in ["Darwin", "FreeBSD"]:
-            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
-
-        sock.bind(('', MULTICAST_PORT))
-        sock.setblocking(0)
-
-        return sock
+    def _drainWakeups(self):
+        try:
+            while self._wakeupReader.recv(4096):
+                pass
+        except OSError:
+            pass
 
     def addSourceAddr(self, addr):
         """None means 'system default'"""
@@ -154,7 +166,9 @@ class NetworkingThread(_StoppableDaemonThread):
 
         sock = self._createMulticastOutSocket(addr, self._observer.ttl)
         self._multiOutUniInSockets[addr] = sock
+        self._sourceAddrs[sock] = addr
         self._selector.register(sock, selectors.EVENT_READ)
+        self._wakeup()
 
     def removeSourceAddr(self, addr):
         try:
@@ -166,108 +180,156 @@ class NetworkingThread(_StoppableDaemonThread):
         self._selector.unregister(sock)
         sock.close()
         del self._multiOutUniInSockets[addr]
+        del self._sourceAddrs[sock]
 
     def addUnicastMessage(self, env, addr, port, initialDelay=0,
-                          unicast_num=UNICAST_UDP_REPEAT):
+                          unicast_num=UNICAST_UDP_REPEAT, payload=None):
         msg = UDPMessage(env, addr, port, UDPMessage.UNICAST, initialDelay,
-                         unicast_num=unicast_num)
+                         unicast_num=unicast_num, payload=payload)
 
-        self._queue.append(msg)
-        self._knownMessageIds.add(env.getMessageId())
+        self._rememberMessageId(env.getMessageId())
+        self._enqueue(msg)
+        return msg
 
     def addMulticastMessage(self, env, addr, port, initialDelay=0,
-                            multicast_num=MULTICAST_UDP_REPEAT):
+                            multicast_num=MULTICAST_UDP_REPEAT, payload=None):
         msg = UDPMessage(env, addr, port, UDPMessage.MULTICAST, initialDelay,
-                         multicast_num=multicast_num)
-
-        self._queue.append(msg)
-        self._knownMessageIds.add(env.getMessageId())
+                         multicast_num=multicast_num, payload=payload)
+
+        self._rememberMessageId(env.getMessageId())
+        self._enqueue(msg)
+        return msg
+
+    def _enqueue(self, msg):
+        with self._queueLock:
+            heapq.heappush(self._queue, (msg.getNextTime(), next(self._queueSeq), msg))
+            self._metrics.sendQueueDepth.set(self._familyLabel, len(self._queue))
+        if self._tracer:
+            self._traceEnqueued(msg)
+        self._wakeup()
+
+    def _getSelectTimeout(self):
+        "seconds until the next message is due, None if there is none"
+        with self._queueLock:
+            if not self._queue:
+                return None
+            nextTime = self._queue[0][0]
+        # UDPMessage.canSend() requires the deadline to be strictly in the past
+        return max(0, nextTime + 1 - int(time.monotonic() * 1000)) / 1000
 
     def run(self):
-        if self._capture:
-            self.t0 = time.time()
-        while not self._quitEvent.is_set() or self._queue:
+        # when stopping, the datagrams still being parsed are handled too
+        while not self._quitEvent.is_set() or self._queue or self._parsing:
             self._sendPendingMessages()
-            self._recvMessages()
-
-    def _recvMessages(self):
-        for key, events in self._selector.select(0):
-            if self._quitEvent.is_set():
-                break
-
-            sock = cast(socket.socket, key.fileobj)
-
-            try:
-                data, addr = sock.recvfrom(BUFFER_SIZE)
-            except socket.error:
-                time.sleep(0.01)
+            self._recvMessages(self._getSelectTimeout())
+
+    def _recvMessages(self, timeout=0):
+        "read the datagrams of all ready sockets into the receive buffer, then handle them"
+        batch = []
+        for key, events in self._selector.select(timeout):
+            # drained even when stopping, or select() would not block until the last messages are due
+            if key.fileobj is self._wakeupReader:
+                self._drainWakeups()
                 continue
 
-            try:
-                env = parseSOAPMessage(data, addr[0])
-            except Exception as e:
-                logger.debug("Failed to parse message from %s\n%s: %s", addr[0], data, e, exc_info=True)
-                env = None
-
-            if env is None:  # fault or failed to parse
-                if self._capture:
-                    self._capture.write(
-                        "%i WARNING: BAD RECV %s:%s TS=%s\n" % (self._seqnum, addr[0], addr[1], time.time() - self.t0))
-                    self._capture.write(dom2Str(data))
-                    self._seqnum += 1
+            if self._quitEvent.is_set():
+                self._discardDatagrams(cast(socket.socket, key.fileobj))
                 continue
 
-            _own_addrs = self._observer._addrsMonitorThread_v4._addrs
-            if addr[0] not in _own_addrs:
-                if env.getAction() == NS_ACTION_PROBE_MATCH:
-                    prms = "\n ".join((str(prm) for prm in env.getProbeResolveMatches()))
-                    msg = "probe response from %s:\n --- begin ---\n%s\n--- end ---\n"
-                    logger.debug(msg, addr[0], prms)
+            self._recvBatch(cast(socket.socket, key.fileobj), batch)
 
-                if self._capture:
-                    self._capture.write(
-                        "%i RECV %s:%s TS=%s\n" % (self._seqnum, addr[0], addr[1], time.time() - self.t0))
-                    self._capture.write(dom2Str(data))
-                    self._seqnum += 1
-
-            mid = env.getMessageId()
-            if mid in self._knownMessageIds:
-                if self._relates_to and env.getRelatesTo() in self._knownMessageIds:
-                    pass
-                else:
-                    continue
+        try:
+            if self._parsePool is None:
+                for data, addr, sock, iface in batch:
+                    local = None
+                    if self._capture:
+                        local = self._getLocalEndpoint(sock.getsockname(), iface)
+                    self._handleDatagram(data, addr, local, iface)
             else:
-                if self._capture:
-                    self._capture.write("NEW KNOWN MSG IDS %s\n" % (mid))
-                self._knownMessageIds.add(mid)
-
-            iid = env.getInstanceId()
-            if len(iid) > 0 and int(iid) >= 0:
-                mnum = env.getMessageNumber()
-                key = addr[0] + ":" + str(addr[1]) + ":" + str(iid)
-                if mid is not None and len(mid) > 0:
-                    key = key + ":" + mid
-                if key not in self._iidMap:
-                    self._iidMap[key] = iid
-                else:
-                    tmnum = self._iidMap[key]
-                    if mnum > tmnum:
-                        self._iidMap[key] = mnum
-                    else:
-                        continue
+                self._submitBatch(batch)
+        finally:
+            self._recvBuffer.reset()
+
+        if self._parsing:
+            self._handleParsedBatches()
+
+    def _submitBatch(self, batch):
+        "drop the known duplicates of a received batch and have the parse pool parse the rest"
+        received = []
+        for data, addr, sock, iface in batch:
+            local = None
+            if self._capture:
+                local = self._getLocalEndpoint(sock.getsockname(), iface)
+            if not self._receiveDatagram(data, addr, local, iface):
+                # copied out of the receive buffer, which is reused
+                received.append((bytes(data), addr, local))
+        if not received:
+            return
 
-            self._observer.envReceived(env, addr)
+        try:
+            future = self._parsePool.submit([(data, addr[0]) for data, addr, local in received])
+        except RuntimeError as e:  # e.g. a worker process died, breaking the pool
+            logger.warning("parse pool unavailable, parsing %i datagrams in thread: %s", len(received), e)
+            future = Future()
+            future.set_result(parseBatch([(data, addr[0]) for data, addr, local in received]))
+        future.add_done_callback(lambda future: self._wakeup())
+        self._parsing.append((future, received))
+        # rather than queueing without bound, wait for the workers
+        while len(self._parsing) > self._parsePool.maxPending:
+            self._handleParsedBatch(*self._parsing.popleft())
+
+    def _handleParsedBatches(self):
+        "handle the batches parsed by the pool in the order received, up to one still being parsed"
+        while self._parsing and self._parsing[0][0].done():
+            self._handleParsedBatch(*self._parsing.popleft())
+
+    def _handleParsedBatch(self, future, received):
+        try:
+            results = future.result()
+        except Exception as e:  # e.g. a worker process died
+            logger.warning("failed to parse %i datagrams: %s", len(received), e)
+            results = [(None, 0.0, None)] * len(received)
+
+        for (data, addr, local), (fields, seconds, actionURI) in zip(received, results):
+            if actionURI is not None and not self._parsePool.decodes(actionURI):
+                # an action registered in this process only
+                env, seconds = self._parseDatagram(data, addr)
+            else:
+                env = SoapEnvelope.fromFields(fields) if fields is not None else None
+            self._handleParsed(env, seconds, data, addr, local)
+
+    def _recvBatch(self, sock, batch):
+        """read datagrams from a non-blocking socket into the receive buffer until
+        it has no more, or the buffer or batch is full; the socket then stays ready"""
+        iface = self._sourceAddrs.get(sock)
+        while len(batch) < RECV_BATCH_SIZE and not self._recvBuffer.isFull():
+            try:
+                data, addr = self._recvBuffer.recvFrom(sock)
+            except BlockingIOError:
+                return
+            except OSError as e:
+                # e.g. ICMP port unreachable reported for a datagram sent earlier
+                logger.debug("failed to receive from %s: %s", sock, e)
+                return
+            batch.append((data, addr, sock, iface))
+
+    def _discardDatagrams(self, sock):
+        "read & drop the datagrams of a ready socket, which are not handled anymore when stopping"
+        for _ in range(RECV_BATCH_SIZE):
+            try:
+                sock.recv(1)
+            except OSError:  # including BlockingIOError once read
+                return
 
     def _sendMsg(self, msg):
-        data = createSOAPMessage(msg.getEnv()).encode("UTF-8")
+        data = msg.getData()
 
         if msg.msgType() == UDPMessage.UNICAST:
             self._uniOutSocket.sendto(data, (msg.getAddr(), msg.getPort()))
+            self._metrics.datagramsSent.inc(self._interfaceLabel(None))
             if self._capture:
-                self._capture.write(
-                    "%i SEND %s:%s TS=%s\n" % (self._seqnum, msg.getAddr(), msg.getPort(), time.time() - self.t0))
-                self._capture.write(dom2Str(data))
-                self._seqnum += 1
+                self._captureSent(data, msg.getAddr(), msg.getPort(),
+                                  self._getLocalEndpoint(self._uniOutSocket.getsockname()))
         else:
             for addr, sock in self._multiOutUniInSockets.items():
                 try:
@@ -278,44 +340,51 @@ class NetworkingThread(_StoppableDaemonThread):
                     # In either case just log as debug and ignore the error.
                     logger.debug("Interface for %s does not support multicast or is not UP.\n\tOSError %s",
                                  socket.inet_ntoa(sock.getsockopt(self._get_ip_proto(), self._get_multicast(), 4)), e)
+                else:
+                    self._metrics.datagramsSent.inc(self._interfaceLabel(addr))
                 if self._capture:
-                    self._capture.write("%i SEND %s:%s iface=%s TS=%s\n" % (
-                        self._seqnum, msg.getAddr(), msg.getPort(), addr, time.time() - self.t0))
-                    self._capture.write(dom2Str(data))
-                    self._seqnum += 1
+                    self._captureSent(data, msg.getAddr(), msg.getPort(),
+                                      self._getLocalEndpoint(sock.getsockname(), addr))
 
     def _sendPendingMessages(self):
-        """Method sleeps, if nothing to do"""
-        if len(self._queue) == 0:
-            time.sleep(0.1)
-            return
-        msg = self._queue.pop(0)
-        if msg.canSend():
+        "send all messages that are due"
+        while True:
+            with self._queueLock:
+                if not self._queue or not self._queue[0][2].canSend():
+                    self._metrics.sendQueueDepth.set(self._familyLabel, len(self._queue))
+                    return
+                _, _, msg = heapq.heappop(self._queue)
+
             self._sendMsg(msg)
             msg.refresh()
-            if not (msg.isFinished()):
-                self._queue.append(msg)
-        else:
-            self._queue.append(msg)
-            time.sleep(0.01)
+            if self._tracer:
+                self._traceSent(msg)
+            if not msg.isFinished():
+                with self._queueLock:
+                    heapq.heappush(self._queue, (msg.getNextTime(), next(self._queueSeq), msg))
 
     def start(self):
-        super(NetworkingThread, self).start()
-
+        # sockets must exist before run() starts waiting on them
         self._uniOutSocket = socket.socket(self._get_inet(), socket.SOCK_DGRAM)
 
         self._multiInSocket = self._createMulticastInSocket()
-        self._selector.register(self._multiInSocket, selectors.EVENT_WRITE | selectors.EVENT_READ)
+        self._selector.register(self._multiInSocket, selectors.EVENT_READ)
 
         self._multiOutUniInSockets = {}  # FIXME synchronisation
+        self._sourceAddrs = {}  # source address by multicast out/unicast in socket
+
+        super(NetworkingThread, self).start()
 
     def join(self, **kwargs):
         assert self._quitEvent.is_set()
         super(NetworkingThread, self).join()
 
         self._selector.unregister(self._multiInSocket)
+        self._selector.unregister(self._wakeupReader)
         self._uniOutSocket.close()
         self._multiInSocket.close()
+        self._wakeupReader.close()
+        self._wakeupWriter.close()
 
         for sock in self._multiOutUniInSockets.values():
             try:
@@ -324,58 +393,12 @@ class NetworkingThread(_StoppableDaemonThread):
                 logger.error(e)
 
 
-class NetworkingThreadIPv4(NetworkingThread):
-    def __init__(self, observer):
-        super().__init__(observer)
-
-    def _makeMreq(self, addr):
-        "IPvv multicast group join/leave request"
-        return struct.pack("4s4s", socket.inet_aton(MULTICAST_IPV4_ADDRESS), addr.packed)
-
-    def _get_inet(self):
-        return socket.AF_INET
-
-    def _get_multicast(self):
-        return socket.IP_MULTICAST_IF
-
-    def _get_ip_proto(self):
-        return socket.IPPROTO_IP
+class NetworkingThreadIPv4(IPv4Sockets, NetworkingThread):
+    pass
 
-    def _get_ip_join(self):
-        return socket.IP_ADD_MEMBERSHIP
 
-    def _get_ip_leave(self):
-        return socket.IP_DROP_MEMBERSHIP
-
-    def _get_multicast_ttl(self):
-        return socket.IP_MULTICAST_TTL
-
-
-class NetworkingThreadIPv6(NetworkingThread):
-    def __init__(self, observer):
-        super().__init__(observer)
-
-    def _makeMreq(self, addr):
-        "IPv6 multicast group join/leave request"
-        return struct.pack("=16si", socket.inet_pton(socket.AF_INET6, MULTICAST_IPV6_ADDRESS), int(addr.scope_id))
-
-    def _get_inet(self):
-        return socket.AF_INET6
-
-    def _get_multicast(self):
-        return socket.IPV6_MULTICAST_IF
-
-    def _get_ip_proto(self):
-        return socket.IPPROTO_IPV6
-
-    def _get_ip_join(self):
-        return socket.IPV6_JOIN_GROUP
-
-    def _get_ip_leave(self):
-        return socket.IPV6_LEAVE_GROUP
-
-    def _get_multicast_ttl(self):
-        return socket.IPV6_MULTICAST_HOPS
+class NetworkingThreadIPv6(IPv6Sockets, NetworkingThread):
+    pass
 
 
 class ThreadedNetworking:
@@ -384,7 +407,10 @@ class ThreadedNetworking:
     def __init__(self,
                  unicast_num=UNICAST_UDP_REPEAT,
                  multicast_num=MULTICAST_UDP_REPEAT,
-                 relates_to=False, **kwargs):
+                 relates_to=False,
+                 dedup_capacity=DEFAULT_DEDUP_CAPACITY,
+                 dedup_window=DEFAULT_DEDUP_WINDOW,
+                 parse_workers=0, **kwargs):
         self._networkingThread_v4 = None
         self._networkingThread_v6 = None
         self._addrsMonitorThread_v4 = None
@@ -393,12 +419,19 @@ class ThreadedNetworking:
         self._unicast_num = unicast_num
         self._multicast_num = multicast_num
         self._relates_to = relates_to
+        self._dedup_capacity = dedup_capacity
+        self._dedup_window = dedup_window
+        self._parse_workers = parse_workers
+        self._parsePool = None
         super().__init__(**kwargs)
 
     def _startThreads(self):
         if self._networkingThread_v4 is not None:
             return
 
+        if self._parse_workers:
+            self._parsePool = ParsePool(self._parse_workers)
+
         self._networkingThread_v4 = NetworkingThreadIPv4(self)
         self._networkingThread_v4.start()
         self._addrsMonitorThread_v4 = AddressMonitorThread(self, socket.AF_INET)
@@ -431,8 +464,13 @@ class ThreadedNetworking:
             self._addrsMonitorThread_v6.join()
             self._networkingThread_v6 = None
 
+        if self._parsePool is not None:
+            self._parsePool.shutdown()
+            self._parsePool = None
+
     def start(self):
         """start networking - should be called before using other methods"""
+        self._startCapture()
         self._startThreads()
         self._serverStarted = True
 
@@ -440,41 +478,59 @@ class ThreadedNetworking:
         """cleans up and stops networking"""
         self._stopThreads()
         self._serverStarted = False
+        self._stopCapture()
+
+    def getDedupStats(self):
+        "message deduplication cache statistics per address family"
+        stats = {}
+        if self._networkingThread_v4 is not None:
+            stats["IPv4"] = self._networkingThread_v4.getDedupStats()
+        if self._networkingThread_v6 is not None:
+            stats["IPv6"] = self._networkingThread_v6.getDedupStats()
+        return stats
+
+    def _getNetworkingThreadFor(self, host):
+        try:
+            version = ipaddress.ip_address(host).version
+        except ValueError:
+            # a host name; let the IPv4 resolver have a go at it
+            version = 4
+        if version == 6:
+            return self._networkingThread_v6
+        return self._networkingThread_v4
 
     def addSourceAddr(self, addr):
-        version = ipaddress.ip_address(addr).version
-        if version == 4:
-            self._networkingThread_v4.addSourceAddr(addr)
-        elif version == 6 and self._networkingThread_v6 is not None:
-            self._networkingThread_v6.addSourceAddr(addr)
+        thread = self._getNetworkingThreadFor(addr)
+        if thread is not None:
+            thread.addSourceAddr(addr)
 
     def removeSourceAddr(self, addr):
-        version = ipaddress.ip_address(addr).version
-        if version == 4:
-            self._networkingThread_v4.removeSourceAddr(addr)
-        elif version == 6 and self._networkingThread_v6 is not None:
-            self._networkingThread_v6.removeSourceAddr(addr)
+        thread = self._getNetworkingThreadFor(addr)
+        if thread is not None:
+            thread.removeSourceAddr(addr)
 
     def sendUnicastMessage(self, env, host, port, initialDelay=0,
-                           unicast_num=UNICAST_UDP_REPEAT):
-        "handle unicast message sending"
-        self._networkingThread_v4.addUnicastMessage(env, host, port,
-                                                    initialDelay, unicast_num)
-        if self._networkingThread_v6 is not None:
-            self._networkingThread_v6.addUnicastMessage(env, host, port,
-                                                        initialDelay, unicast_num)
+                           unicast_num=UNICAST_UDP_REPEAT, payload=None):
+        "handle unicast message sending; payload may be given if env is already serialized"
+        thread = self._getNetworkingThreadFor(host)
+        if thread is None:
+            logger.warning("no networking available for sending to %s", host)
+            return
+        thread.addUnicastMessage(env, host, port, initialDelay, unicast_num, payload)
 
     def sendMulticastMessage(self, env, initialDelay=0,
                              multicast_num=MULTICAST_UDP_REPEAT):
         "handle multicast message sending"
-        self._networkingThread_v4.addMulticastMessage(env,
-                                                      MULTICAST_IPV4_ADDRESS,
-                                                      MULTICAST_PORT,
-                                                      initialDelay,
-                                                      multicast_num)
+        msg = self._networkingThread_v4.addMulticastMessage(env,
+                                                            MULTICAST_IPV4_ADDRESS,
+                                                            MULTICAST_PORT,
+                                                            initialDelay,
+                                                            multicast_num)
         if self._networkingThread_v6 is not None:
+            # both families send the same bytes; serialize them only once
             self._networkingThread_v6.addMulticastMessage(env,
-                                                      MULTICAST_IPV6_ADDRESS,
-                                                      MULTICAST_PORT,
-                                                      initialDelay,
-                                                      multicast_num)
+                                                          MULTICAST_IPV6_ADDRESS,
+                                                          MULTICAST_PORT,
+                                                          initialDelay,
+                                                          multicast_num,
+                                                          msg.getPayload())
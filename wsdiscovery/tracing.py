@@ -0,0 +1,76 @@
+"""Hooks into the lifecycle of the messages a daemon receives & sends.
+
+Trace hooks added to a daemon with ``addTraceHook()`` are called with a
+TraceEvent at each step: a datagram received, parsed, dropped as a
+duplicate, dispatched to its handler and handled; a message enqueued for
+sending, each of its (re)transmissions and its last one. Events carry a
+monotonic timestamp and the MessageID & RelatesTo of the message, to
+correlate e.g. a Probe with its Probe Matches.
+
+Hooks run synchronously in the networking thread or event loop, so they
+should only record the event. Without hooks, tracing costs a truth test.
+"""
+
+import logging
+import threading
+import time
+from collections import namedtuple
+
+logger = logging.getLogger("tracing")
+
+#: receive path events
+TRACE_RECEIVED = "received"  # detail: datagram size
+TRACE_PARSED = "parsed"  # detail: False if the datagram could not be parsed
+TRACE_DUPLICATE = "duplicate"  # detail: "message_id" or "app_sequence"
+TRACE_DISPATCHED = "dispatched"  # detail: handler name
+TRACE_HANDLED = "handled"  # detail: handler name
+
+#: send path events
+TRACE_ENQUEUED = "enqueued"  # detail: "unicast" or "multicast"
+TRACE_SENT = "sent"  # detail: number of transmissions so far
+TRACE_FINISHED = "finished"  # detail: number of transmissions
+
+
+class TraceEvent(namedtuple("TraceEvent", "event timestamp messageId relatesTo action peer detail")):
+    """message lifecycle event
+
+    timestamp is time.monotonic_ns(); messageId, relatesTo & action are
+    those of the message, None if not (yet) known; peer is the (host, port)
+    of the sender or destination; detail depends on the event.
+    """
+
+
+class Tracer:
+    "trace hooks of a daemon"
+
+    def __init__(self):
+        self._hooks = ()
+        self._lock = threading.Lock()
+
+    def addHook(self, hook):
+        "call hook(TraceEvent) at each step of the message lifecycle"
+        with self._lock:
+            self._hooks = self._hooks + (hook,)
+
+    def removeHook(self, hook):
+        with self._lock:
+            hooks = list(self._hooks)
+            hooks.remove(hook)
+            self._hooks = tuple(hooks)
+
+    def __bool__(self):
+        return bool(self._hooks)
+
+    def emit(self, event, env=None, peer=None, detail=None, messageId=None, relatesTo=None):
+        """call the hooks with an event about the message of env, if known,
+        or else about the message with the given IDs"""
+        if env is None:
+            record = TraceEvent(event, time.monotonic_ns(), messageId, relatesTo, None, peer, detail)
+        else:
+            record = TraceEvent(event, time.monotonic_ns(), env.getMessageId(), env.getRelatesTo(),
+                                env.getAction(), peer, detail)
+        for hook in self._hooks:
+            try:
+                hook(record)
+            except Exception:
+                logger.exception("trace hook failed")
@@ -10,6 +10,8 @@ http://docs.oasis-open.org/ws-dd/soapoverudp/1.1/os/wsdd-soapoverudp-1.1-spec-os
 import random
 import time
 
+from .message import createSOAPMessage
+
 # delays are in milliseconds
 
 UNICAST_UDP_REPEAT=2
@@ -23,6 +25,31 @@ MULTICAST_UDP_MAX_DELAY=250
 MULTICAST_UDP_UPPER_DELAY=500
 
 
+class MessagePayload:
+    """wire representation of a SOAP envelope, serialized on first use and
+    shared by all UDP messages sending the same envelope"""
+
+    def __init__(self, env, data=None):
+        "data may be given if the envelope has already been serialized"
+        self._env = env
+        self._data = data
+
+    def getEnv(self):
+        return self._env
+
+    def setEnv(self, env):
+        "replace the envelope; it is serialized again when next sent"
+        self._env = env
+        self._data = None
+
+    def getData(self):
+        "serialized envelope, as UTF-8 encoded bytes"
+        data = self._data
+        if data is None:
+            data = self._data = createSOAPMessage(self._env).encode("UTF-8")
+        return data
+
+
 class UDPMessage:
     "UDP message management implementation"
 
@@ -31,9 +58,11 @@ class UDPMessage:
 
     def __init__(self, env, addr, port, msgType, initialDelay=0,
                  unicast_num=UNICAST_UDP_REPEAT,
-                 multicast_num=MULTICAST_UDP_REPEAT):
-        """msgType shall be UDPMessage.UNICAST or UDPMessage.MULTICAST"""
-        self._env = env
+                 multicast_num=MULTICAST_UDP_REPEAT,
+                 payload=None):
+        """msgType shall be UDPMessage.UNICAST or UDPMessage.MULTICAST;
+        payload may be given to share it with another message of the same envelope"""
+        self._payload = payload if payload is not None else MessagePayload(env)
         self._addr = addr
         self._port = port
         self._msgType = msgType
@@ -52,12 +81,23 @@ class UDPMessage:
                     MULTICAST_UDP_UPPER_DELAY
 
         self._udpRepeat = udpRepeat
+        self._sendCount = 0
         self._udpUpperDelay = udpUpperDelay
         self._t = (udpMinDelay + ((udpMaxDelay - udpMinDelay) * random.random())) / 2
-        self._nextTime = int(time.time() * 1000) + initialDelay
+        self._nextTime = int(time.monotonic() * 1000) + initialDelay
 
     def getEnv(self):
-        return self._env
+        return self._payload.getEnv()
+
+    def setEnv(self, env):
+        self._payload.setEnv(env)
+
+    def getPayload(self):
+        return self._payload
+
+    def getData(self):
+        "wire representation of the envelope"
+        return self._payload.getData()
 
     def getAddr(self):
         return self._addr
@@ -68,16 +108,25 @@ class UDPMessage:
     def msgType(self):
         return self._msgType
 
+    def getNextTime(self):
+        "time of the next (re)transmission, in milliseconds of time.monotonic()"
+        return self._nextTime
+
     def isFinished(self):
         return self._udpRepeat <= 0
 
+    def getSendCount(self):
+        "number of times the message has been sent"
+        return self._sendCount
+
     def canSend(self):
-        ct = int(time.time() * 1000)
+        ct = int(time.monotonic() * 1000)
         return self._nextTime < ct
 
     def refresh(self):
         self._t = self._t * 2
         if self._t > self._udpUpperDelay:
             self._t = self._udpUpperDelay
-        self._nextTime = int(time.time() * 1000) + self._t
+        self._nextTime = int(time.monotonic() * 1000) + self._t
         self._udpRepeat = self._udpRepeat - 1
+        self._sendCount += 1
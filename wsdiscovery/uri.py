@@ -6,6 +6,8 @@ from urllib.parse import unquote
 class URI:
     "URI implementation with additional functionality useful for service scope matching"
 
+    __slots__ = ("_scheme", "_authority", "_path")
+
     def __init__(self, uri):
         uri = unquote(uri)
         i1 = uri.find(":")
@@ -35,3 +37,11 @@ class URI:
         else:
             return path
 
+    def __eq__(self, other):
+        if not isinstance(other, URI):
+            return NotImplemented
+        return (self._scheme, self._authority, self._path) == (other._scheme, other._authority, other._path)
+
+    def __hash__(self):
+        return hash((self._scheme, self._authority, self._path))
+
@@ -1,22 +1,39 @@
 """Various utilities used by different parts of the package."""
 
+import functools
 import io
-import string
 import random
 import logging
 import ipaddress
 import socket
+import string
+import threading
+import time
+import warnings
 from xml.dom import minidom
 import ifaddr
 
-from .scope import Scope
-from .uri import URI
+from .scope import Scope, internScope, MATCH_BY_LDAP, MATCH_BY_URI, MATCH_BY_UUID, MATCH_BY_STRCMP
+from .scopematch import ScopeMatcher
 from .namespaces import NS_ADDRESSING, NS_DISCOVERY, NS_SOAPENV
-from .qname import QName
+from .qname import QName, internQName
 
 logger = logging.getLogger("util")
 
 
+def _deprecated(function):
+    "mark a function kept for compatibility only"
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        warnings.warn("%s is deprecated: messages are rendered from templates, see "
+                      "wsdiscovery.serializer" % function.__name__, DeprecationWarning, stacklevel=2)
+        return function(*args, **kwargs)
+    return wrapper
+
+
+# minidom helpers of the former message serialization, kept for compatibility
+
+@_deprecated
 def createSkelSoapMessage(soapAction):
     doc = minidom.Document()
 
@@ -31,7 +48,7 @@ def createSkelSoapMessage(soapAction):
     headerEl = doc.createElementNS(NS_SOAPENV, "s:Header")
     envEl.appendChild(headerEl)
 
-    addElementWithText(doc, headerEl, "a:Action", NS_ADDRESSING, soapAction)
+    addElementWithText.__wrapped__(doc, headerEl, "a:Action", NS_ADDRESSING, soapAction)
 
     bodyEl = doc.createElementNS(NS_SOAPENV, "s:Body")
     envEl.appendChild(bodyEl)
@@ -39,6 +56,7 @@ def createSkelSoapMessage(soapAction):
     return doc
 
 
+@_deprecated
 def addElementWithText(doc, parent, name, ns, value):
     el = doc.createElementNS(ns, name)
     text = doc.createTextNode(value)
@@ -46,22 +64,26 @@ def addElementWithText(doc, parent, name, ns, value):
     parent.appendChild(el)
 
 
+@_deprecated
 def addEPR(doc, node, epr):
     eprEl = doc.createElementNS(NS_ADDRESSING, "a:EndpointReference")
-    addElementWithText(doc, eprEl, "a:Address", NS_ADDRESSING, epr)
+    addElementWithText.__wrapped__(doc, eprEl, "a:Address", NS_ADDRESSING, epr)
     node.appendChild(eprEl)
 
 
+@_deprecated
 def addScopes(doc, node, scopes):
     if scopes is not None and len(scopes) > 0:
-        addElementWithText(doc, node, "d:Scopes", NS_DISCOVERY, " ".join([x.getQuotedValue() for x in scopes]))
+        addElementWithText.__wrapped__(doc, node, "d:Scopes", NS_DISCOVERY,
+                                       " ".join([x.getQuotedValue() for x in scopes]))
         if scopes[0].getMatchBy() is not None and len(scopes[0].getMatchBy()) > 0:
             node.getElementsByTagNameNS(NS_DISCOVERY, "Scopes")[0].setAttribute("MatchBy", scopes[0].getMatchBy())
 
 
+@_deprecated
 def addTypes(doc, node, types):
     if types is not None and len(types) > 0:
-        envEl = getEnvEl(doc)
+        envEl = getEnvEl.__wrapped__(doc)
         typeList = []
         prefixMap = {}
         for type in types:
@@ -69,60 +91,83 @@ def addTypes(doc, node, types):
             localname = type.getLocalname()
             if type.getNamespacePrefix() is None:
                 if prefixMap.get(ns) == None:
-                    prefix = getRandomStr()
+                    prefix = getRandomStr.__wrapped__()
                     prefixMap[ns] = prefix
                 else:
                     prefix = prefixMap.get(ns)
             else:
                 prefix = type.getNamespacePrefix()
-            addNSAttrToEl(envEl, ns, prefix)
+            addNSAttrToEl.__wrapped__(envEl, ns, prefix)
             typeList.append(prefix + ":" + localname)
-        addElementWithText(doc, node, "d:Types", NS_DISCOVERY, " ".join(typeList))
+        addElementWithText.__wrapped__(doc, node, "d:Types", NS_DISCOVERY, " ".join(typeList))
 
 
+@_deprecated
 def addXAddrs(doc, node, xAddrs):
-    if xAddrs is not len(xAddrs) > 0:
-        addElementWithText(doc, node, "d:XAddrs", NS_DISCOVERY, " ".join([x for x in xAddrs]))
+    if xAddrs is not None and len(xAddrs) > 0:
+        addElementWithText.__wrapped__(doc, node, "d:XAddrs", NS_DISCOVERY, " ".join([x for x in xAddrs]))
 
 
+@_deprecated
 def getDocAsString(doc):
-    outStr = None
-    stream = io.StringIO(outStr)
+    stream = io.StringIO()
     stream.write(doc.toprettyxml())
     return stream.getvalue()
 
 
+@_deprecated
 def getBodyEl(doc):
     return doc.getElementsByTagNameNS(NS_SOAPENV, "Body")[0]
 
 
+@_deprecated
 def getHeaderEl(doc):
     return doc.getElementsByTagNameNS(NS_SOAPENV, "Header")[0]
 
 
+@_deprecated
 def getEnvEl(doc):
     return doc.getElementsByTagNameNS(NS_SOAPENV, "Envelope")[0]
 
 
+@_deprecated
 def addNSAttrToEl(el, ns, prefix):
     el.setAttribute("xmlns:" + prefix, ns)
 
 
-def _parseAppSequence(dom, env):
-    nodes = dom.getElementsByTagNameNS(NS_DISCOVERY, "AppSequence")
-    if nodes:
-        appSeqNode = nodes[0]
-        env.setInstanceId(appSeqNode.getAttribute("InstanceId"))
-        env.setSequenceId(appSeqNode.getAttribute("SequenceId"))
-        env.setMessageNumber(appSeqNode.getAttribute("MessageNumber"))
+@_deprecated
+def getRandomStr():
+    return "".join([random.choice(string.ascii_letters) for x in range(10)])
+
+
+def _parseAppSequence(headerEl, env):
+    appSeqEl = headerEl.find(NS_DISCOVERY, "AppSequence")
+    if appSeqEl is not None:
+        env.setInstanceId(appSeqEl.getAttribute("InstanceId"))
+        env.setSequenceId(appSeqEl.getAttribute("SequenceId"))
+        env.setMessageNumber(appSeqEl.getAttribute("MessageNumber"))
 
 
 def _parseSpaceSeparatedList(node):
-    if node.childNodes:
-        return [item.replace('%20', ' ') \
-            for item in node.childNodes[0].data.split()]
-    else:
-        return []
+    return [item.replace('%20', ' ') for item in node.getText().split()]
+
+
+def _parseEPR(node):
+    "address of the endpoint reference contained in node"
+    return node.find(NS_ADDRESSING, "EndpointReference").findText(NS_ADDRESSING, "Address")
+
+
+def _getHeaderAndBody(dom):
+    "header & body elements of a parsed SOAP envelope"
+    return dom.find(NS_SOAPENV, "Header"), dom.find(NS_SOAPENV, "Body")
+
+
+def _getBodyChild(bodyEl, localname):
+    "the WS-Discovery element of the given name in a message body; raise ValueError if missing"
+    child = bodyEl.find(NS_DISCOVERY, localname) if bodyEl is not None else None
+    if child is None:
+        raise ValueError("missing %s element in Body" % localname)
+    return child
 
 
 def extractSoapUdpAddressFromURI(uri):
@@ -148,41 +193,13 @@ def getTypes(typeNode):
 
 def getScopes(scopeNode):
     matchBy = scopeNode.getAttribute("MatchBy")
-    return [Scope(item, matchBy) \
+    return [internScope(item, matchBy) \
                 for item in _parseSpaceSeparatedList(scopeNode)]
 
 
 def matchScope(src, target, matchBy):
-
-    MATCH_BY_LDAP = "http://schemas.xmlsoap.org/ws/2005/04/discovery/ldap"
-    MATCH_BY_URI = "http://schemas.xmlsoap.org/ws/2005/04/discovery/rfc2396"
-    MATCH_BY_UUID = "http://schemas.xmlsoap.org/ws/2005/04/discovery/uuid"
-    MATCH_BY_STRCMP = "http://schemas.xmlsoap.org/ws/2005/04/discovery/strcmp0"
-
-    if matchBy == "" or matchBy == None or matchBy == MATCH_BY_LDAP or matchBy == MATCH_BY_URI or matchBy == MATCH_BY_UUID:
-        src = URI(src)
-        target = URI(target)
-        if src.getScheme().lower() != target.getScheme().lower():
-            return False
-        if src.getAuthority().lower() != target.getAuthority().lower():
-            return False
-        srcPath = src.getPathExQueryFragment()
-        targetPath = target.getPathExQueryFragment()
-        if srcPath == targetPath:
-            return True
-        elif targetPath.startswith(srcPath):
-            n = len(srcPath)
-            if targetPath[n - 1] == srcPath[n - 1] == '/':
-                return True
-            if targetPath[n] == '/':
-                return True
-            return False
-        else:
-            return False
-    elif matchBy == MATCH_BY_STRCMP:
-        return src == target
-    else:
-        return False
+    "tell whether the probe scope value src matches the service scope value target"
+    return ScopeMatcher(Scope(src, matchBy)).matches(Scope(target))
 
 
 def isTypeInList(ttype, types):
@@ -193,46 +210,35 @@ def isTypeInList(ttype, types):
 
 
 def isScopeInList(scope, scopes):
-    for entry in scopes:
-        if matchScope(scope.getValue(), entry.getValue(), scope.getMatchBy()):
-            return True
-    return False
+    return ScopeMatcher(scope).matchesAny(scopes)
 
 
-def matchesFilter(service, types, scopes):
+def _matchesCompiledFilter(service, types, scopeMatchers):
     if types is not None:
         for ttype in types:
             if not isTypeInList(ttype, service.getTypes()):
                 return False
-    if scopes is not None:
-        for scope in scopes:
-            if not isScopeInList(scope, service.getScopes()):
-                return False
+    for matcher in scopeMatchers:
+        if not matcher.matchesAny(service.getScopes()):
+            return False
     return True
 
 
+def matchesFilter(service, types, scopes):
+    return _matchesCompiledFilter(service, types, [ScopeMatcher(scope) for scope in scopes or []])
+
+
 def filterServices(services, types, scopes):
-    return [service for service in services if matchesFilter(service, types, scopes)]
+    scopeMatchers = [ScopeMatcher(scope) for scope in scopes or []]
+    return [service for service in services if _matchesCompiledFilter(service, types, scopeMatchers)]
 
 
 def getNamespaceValue(node, prefix):
-    while node != None:
-        if node.nodeType == minidom.Node.ELEMENT_NODE:
-            attr = node.getAttributeNode("xmlns:" + prefix)
-            if attr != None:
-                return attr.nodeValue
-        node = node.parentNode
-    return ""
+    return node.lookupNamespace(prefix)
 
 
 def getDefaultNamespace(node):
-    while node != None:
-        if node.nodeType == minidom.Node.ELEMENT_NODE:
-            attr = node.getAttributeNode("xmlns")
-            if attr != None:
-                return attr.nodeValue
-        node = node.parentNode
-    return ""
+    return node.lookupNamespace(None)
 
 
 def getQNameFromValue(value, node):
@@ -246,7 +252,7 @@ def getQNameFromValue(value, node):
         localName = vals[1]
         prefix = vals[0]
         ns = getNamespaceValue(node, prefix)
-    return QName(ns, localName, prefix)
+    return internQName(ns, localName, prefix)
 
 
 def _getNetworkAddrs(protocol_version):
@@ -275,12 +281,92 @@ def _getNetworkAddrs(protocol_version):
     return addrs
 
 
-def _generateInstanceId():
-    return str(random.randint(1, 0xFFFFFFFF))
+#: seconds for which the addresses of a family without a running monitor are kept
+UNMONITORED_ADDRESSES_MAX_AGE = 5
+
+
+class LocalAddresses:
+    """snapshot of the local network addresses of each address family
+
+    Address monitors keep the snapshot of their family up to date while they
+    run; addresses of families without a running monitor, e.g. IPv6 on hosts
+    without it or any family in replay daemons, are enumerated again once
+    their snapshot is UNMONITORED_ADDRESSES_MAX_AGE seconds old. The
+    generation changes whenever a snapshot does, so that values derived from
+    the addresses can be cached until then.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._addrs = {}
+        self._monitors = {}
+        self._enumerated = {}  # family: time.monotonic() of the snapshot of an unmonitored family
+        self._generation = 0
+
+    def startMonitoring(self, family, addrs):
+        "register a running monitor of the family & its initial addresses"
+        with self._lock:
+            self._monitors[family] = self._monitors.get(family, 0) + 1
+            self._addrs[family] = tuple(sorted(addrs))
+            self._enumerated.pop(family, None)
+            self._generation += 1
+
+    def update(self, family, addrs):
+        "new addresses reported by a monitor of the family"
+        addrs = tuple(sorted(addrs))
+        with self._lock:
+            if self._monitors.get(family) and self._addrs.get(family) != addrs:
+                self._addrs[family] = addrs
+                self._generation += 1
+
+    def stopMonitoring(self, family):
+        with self._lock:
+            count = self._monitors.get(family, 0) - 1
+            if count > 0:
+                self._monitors[family] = count
+            else:
+                self._monitors.pop(family, None)
+                self._addrs.pop(family, None)
+                self._generation += 1
+
+    def _getSnapshot(self, family):
+        "addresses of the family, enumerated if not monitored and not recently"
+        now = time.monotonic()
+        with self._lock:
+            addrs = self._addrs.get(family)
+            enumerated = self._enumerated.get(family)
+            if family in self._monitors or (
+                    enumerated is not None and now - enumerated < UNMONITORED_ADDRESSES_MAX_AGE):
+                return addrs
+
+        addrs = tuple(sorted(_getNetworkAddrs(family)))
+        with self._lock:
+            if family in self._monitors:  # started meanwhile
+                return self._addrs[family]
+            self._enumerated[family] = now
+            if self._addrs.get(family) != addrs:
+                self._addrs[family] = addrs
+                self._generation += 1
+            return addrs
+
+    def getAddrs(self, family):
+        "local addresses of the family, from its snapshot"
+        return list(self._getSnapshot(family))
+
+    def getGeneration(self, families=(socket.AF_INET, socket.AF_INET6)):
+        "generation of the snapshots of the families, changing whenever their addresses do"
+        for family in families:
+            self._getSnapshot(family)
+        with self._lock:
+            return self._generation
+
+
+#: local addresses shared by all the services & daemons of the process
+localAddresses = LocalAddresses()
 
 
-def getRandomStr():
-    return "".join([random.choice(string.ascii_letters) for x in range(10)])
+def _generateInstanceId():
+    return str(random.randint(1, 0xFFFFFFFF))
 
 
 def showEnv(env):